@@ -0,0 +1,353 @@
+#!/usr/bin/python3
+
+#
+# cycle_benchmark.py
+#
+# Regression benchmark of the per-cycle work of the gateway: GraphQL payload building,
+# parsing of the carTelematicsV2 response, publish_json_as_mqtt and a full
+# main(run_once=True) cycle, all offline against in-process stubs (no sockets).
+# Reports CPU time and tracemalloc peak/retained memory per case; --save stores the
+# results as baseline, --compare fails (exit code 1) if a case got slower or allocates
+# more than the tolerance allows.
+#
+# usage: python benchmarks/cycle_benchmark.py [--vins 100] [--repeat 5] [--number 5]
+#            [--save benchmarks/baseline.json] [--compare benchmarks/baseline.json]
+#
+# CPU times are stored relative to a fixed calibration workload, so a baseline recorded
+# on a developer machine can be compared on a (slower or faster) CI runner.
+#
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SRC_DIR = BENCHMARKS_DIR.parent / "src"
+for path in (SRC_DIR, BENCHMARKS_DIR):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from mock_polestar_api import API_PATH, MockPolestarApi, SyntheticFleet, synthetic_vins  # noqa: E402
+
+DEFAULT_BASELINE = BENCHMARKS_DIR / "baseline.json"
+CYCLE_SECONDS = 60  # simulated time between two cycles of the synthetic fleet
+MIN_MEMORY_DELTA_KIB = 16  # ignore memory differences below this (allocator noise)
+PUBLISHED = SimpleNamespace(rc=0)  # MQTTMessageInfo of a successful publish
+
+#####################################
+# stubs for broker, API and token refresh
+
+
+class StubMqttClient:
+    def __init__(self):
+        self.messages = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.messages += 1
+        return PUBLISHED
+
+    def disconnect(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+
+class StubResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.text = body.decode("utf-8")
+        self._body = body
+
+    def json(self):
+        return json.loads(self._body)
+
+
+class StubHttpPool:
+    # HttpSessionPool stand-in; responder(request bytes) returns (status, body bytes)
+    def __init__(self, responder):
+        self.responder = responder
+        self.requests = 0
+        self.retried = 0
+
+    def post(self, url, headers=None, json=None, **kwargs):
+        self.requests += 1
+        status, body = self.responder(json_dumps(json))
+        return StubResponse(status, body)
+
+    def stats(self):
+        return {"requests": self.requests, "connections": 1, "reused": self.requests - 1,
+                "retried": 0}
+
+    def close(self):
+        pass
+
+
+class StubTokenRefresher:
+    refresh_count = 0
+
+    def __init__(self):
+        self.tokens = ("bench-token", None, "bench-refresh")
+
+    def set_tokens(self, *tokens):
+        self.tokens = tokens
+
+    def get_token(self):
+        return self.tokens
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class FakeClock:
+    def __init__(self, start=1_760_000_000):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+def json_dumps(obj):
+    # request body encoding as done by requests for json=
+    return json.dumps(obj).encode("utf-8")
+
+
+def mock_api_responder(api):
+    def respond(body):
+        status, _, payload = api.handle("POST", API_PATH, body)
+        return status, payload
+    return respond
+
+#####################################
+# gateway setup
+
+
+def load_gateway(vins, work_dir):
+    # configuration is read when the gateway module is imported
+    os.environ.update({
+        "POLESTAR_EMAIL": "bench@example.invalid",
+        "POLESTAR_PASSWORD": "bench",
+        "POLESTAR_VIN": "",
+        "POLESTAR_VINS": ",".join(vins),
+        "MQTT_BASE_TOPIC": "bench",
+        "TOKEN_STORE_KEY": "",
+        "CAR_DATA_CACHE_PATH": str(Path(work_dir) / "car_data_cache.json"),
+        "HISTORY_RETENTION_DAYS": "0",
+        "METRICS_PORT": "0",
+        "API_RATE_LIMIT": "0",
+        "GATEWAY_RUNTIME": "sync",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+    os.environ.pop("OPENWB_PUBLISH", None)
+
+    import Polestar_2_MQTT as app
+    from car_data_cache import CarDataCache
+    from mqtt_supervisor import MqttSupervisor
+
+    stub_client = StubMqttClient()
+    supervisor = MqttSupervisor("bench", stub_client)
+    supervisor.on_connect()
+    app.client = stub_client
+    app.mqtt_supervisors = {stub_client: supervisor}
+    app.mqtt_connect = lambda: None
+    app.token_refresher = StubTokenRefresher()
+    app.car_data_cache = CarDataCache(None, 86400)
+    return app
+
+#####################################
+# benchmark cases
+
+
+def build_cases(app, vins):
+    from derived import DerivedMetrics
+    from topic_cache import TopicValueCache
+
+    clock = FakeClock()
+    api = MockPolestarApi(vins)
+    api.fleet = SyntheticFleet(vins, clock=clock)
+    document = api.fleet.telematics(vins)
+    response_body = json.dumps({"data": {"carTelematicsV2": document}}).encode("utf-8")
+    base_topic = f"{app.MQTT_BASE_TOPIC}/CarTelematicsV2"
+    app.precompile_topic_paths(app.MQTT_BASE_TOPIC)
+
+    def graphql_payloads():
+        json_dumps(app.build_getconsumercarsv2_payload())
+        json_dumps(app.build_cartelematicsv2_payload(vins))
+
+    def parse_telemetry():
+        app.split_telemetry_by_vin(app.get_car_telemetry_data(vins, "bench-token"), vins)
+
+    def publish_changed():
+        app.topic_cache = TopicValueCache()
+        app.publish_json_as_mqtt(base_topic, document)
+
+    def publish_unchanged():
+        app.publish_json_as_mqtt(base_topic, document)
+
+    def cycle_runonce():
+        clock.now += CYCLE_SECONDS
+        app.main(run_once=True)
+
+    def with_http(responder, func):
+        def run():
+            app.http_pool = StubHttpPool(responder)
+            func()
+        return run
+
+    def prepare_cycle():
+        app.topic_cache = TopicValueCache()
+        app.derived_metrics = DerivedMetrics(app.BATTERY_CAPACITY_KWH)
+
+    fixed_response = lambda body: (200, response_body)  # noqa: E731
+    return [
+        ("graphql_payloads", None, graphql_payloads),
+        ("parse_telemetry", None, with_http(fixed_response, parse_telemetry)),
+        ("publish_changed", None, publish_changed),
+        ("publish_unchanged", None, publish_unchanged),
+        ("cycle_runonce", prepare_cycle, with_http(mock_api_responder(api), cycle_runonce)),
+    ]
+
+#####################################
+# measurements
+
+
+def calibration():
+    # fixed pure-Python workload, the unit of the relative CPU times
+    document = {f"key{idx}": [idx, str(idx), {"value": idx / 3}] for idx in range(200)}
+    for _ in range(20):
+        json.loads(json.dumps(document))
+        sorted(document.items(), key=lambda item: item[1][1])
+
+
+def cpu_seconds(func, repeat, number):
+    timer = timeit.Timer(func, timer=time.process_time)
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def memory_kib(func):
+    # peak and retained memory of one (warm) run
+    tracemalloc.start()
+    func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024, current / 1024
+
+
+def run_benchmarks(cases, repeat, number):
+    unit = cpu_seconds(calibration, repeat, number)
+    results = {}
+    for name, prepare, func in cases:
+        if prepare is not None:
+            prepare()
+        func()  # warm-up: imports, precompiled topic paths, first-cycle caches
+        cpu = cpu_seconds(func, repeat, number)
+        peak, retained = memory_kib(func)
+        results[name] = {
+            "cpu_ms": round(cpu * 1000, 4),
+            "relative_cpu": round(cpu / unit, 5),
+            "peak_kib": round(peak, 1),
+            "retained_kib": round(retained, 1),
+        }
+        print(
+            f"  {name:<20} {cpu * 1000:9.3f} ms cpu ({cpu / unit:8.4f} units)   "
+            f"peak {peak:9.1f} KiB   retained {retained:8.1f} KiB",
+            file=sys.stderr,
+        )
+    return {"calibration_ms": round(unit * 1000, 4), "cases": results}
+
+
+def compare(results, baseline, cpu_tolerance, memory_tolerance):
+    # list of regressions of results against baseline (empty = passed)
+    regressions = []
+    for name, expected in baseline["cases"].items():
+        measured = results["cases"].get(name)
+        if measured is None:
+            regressions.append(f"{name}: missing in this run")
+            continue
+        cpu_limit = expected["relative_cpu"] * (1 + cpu_tolerance)
+        if measured["relative_cpu"] > cpu_limit:
+            regressions.append(
+                f"{name}: CPU {measured['relative_cpu']:.2f} units > {cpu_limit:.2f} "
+                f"(baseline {expected['relative_cpu']:.2f})"
+            )
+        for key in ("peak_kib", "retained_kib"):
+            limit = max(
+                expected[key] * (1 + memory_tolerance), expected[key] + MIN_MEMORY_DELTA_KIB
+            )
+            if measured[key] > limit:
+                regressions.append(
+                    f"{name}: {key} {measured[key]:.1f} > {limit:.1f} "
+                    f"(baseline {expected[key]:.1f})"
+                )
+    return regressions
+
+#####################################
+# MAIN
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Per-cycle CPU and memory benchmark")
+    parser.add_argument("--vins", type=int, default=100, help="synthetic cars (fleet mode)")
+    parser.add_argument("--repeat", type=int, default=5, help="timeit repeat count")
+    parser.add_argument("--number", type=int, default=5, help="runs per repeat")
+    parser.add_argument("--save", metavar="PATH", help="store the results as baseline")
+    parser.add_argument(
+        "--compare", metavar="PATH", nargs="?", const=str(DEFAULT_BASELINE),
+        help=f"fail on regressions against a baseline (default {DEFAULT_BASELINE.name})",
+    )
+    parser.add_argument(
+        "--cpu-tolerance", type=float, default=0.5, help="allowed relative CPU increase"
+    )
+    parser.add_argument(
+        "--memory-tolerance", type=float, default=0.2, help="allowed relative memory increase"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        args.vins = baseline["vins"]  # only the same fleet size is comparable
+
+    vins = synthetic_vins(args.vins)
+    app = load_gateway(vins, tempfile.mkdtemp(prefix="polestar-bench-"))
+    print(f"{args.vins} VINs, {args.repeat}x{args.number} runs per case", file=sys.stderr)
+    results = run_benchmarks(build_cases(app, vins), args.repeat, args.number)
+    results["vins"] = args.vins
+    results["python"] = sys.version.split()[0]
+    print(json.dumps(results, indent=2))
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if baseline is None:
+        return 0
+
+    baseline_python = str(baseline.get("python", ""))
+    if baseline_python.rsplit(".", 1)[0] != results["python"].rsplit(".", 1)[0]:
+        print(
+            f"warning: baseline recorded on Python {baseline_python or '?'}, "
+            f"running on {results['python']}",
+            file=sys.stderr,
+        )
+    regressions = compare(results, baseline, args.cpu_tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    if not regressions:
+        print(f"no regressions against {args.compare}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
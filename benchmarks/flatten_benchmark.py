@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+
+#
+# flatten_benchmark.py
+#
+# Microbenchmark: recursive json.dumps flattening (former publish_json_as_mqtt)
+# versus the iterative engine in src/flatten.py on synthetic telematics documents.
+#
+# usage: python benchmarks/flatten_benchmark.py [--vins 500] [--repeat 5]
+#
+
+import argparse
+import json
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from flatten import TopicPathCache, iter_mqtt_leaves, query_field_paths  # noqa: E402
+from graphql_queries import CAR_TELEMATICS_V2_QUERY  # noqa: E402
+
+BASE_TOPIC = "polestar2/CarTelematicsV2"
+
+#####################################
+# synthetic data
+
+
+def build_telematics_document(vins):
+    # carTelematicsV2 response for a fleet: one entry per VIN in every section
+    timestamp = {"seconds": 1760000000, "nanos": 123000000}
+    return {
+        "health": [
+            {
+                "vin": vin,
+                "brakeFluidLevelWarning": "BRAKE_FLUID_LEVEL_WARNING_NO_WARNING",
+                "daysToService": 300 + idx % 60,
+                "distanceToServiceKm": 25000.5 - idx,
+                "engineCoolantLevelWarning": "ENGINE_COOLANT_LEVEL_WARNING_NO_WARNING",
+                "oilLevelWarning": "OIL_LEVEL_WARNING_NO_WARNING",
+                "serviceWarning": "SERVICE_WARNING_NO_WARNING",
+                "timestamp": dict(timestamp),
+            }
+            for idx, vin in enumerate(vins)
+        ],
+        "battery": [
+            {
+                "vin": vin,
+                "batteryChargeLevelPercentage": idx % 100,
+                "chargingStatusV2": "CHARGING_STATUS_IDLE",
+                "estimatedChargingTimeToFullMinutes": 0,
+                "estimatedDistanceToEmptyKm": 250 + idx % 150,
+                "timestamp": dict(timestamp),
+            }
+            for idx, vin in enumerate(vins)
+        ],
+        "odometer": [
+            {"vin": vin, "odometerMeters": 1000000 + idx, "timestamp": dict(timestamp)}
+            for idx, vin in enumerate(vins)
+        ],
+    }
+
+#####################################
+# implementations under test
+
+
+def recursive_flatten(topic, json_obj, out):
+    # former publish_json_as_mqtt() without the MQTT client call
+    if isinstance(json_obj, dict):
+        for key, value in json_obj.items():
+            recursive_flatten(f"{topic}/{key}", value, out)
+    elif isinstance(json_obj, list):
+        for idx, item in enumerate(json_obj):
+            recursive_flatten(f"{topic}/{idx}", item, out)
+    else:
+        json_payload = json_obj if isinstance(json_obj, str) else json.dumps(json_obj)
+        out.append((topic, json_payload))
+    return out
+
+
+def iterative_flatten(document, topic_paths):
+    return list(iter_mqtt_leaves(BASE_TOPIC, document, topic_paths))
+
+
+def measure(label, func, repeat, number):
+    best = min(timeit.repeat(func, repeat=repeat, number=number)) / number
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<28} {best * 1000:9.3f} ms/run   peak {peak / 1024:9.1f} KiB")
+    return best
+
+#####################################
+# MAIN
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark MQTT flattening engines")
+    parser.add_argument("--vins", type=int, default=500, help="number of synthetic cars")
+    parser.add_argument("--repeat", type=int, default=5, help="timeit repeat count")
+    parser.add_argument("--number", type=int, default=10, help="runs per repeat")
+    args = parser.parse_args(argv)
+
+    vins = [f"VIN{idx:014d}" for idx in range(args.vins)]
+    document = build_telematics_document(vins)
+    topic_paths = TopicPathCache()
+    # same paths as precompile_topic_paths in the gateway: list index 0 of every section
+    topic_paths.precompile(
+        BASE_TOPIC,
+        [(path[0], 0) + path[1:] for path in query_field_paths(CAR_TELEMATICS_V2_QUERY)],
+    )
+
+    leaves = len(recursive_flatten(BASE_TOPIC, document, []))
+    print(f"{args.vins} VINs, {leaves} leaves per document")
+
+    recursive = measure(
+        "recursive + json.dumps",
+        lambda: recursive_flatten(BASE_TOPIC, document, []),
+        args.repeat,
+        args.number,
+    )
+    measure("iterative (no path cache)", lambda: iterative_flatten(document, None),
+            args.repeat, args.number)
+    iterative = measure(
+        "iterative + path cache",
+        lambda: iterative_flatten(document, topic_paths),
+        args.repeat,
+        args.number,
+    )
+    print(f"  speedup: {recursive / iterative:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
+
+# ***** EOF *****
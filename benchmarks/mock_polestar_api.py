@@ -0,0 +1,289 @@
+#!/usr/bin/python3
+
+#
+# mock_polestar_api.py
+#
+# Local stand-in for Polestar ID (PKCE login, token endpoint) and the mystar-v2 GraphQL
+# endpoint, serving getConsumerCarsV2/carTelematicsV2 for N synthetic VINs with
+# configurable latency and error rate. Used by soak_harness.py, or standalone:
+#
+# usage: python benchmarks/mock_polestar_api.py [--vins 500] [--port 8080] [--latency 0.2]
+#
+
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ID_PREFIX = "/as"
+API_PATH = "/eu-north-1/mystar-v2"
+PATH_TOKEN = "mockpath"
+CHARGING = "CHARGING_STATUS_CHARGING"
+IDLE = "CHARGING_STATUS_IDLE"
+
+#####################################
+# synthetic fleet
+
+
+def synthetic_vins(count):
+    return [f"YSMOCK{index:011d}" for index in range(count)]
+
+
+class SyntheticFleet:
+    # Every car alternates between driving, parking and charging; a sleeping car keeps
+    # its vehicle timestamps, so delta publishing and adaptive polling see realistic data.
+
+    def __init__(self, vins, sleep_ratio=0.5, seed=1, clock=time.time):
+        self.vins = vins
+        self.clock = clock
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        start = int(clock())
+        self._cars = {
+            vin: {
+                "soc": self._random.randint(20, 90),
+                "odometer": self._random.randint(1_000_000, 90_000_000),
+                "charging": self._random.random() < 0.3,
+                "asleep": self._random.random() < sleep_ratio,
+                "timestamp": start,
+            }
+            for vin in vins
+        }
+
+    def consumer_cars(self):
+        return [
+            {
+                "vin": vin,
+                "internalVehicleIdentifier": f"mock-{index}",
+                "registrationNo": f"PS-{index:05d}",
+                "market": "de",
+                "modelName": "Polestar 2",
+                "modelYear": "2024",
+                "edition": "Long range Dual motor",
+            }
+            for index, vin in enumerate(self.vins)
+        ]
+
+    def _advance(self, car, now):
+        if car["asleep"] or now - car["timestamp"] < 1:
+            return
+        elapsed = now - car["timestamp"]
+        if car["charging"]:
+            car["soc"] = min(car["soc"] + elapsed / 60, 100)
+            car["charging"] = car["soc"] < 100
+        else:
+            car["soc"] = max(car["soc"] - elapsed / 120, 5)
+            car["odometer"] += int(elapsed * 20)
+            car["charging"] = car["soc"] <= 10
+        car["timestamp"] = now
+
+    def telematics(self, vins):
+        now = int(self.clock())
+        health, battery, odometer = [], [], []
+        with self._lock:
+            for vin in vins:
+                car = self._cars.get(vin)
+                if car is None:
+                    continue
+                self._advance(car, now)
+                timestamp = {"seconds": car["timestamp"], "nanos": 0}
+                health.append({
+                    "vin": vin,
+                    "brakeFluidLevelWarning": "BRAKE_FLUID_LEVEL_WARNING_NO_WARNING",
+                    "daysToService": 300,
+                    "distanceToServiceKm": 20000,
+                    "engineCoolantLevelWarning": "ENGINE_COOLANT_LEVEL_WARNING_NO_WARNING",
+                    "oilLevelWarning": "OIL_LEVEL_WARNING_NO_WARNING",
+                    "serviceWarning": "SERVICE_WARNING_NO_WARNING",
+                    "timestamp": timestamp,
+                })
+                battery.append({
+                    "vin": vin,
+                    "batteryChargeLevelPercentage": int(car["soc"]),
+                    "chargingStatusV2": CHARGING if car["charging"] else IDLE,
+                    "estimatedChargingTimeToFullMinutes": (
+                        int((100 - car["soc"]) * 1.2) if car["charging"] else 0
+                    ),
+                    "estimatedDistanceToEmptyKm": int(car["soc"] * 4.5),
+                    "timestamp": timestamp,
+                })
+                odometer.append({
+                    "vin": vin, "odometerMeters": car["odometer"], "timestamp": timestamp,
+                })
+        return {"health": health, "battery": battery, "odometer": odometer}
+
+#####################################
+# HTTP server
+
+
+class MockPolestarApi:
+    #####################################
+    # setup
+
+    def __init__(self, vins, port=0, latency=0.0, error_rate=0.0, sleep_ratio=0.5, seed=1):
+        # latency: mean seconds per request (exponentially distributed)
+        # error_rate: fraction of API/token requests answered with HTTP 503
+        self.fleet = SyntheticFleet(vins, sleep_ratio=sleep_ratio, seed=seed)
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.logins = 0
+        self.refreshes = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    #####################################
+    # request handling
+
+    def _delay_and_fail(self):
+        # simulated latency; True if this request should fail
+        with self._lock:
+            self.requests += 1
+            delay = self._random.expovariate(1 / self.latency) if self.latency > 0 else 0
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if delay:
+            time.sleep(delay)
+        return failed
+
+    def _token_response(self, kind):
+        with self._lock:
+            if kind == "login":
+                self.logins += 1
+            else:
+                self.refreshes += 1
+            serial = self.logins + self.refreshes
+        return {
+            "access_token": f"mock-access-{serial}",
+            "refresh_token": f"mock-refresh-{serial}",
+            "expires_in": 1800,
+        }
+
+    def handle(self, method, path, body):
+        # Return (status, headers, body bytes) for one request.
+        parsed = urllib.parse.urlparse(path)
+        if method == "GET" and parsed.path == f"{ID_PREFIX}/authorization.oauth2":
+            page = f'<form action:"{ID_PREFIX}/{PATH_TOKEN}/resume/as/authorization.ping">'
+            return 200, {"Set-Cookie": "PF=mock; Path=/"}, page.encode("utf-8")
+
+        if method == "POST" and parsed.path.endswith("/resume/as/authorization.ping"):
+            location = "https://www.polestar.com/sign-in-callback?code=mock-code"
+            return 302, {"Location": location}, b""
+
+        if self._delay_and_fail():
+            return 503, {"Content-Type": "application/json"}, b'{"errors":["unavailable"]}'
+
+        if method == "POST" and parsed.path == f"{ID_PREFIX}/token.oauth2":
+            form = urllib.parse.parse_qs(body.decode("utf-8"))
+            kind = "refresh" if form.get("grant_type") == ["refresh_token"] else "login"
+            return 200, {"Content-Type": "application/json"}, json.dumps(
+                self._token_response(kind)
+            ).encode("utf-8")
+
+        if method == "POST" and parsed.path == API_PATH:
+            request = json.loads(body or b"{}")
+            if request.get("operationName") == "GetConsumerCarsV2":
+                data = {"getConsumerCarsV2": self.fleet.consumer_cars()}
+            else:
+                vins = (request.get("variables") or {}).get("vins") or []
+                vins = [vins] if isinstance(vins, str) else vins
+                data = {"carTelematicsV2": self.fleet.telematics(vins)}
+            return 200, {"Content-Type": "application/json"}, json.dumps(
+                {"data": data}, separators=(",", ":")
+            ).encode("utf-8")
+
+        return 404, {}, b""
+
+    def _handler_class(self):
+        api = self
+
+        class MockHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive like the real endpoint
+
+            def _respond(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, headers, payload = api.handle(method, self.path, body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return MockHandler
+
+    #####################################
+    # server thread
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", self.port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="mock-polestar-api", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "logins": self.logins,
+            "refreshes": self.refreshes,
+        }
+
+#####################################
+# MAIN
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Polestar ID and mystar-v2 API")
+    parser.add_argument("--vins", type=int, default=500, help="synthetic cars on the account")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of HTTP 503")
+    args = parser.parse_args()
+
+    api = MockPolestarApi(
+        synthetic_vins(args.vins), args.port, args.latency, args.error_rate
+    ).start()
+    print(f"Polestar ID:  {api.url}{ID_PREFIX}")
+    print(f"GraphQL API:  {api.url}{API_PATH}")
+    try:
+        while True:
+            time.sleep(60)
+            print(json.dumps(api.stats()))
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
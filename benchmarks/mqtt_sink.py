@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+
+#
+# mqtt_sink.py
+#
+# Minimal MQTT 3.1.1 broker for load tests: accepts connections, acknowledges
+# publishes (QoS 0/1/2) and counts messages, bytes and topics, but does not route
+# anything to subscribers. restart() drops every connection and refuses new ones for
+# a while, to exercise the reconnect supervisor of the gateway.
+#
+
+import socket
+import socketserver
+import threading
+import time
+
+CONNECT, CONNACK = 0x10, 0x20
+PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 0x30, 0x40, 0x50, 0x60, 0x70
+SUBSCRIBE, SUBACK = 0x80, 0x90
+PINGREQ, PINGRESP = 0xC0, 0xD0
+DISCONNECT = 0xE0
+
+
+def _read_exact(sock_file, size):
+    data = sock_file.read(size)
+    if data is None or len(data) < size:
+        raise ConnectionError("connection closed")
+    return data
+
+
+def _read_packet(sock_file):
+    header = _read_exact(sock_file, 1)[0]
+    remaining = 0
+    multiplier = 1
+    while True:
+        byte = _read_exact(sock_file, 1)[0]
+        remaining += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            break
+        multiplier *= 128
+    return header, _read_exact(sock_file, remaining) if remaining else b""
+
+
+class MqttSink:
+    #####################################
+    # setup
+
+    def __init__(self, port=0):
+        self.port = port
+        self.messages = 0
+        self.payload_bytes = 0
+        self.connections = 0
+        self.restarts = 0
+        self.topics = set()
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    #####################################
+    # protocol handling
+
+    def _record(self, topic, payload_size):
+        with self._lock:
+            self.messages += 1
+            self.payload_bytes += payload_size
+            self.topics.add(topic)
+
+    def _handler_class(self):
+        sink = self
+
+        class SinkHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with sink._lock:
+                    sink._clients.add(self.request)
+                    sink.connections += 1
+                try:
+                    self._serve()
+                except (ConnectionError, OSError):
+                    pass
+                finally:
+                    with sink._lock:
+                        sink._clients.discard(self.request)
+
+            def _serve(self):
+                write = self.wfile.write
+                while True:
+                    header, body = _read_packet(self.rfile)
+                    packet_type = header & 0xF0
+                    if packet_type == CONNECT:
+                        write(bytes((CONNACK, 2, 0, 0)))
+                    elif packet_type == PUBLISH:
+                        qos = (header >> 1) & 0x03
+                        topic_length = int.from_bytes(body[:2], "big")
+                        topic = body[2:2 + topic_length].decode("utf-8")
+                        offset = 2 + topic_length
+                        if qos:
+                            packet_id = body[offset:offset + 2]
+                            offset += 2
+                            write(bytes((PUBACK if qos == 1 else PUBREC, 2)) + packet_id)
+                        sink._record(topic, len(body) - offset)
+                    elif packet_type == PUBREL:
+                        write(bytes((PUBCOMP, 2)) + body[:2])
+                    elif packet_type == SUBSCRIBE:
+                        write(bytes((SUBACK, 3)) + body[:2] + b"\x00")
+                    elif packet_type == PINGREQ:
+                        write(bytes((PINGRESP, 0)))
+                    elif packet_type == DISCONNECT:
+                        return
+
+        return SinkHandler
+
+    #####################################
+    # server control
+
+    def start(self):
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer(
+            ("127.0.0.1", self.port), self._handler_class()
+        )
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="mqtt-sink", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        with self._lock:
+            clients = list(self._clients)
+        for client_socket in clients:
+            try:
+                client_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def restart(self, downtime):
+        # simulate a broker restart: drop all clients, stay away for downtime seconds
+        self.stop()
+        self.restarts += 1
+        time.sleep(downtime)
+        self.start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "messages": self.messages,
+                "payload_bytes": self.payload_bytes,
+                "topics": len(self.topics),
+                "connections": self.connections,
+                "restarts": self.restarts,
+            }
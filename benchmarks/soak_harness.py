@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+
+#
+# soak_harness.py
+#
+# Runs the real gateway main() offline against mock_polestar_api.py and the
+# mqtt_sink.py broker, for fleets of hundreds of synthetic cars. Reports throughput,
+# stage latencies, memory and reconnect behavior every --report seconds and as a
+# final JSON summary.
+#
+# usage: python benchmarks/soak_harness.py [--vins 300] [--duration 120] [--cycle 10]
+#            [--latency 0.2] [--error-rate 0.0] [--broker-restart-every 60]
+#            [--runtime sync|async] [--output results.json]
+#
+
+import argparse
+import json
+import os
+import resource
+import signal
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SRC_DIR = BENCHMARKS_DIR.parent / "src"
+for path in (SRC_DIR, BENCHMARKS_DIR):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from mock_polestar_api import API_PATH, ID_PREFIX, MockPolestarApi, synthetic_vins  # noqa: E402
+from mqtt_sink import MqttSink  # noqa: E402
+
+STAGES = ("auth", "get_car_data", "get_car_telemetry_data", "flatten", "mqtt_publish")
+
+#####################################
+# measurements
+
+
+def current_rss_mb():
+    # resident set size from /proc (Linux), peak RSS as fallback
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def snapshot(app, api, broker, started):
+    supervisors = list(app.mqtt_supervisors.values())
+    return {
+        "elapsed": round(time.monotonic() - started, 1),
+        "broker": broker.stats(),
+        "api": api.stats(),
+        "rss_mb": round(current_rss_mb(), 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stages": {
+            stage: {
+                "count": app.stage_duration.count(stage=stage),
+                "seconds": round(app.stage_duration.total(stage=stage), 3),
+            }
+            for stage in STAGES
+        },
+        "published": app.mqtt_messages.value(),
+        "skipped": app.mqtt_skipped.value(),
+        "reconnects": sum(supervisor.reconnects for supervisor in supervisors),
+        "queued": sum(len(supervisor.queue) for supervisor in supervisors),
+        "queue_dropped": sum(supervisor.queue.dropped for supervisor in supervisors),
+        "http_retries": app.http_pool.retried,
+    }
+
+
+def print_report(report, previous):
+    interval = report["elapsed"] - previous["elapsed"] if previous else report["elapsed"]
+    messages = report["broker"]["messages"] - (previous["broker"]["messages"] if previous else 0)
+    rate = messages / interval if interval > 0 else 0
+    print(
+        f"[{report['elapsed']:7.1f}s] broker {report['broker']['messages']:8d} msgs "
+        f"({rate:8.1f}/s, {report['broker']['topics']} topics), "
+        f"api {report['api']['requests']} req / {report['api']['errors']} err, "
+        f"rss {report['rss_mb']} MB, reconnects {report['reconnects']}, "
+        f"queued {report['queued']}",
+        file=sys.stderr,
+    )
+
+#####################################
+# MAIN
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline soak test of the gateway")
+    parser.add_argument("--vins", type=int, default=300, help="synthetic cars (fleet mode)")
+    parser.add_argument("--duration", type=float, default=120, help="seconds to run")
+    parser.add_argument("--cycle", type=int, default=10, help="POLESTAR_CYCLE in seconds")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean API latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of HTTP 503")
+    parser.add_argument("--sleep-ratio", type=float, default=0.5, help="fraction of idle cars")
+    parser.add_argument(
+        "--broker-restart-every", type=float, default=0, help="seconds (0 = never)"
+    )
+    parser.add_argument("--broker-downtime", type=float, default=5, help="seconds per restart")
+    parser.add_argument("--runtime", choices=("sync", "async"), default="sync")
+    parser.add_argument("--report", type=float, default=10, help="seconds between reports")
+    parser.add_argument("--output", help="write the final summary as JSON to this file")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, broker, work_dir):
+    # configuration is read when the gateway module is imported
+    os.environ.update({
+        "POLESTAR_EMAIL": "soak@example.invalid",
+        "POLESTAR_PASSWORD": "soak",
+        "POLESTAR_VIN": "",
+        "POLESTAR_VINS": "all",
+        "POLESTAR_CYCLE": str(args.cycle),
+        "GATEWAY_RUNTIME": args.runtime,
+        "MQTT_BROKER": "127.0.0.1",
+        "MQTT_PORT": str(broker.port),
+        "MQTT_BASE_TOPIC": "soak",
+        "TOKEN_STORE_KEY": "",
+        "CAR_DATA_CACHE_PATH": str(Path(work_dir) / "car_data_cache.json"),
+        "HISTORY_PATH": str(Path(work_dir) / "history.sqlite"),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+    os.environ.pop("OPENWB_PUBLISH", None)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    api = MockPolestarApi(
+        synthetic_vins(args.vins),
+        latency=args.latency,
+        error_rate=args.error_rate,
+        sleep_ratio=args.sleep_ratio,
+    ).start()
+    broker = MqttSink().start()
+    work_dir = tempfile.mkdtemp(prefix="polestar-soak-")
+    configure_environment(args, broker, work_dir)
+
+    import Polestar_2_MQTT as app
+
+    # point the gateway at the mock endpoints
+    app.POLESTAR_API_URL_V2 = api.url + API_PATH
+    app.auth_client.id_uri = api.url + ID_PREFIX
+    # fail fast instead of sleeping POLESTAR_CYCLE before raising
+    app.POLESTAR_CYCLE = 0
+
+    started = time.monotonic()
+    reports = []
+    done = threading.Event()
+
+    def monitor():
+        next_restart = args.broker_restart_every or None
+        while not done.wait(args.report):
+            report = snapshot(app, api, broker, started)
+            print_report(report, reports[-1] if reports else None)
+            reports.append(report)
+            elapsed = time.monotonic() - started
+            if next_restart is not None and elapsed >= next_restart:
+                print(f"broker restart ({args.broker_downtime}s downtime)", file=sys.stderr)
+                broker.restart(args.broker_downtime)
+                next_restart += args.broker_restart_every
+            if elapsed >= args.duration:
+                os.kill(os.getpid(), signal.SIGTERM)  # graceful shutdown like docker stop
+                return
+
+    threading.Thread(target=monitor, name="soak-monitor", daemon=True).start()
+
+    error = None
+    try:
+        app.main()
+    except SystemExit:
+        pass  # SIGTERM handler of the blocking runtime
+    except Exception as exc:  # the gateway gave up, like a container exiting
+        error = f"{type(exc).__name__}: {exc}"
+    finally:
+        done.set()
+
+    summary = snapshot(app, api, broker, started)
+    summary["config"] = vars(args)
+    summary["error"] = error
+    summary["broker_messages_per_second"] = round(
+        summary["broker"]["messages"] / max(summary["elapsed"], 1e-9), 1
+    )
+    summary["reports"] = reports
+    print(json.dumps({key: value for key, value in summary.items() if key != "reports"},
+                     indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+
+    api.stop()
+    broker.stop()
+    return 1 if error else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
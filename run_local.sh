@@ -38,16 +38,23 @@ if [[ ! -f "${ENV_LOCAL_FILE}" ]]; then
 fi
 
 if (( ${#APP_ARGS[@]} > 1 )); then
-    echo "Usage: ./run_local.sh [runonce]" >&2
+    echo "Usage: ./run_local.sh [runonce|query]" >&2
     exit 1
 fi
 
-if (( ${#APP_ARGS[@]} == 1 )) && [[ "${APP_ARGS[0]}" != "runonce" ]]; then
+if (( ${#APP_ARGS[@]} == 1 )) && [[ "${APP_ARGS[0]}" != "runonce" && "${APP_ARGS[0]}" != "query" ]]; then
     echo "Unsupported argument: ${APP_ARGS[0]}" >&2
-    echo "Usage: ./run_local.sh [runonce]" >&2
+    echo "Usage: ./run_local.sh [runonce|query]" >&2
     exit 1
 fi
 
+# query prints its JSON document on stdout: keep the setup messages of this script on stderr
+if (( ${#APP_ARGS[@]} == 1 )) && [[ "${APP_ARGS[0]}" == "query" ]]; then
+    exec 3>&1 1>&2
+else
+    exec 3>&1
+fi
+
 load_env_file() {
     local file_path="$1"
     echo "Loading environment from ${file_path}"
@@ -121,4 +128,4 @@ if (( ${#missing_optional_env[@]} > 0 )); then
 fi
 
 echo "Starting ${APP_FILE}"
-exec "${VENV_PYTHON}" -u "${APP_FILE}" "${APP_ARGS[@]}"
+exec "${VENV_PYTHON}" -u "${APP_FILE}" "${APP_ARGS[@]}" 1>&3 3>&-
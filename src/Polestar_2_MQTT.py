@@ -14,56 +14,117 @@
 # TODO: fix OPENWB_TOPIC to make it configurable in docker-compose.yml
 
 import traceback
+import asyncio
+import logging
 import os
 import sys
 import signal
-import importlib.util
 import argparse
 from pathlib import Path
-import requests
 import time
 from datetime import datetime
 import pytz
 import json
 import paho.mqtt.client as mqtt
+import requests
 
-from auth import AuthError, PolestarAuthClient, TokenError
+from account_pool import AccountPool, load_accounts
+from async_runtime import AsyncGatewayRunner
+from auth import AuthError, PolestarAuthClient, TokenError, TokenRefresher
+from car_data_cache import CarDataCache
+from derived import DerivedMetrics
+from fetch_status import ApiError, FetchErrors, query_result
+from flatten import TopicPathCache, iter_mqtt_leaves, query_field_paths
+import graphql_queries
+from graphql_schema import GraphQLSchema
+from ha_discovery import HomeAssistantDiscovery, query_sections
+from history_store import HistoryStore
+from http_pool import HttpSessionPool
+from log_setup import get_logger, lazy_json, setup_logging
+from metrics import MetricsRegistry, MetricsServer
+from mqtt_supervisor import MqttSupervisor
+from publish_policy import PublishPolicy, parse_policy_rules
+from query_builder import QueryBuilder, read_query_constants
+from rate_limiter import RateLimiter
+from refresh_command import RefreshTrigger, parse_refresh_target
+from response_cache import ResponseCache
+from scheduler import AdaptivePollScheduler
+from telemetry import section_timestamps
+from token_store import TokenStore
+from topic_cache import TopicValueCache
 
 LOCAL_GRAPHQL_QUERIES_PATH = Path("/local-files/graphql_queries.py")
+SCRIPT_DIR = Path(__file__).resolve().parent
+SCHEMA_FILE_NAME = "graphql_schema.gql"
 
+log = get_logger("gateway")
 
-def load_graphql_queries_module():
-    if LOCAL_GRAPHQL_QUERIES_PATH.is_file():
-        print(f"Loading local GraphQL overrides from {LOCAL_GRAPHQL_QUERIES_PATH}")
-        spec = importlib.util.spec_from_file_location(
-            "local_graphql_queries",
-            LOCAL_GRAPHQL_QUERIES_PATH,
-        )
-        if spec is None or spec.loader is None:
-            raise ImportError(f"Could not load GraphQL overrides from {LOCAL_GRAPHQL_QUERIES_PATH}")
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-        return module
 
-    import graphql_queries as module
-    return module
+# GraphQL query templates: built-in, or the query strings of /local-files/graphql_queries.py
+# (the override file is parsed, not executed)
+def load_query_templates():
+    templates = {
+        "GET_CONSUMER_CARS_V2_QUERY": graphql_queries.GET_CONSUMER_CARS_V2_QUERY,
+        "CAR_TELEMATICS_V2_QUERY": graphql_queries.CAR_TELEMATICS_V2_QUERY,
+    }
+    if LOCAL_GRAPHQL_QUERIES_PATH.is_file():
+        log.info("Loading local GraphQL overrides from %s", LOCAL_GRAPHQL_QUERIES_PATH)
+        overrides = read_query_constants(LOCAL_GRAPHQL_QUERIES_PATH)
+        templates.update({name: overrides[name] for name in templates if name in overrides})
+    return templates
+
+# Home Assistant discovery sections of the fields the queries currently select
+def discovery_sections():
+    return {
+        **query_sections(CARS_QUERY, cars_query.query(), CAR_SECTION),
+        **query_sections(TELEMATICS_QUERY, telematics_query.query()),
+    }
 
+# the query subcommand prints its JSON document on stdout, so everything is logged to stderr
+# (decided before the global init below logs anything)
+def default_log_stream(argv):
+    return sys.stderr if "query" in argv[1:] else sys.stdout
 
-graphql_queries_module = load_graphql_queries_module()
-build_cartelematicsv2_payload = graphql_queries_module.build_cartelematicsv2_payload
-build_getconsumercarsv2_payload = graphql_queries_module.build_getconsumercarsv2_payload
+# GraphQL schema: next to the script in the container, repository root when run locally
+def default_schema_path():
+    for path in (SCRIPT_DIR / SCHEMA_FILE_NAME, SCRIPT_DIR.parent / SCHEMA_FILE_NAME):
+        if path.is_file():
+            return path
+    return SCRIPT_DIR / SCHEMA_FILE_NAME
 
 #####################################
 # read ENVIRONMENT variables
 
+TRUE_VALUES = ("1", "true", "yes", "on")
+
 # general
 TZ                      =     os.getenv('TZ',                "Europe/Berlin")
 
+# logging: LOG_LEVEL DEBUG adds every published topic and the full API responses
+LOG_LEVEL               =     os.getenv('LOG_LEVEL',         "INFO")
+LOG_FORMAT              =     os.getenv('LOG_FORMAT',        "json") # json lines or text
+LOG_RATE_LIMIT          = int(os.getenv('LOG_RATE_LIMIT',    60)) # s to mute repeats, 0 = off
+
 # credentials for Polestar API
 POLESTAR_EMAIL          =     os.getenv('POLESTAR_EMAIL')
 POLESTAR_PASSWORD       =     os.getenv('POLESTAR_PASSWORD')
 POLESTAR_VIN            =     os.getenv('POLESTAR_VIN')
+POLESTAR_VINS           =     os.getenv('POLESTAR_VINS',     "") # fleet: "VIN1,VIN2" or "all"
 POLESTAR_CYCLE          = int(os.getenv('POLESTAR_CYCLE',    "270")) # seconds
+POLESTAR_CYCLE_MIN      = int(os.getenv('POLESTAR_CYCLE_MIN', POLESTAR_CYCLE)) # s, while charging
+POLESTAR_CYCLE_MAX      = int(os.getenv('POLESTAR_CYCLE_MAX', POLESTAR_CYCLE)) # s, car asleep
+
+# several Polestar ID accounts from a JSON file (replaces POLESTAR_EMAIL/PASSWORD/VIN(S))
+POLESTAR_ACCOUNTS_FILE  =     os.getenv('POLESTAR_ACCOUNTS_FILE', "") # "" = single account
+ACCOUNT_WORKERS         = int(os.getenv('ACCOUNT_WORKERS',   4)) # accounts fetched in parallel
+ACCOUNT_JITTER          = float(os.getenv('ACCOUNT_JITTER',  0.1)) # +- fraction of each interval
+
+# request budget for pc-api.polestar.com, shared by all accounts
+API_RATE_LIMIT          = float(os.getenv('API_RATE_LIMIT',  60)) # requests per minute, 0 = off
+API_RATE_BURST          = int(os.getenv('API_RATE_BURST',    5)) # back-to-back requests
+
+# runtime: "sync" (blocking loop) or "async" (asyncio event loop)
+GATEWAY_RUNTIME         =     os.getenv('GATEWAY_RUNTIME',   "sync").strip().lower()
 
 # MQTT broker
 MQTT_BROKER             =     os.getenv("MQTT_BROKER",       "localhost") # IP or DNS name
@@ -72,6 +133,60 @@ MQTT_KEEPALIVE_INTERVAL = int(os.getenv("MQTT_KEEPALIVE",    60))
 MQTT_USER               =     os.getenv("MQTT_USER",         "")
 MQTT_PASSWORD           =     os.getenv("MQTT_PASSWORD",     "")
 MQTT_BASE_TOPIC         =     os.getenv("MQTT_BASE_TOPIC",   "polestar2")
+MQTT_FULL_REFRESH       = int(os.getenv("MQTT_FULL_REFRESH", 0)) # seconds, 0 = only changed topics
+MQTT_OUTPUT_MODE        =     os.getenv("MQTT_OUTPUT_MODE",  "leaves") # leaves, json or both
+MQTT_OUTPUT_MODES       =     os.getenv("MQTT_OUTPUT_MODES", "") # e.g. "battery=json,car=both"
+MQTT_PUBLISH_POLICY     =     os.getenv("MQTT_PUBLISH_POLICY", "") # e.g. "data_age/#=0:false"
+MQTT_QUEUE_SIZE         = int(os.getenv("MQTT_QUEUE_SIZE",   5000)) # topics buffered while offline
+MQTT_DRAIN_RATE         = float(os.getenv("MQTT_DRAIN_RATE", 100)) # msg/s after reconnect, 0 = max
+
+# encrypted token store, enabled by setting TOKEN_STORE_KEY (passphrase)
+TOKEN_STORE_KEY         =     os.getenv("TOKEN_STORE_KEY",   "")
+TOKEN_STORE_PATH        =     os.getenv("TOKEN_STORE_PATH",  "/local-files/token_store.json")
+
+# proactive token renewal after this fraction of the token lifetime (0 = only when expiring)
+TOKEN_REFRESH_FRACTION  = float(os.getenv("TOKEN_REFRESH_FRACTION", 0.8))
+
+# cache for mostly static car data (getConsumerCarsV2)
+CAR_DATA_TTL            = int(os.getenv("CAR_DATA_TTL",      86400)) # seconds, 0 = no cache
+CAR_DATA_CACHE_PATH     =     os.getenv("CAR_DATA_CACHE_PATH", "/local-files/car_data_cache.json")
+
+# recent full responses shared by runonce/query callers (and written by the polling loop)
+RESPONSE_CACHE_MAX_AGE  = int(os.getenv("RESPONSE_CACHE_MAX_AGE", 0)) # seconds, 0 = no cache
+RESPONSE_CACHE_PATH     =     os.getenv("RESPONSE_CACHE_PATH", "/local-files/response_cache.json")
+
+# derived metrics under <base>/derived (charge rate, consumption, trip deltas)
+DERIVED_METRICS         =     os.getenv("DERIVED_METRICS",   "true").strip().lower() in TRUE_VALUES
+BATTERY_CAPACITY_KWH    = float(os.getenv("BATTERY_CAPACITY_KWH", 75)) # usable kWh, 0 = only %
+
+# telemetry history (SQLite), enabled by setting HISTORY_RETENTION_DAYS
+HISTORY_PATH            =     os.getenv("HISTORY_PATH",      "/local-files/history.sqlite")
+HISTORY_RETENTION_DAYS  = int(os.getenv("HISTORY_RETENTION_DAYS", 0)) # 0 = no history
+HISTORY_RAW_DAYS        = int(os.getenv("HISTORY_RAW_DAYS",  7)) # days at full resolution
+HISTORY_DOWNSAMPLE      = int(os.getenv("HISTORY_DOWNSAMPLE", 900)) # s per sample after that
+
+# HTTP connection pool (keep-alive sessions shared by API and auth calls)
+HTTP_POOL_SIZE          = int(os.getenv("HTTP_POOL_SIZE",    4))
+HTTP_RETRIES            = int(os.getenv("HTTP_RETRIES",      3))
+HTTP_TIMEOUT            = float(os.getenv("HTTP_TIMEOUT",    30)) # seconds
+
+# Prometheus metrics endpoint (http://<host>:METRICS_PORT/metrics)
+METRICS_PORT            = int(os.getenv("METRICS_PORT",      0)) # 0 = disabled
+METRICS_ADDRESS         =     os.getenv("METRICS_ADDRESS",   "0.0.0.0")
+
+# on-demand refresh via <MQTT_BASE_TOPIC>/command/refresh[/<VIN>][/<section>]
+REFRESH_COMMAND         =     os.getenv("REFRESH_COMMAND",   "true").strip().lower() in TRUE_VALUES
+REFRESH_DEBOUNCE        = float(os.getenv("REFRESH_DEBOUNCE", 2)) # s to collect further commands
+REFRESH_MIN_INTERVAL    = float(os.getenv("REFRESH_MIN_INTERVAL", 60)) # s between early cycles
+
+# Home Assistant MQTT discovery (entities read the JSON document of each section)
+HA_DISCOVERY            =     os.getenv("HA_DISCOVERY",      "false").strip().lower() in TRUE_VALUES
+HA_DISCOVERY_PREFIX     =     os.getenv("HA_DISCOVERY_PREFIX", "homeassistant")
+
+# GraphQL field selection: comma separated paths below the root field, e.g. "battery,odometer"
+CAR_DATA_FIELDS         =     os.getenv("CAR_DATA_FIELDS",   "") # getConsumerCarsV2, "" = all
+TELEMATICS_FIELDS       =     os.getenv("TELEMATICS_FIELDS", "") # carTelematicsV2, "" = all
+GRAPHQL_SCHEMA_PATH     =     os.getenv("GRAPHQL_SCHEMA_PATH", str(default_schema_path()))
 
 # openWB - optional
 OPENWB_PUBLISH          =     os.getenv("OPENWB_PUBLISH", False) # default: no openWB 
@@ -83,8 +198,34 @@ OPENWB_LP_NUM           = int(os.getenv("OPENWB_LP_NUM",  1)) # can be 1 to 8
 #####################################
 # global init
 
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_RATE_LIMIT, stream=default_log_stream(sys.argv))
+
+# queries request only the configured fields, validated once against the (cached) schema
+query_templates = load_query_templates()
+graphql_schema = GraphQLSchema.load(GRAPHQL_SCHEMA_PATH)
+# (cars and telemetry sections are matched to their car by vin; the schema gaps of the
+# built-in queries are known and only logged at DEBUG)
+cars_query = QueryBuilder(
+    query_templates["GET_CONSUMER_CARS_V2_QUERY"], CAR_DATA_FIELDS, graphql_schema,
+    required = [("vin",)],
+    known_gaps = query_field_paths(graphql_queries.GET_CONSUMER_CARS_V2_QUERY),
+)
+telematics_query = QueryBuilder(
+    query_templates["CAR_TELEMATICS_V2_QUERY"], TELEMATICS_FIELDS, graphql_schema,
+    required = [("*", "vin")],
+    known_gaps = query_field_paths(graphql_queries.CAR_TELEMATICS_V2_QUERY),
+)
+cars_query.validate()
+telematics_query.validate()
+
 # internal constants
-SLEEP_INTERVAL         = 0.1
+FLEET_ALL_CARS         = "all"
+OUTPUT_MODES           = ("leaves", "json", "both") # one topic per leaf / JSON per section / both
+CAR_SECTION            = "car" # output mode section name of getConsumerCarsV2
+DERIVED_SECTION        = "derived" # output mode section name of the derived metrics
+FETCH_STATUS_SECTION   = "fetch_status" # per section: stale flag and API error
+CARS_QUERY             = "getConsumerCarsV2"
+TELEMATICS_QUERY       = "carTelematicsV2"
 MQTT_LWT_TOPIC         = f"{MQTT_BASE_TOPIC}/container/connected"
 MQTT_LWT_MESSAGE_DEAD  = "offline"
 MQTT_LWT_MESSAGE_ERROR = "error"
@@ -92,6 +233,7 @@ MQTT_LWT_MESSAGE_ALIVE = "online"
 MQTT_TIMESTAMP_TOPIC   = f"{MQTT_BASE_TOPIC}/container/last_update"
 MQTT_LAST_ERROR_TOPIC  = f"{MQTT_BASE_TOPIC}/container/last_error"
 MQTT_LAST_EXCEPTION_TOPIC = f"{MQTT_BASE_TOPIC}/container/last_exception"
+MQTT_REFRESH_TOPIC     = f"{MQTT_BASE_TOPIC}/command/refresh"
 
 # API config
 POLESTAR_BASE_URL     = "https://pc-api.polestar.com/eu-north-1"
@@ -100,26 +242,182 @@ POLESTAR_REDIRECT_URI = "https://www.polestar.com/sign-in-callback"
 POLESTAR_ID_URI       = "https://polestarid.eu.polestar.com/as"
 CLIENT_ID             = "l3oopkc_10"
 
-auth_client = PolestarAuthClient(POLESTAR_ID_URI, POLESTAR_REDIRECT_URI, CLIENT_ID, TZ)
+http_pool   = HttpSessionPool(
+    pool_size = HTTP_POOL_SIZE,
+    retries   = HTTP_RETRIES,
+    timeout   = HTTP_TIMEOUT,
+)
+auth_client = PolestarAuthClient(
+    POLESTAR_ID_URI, POLESTAR_REDIRECT_URI, CLIENT_ID, TZ, http=http_pool
+)
+token_store = TokenStore(TOKEN_STORE_PATH, TOKEN_STORE_KEY, account=POLESTAR_EMAIL or "")
+token_refresher = TokenRefresher(
+    auth_client,
+    POLESTAR_EMAIL,
+    POLESTAR_PASSWORD,
+    refresh_fraction = TOKEN_REFRESH_FRACTION,
+    on_update        = token_store.save,
+)
+
+# GatewayState per account in multi-account mode (POLESTAR_ACCOUNTS_FILE), set by main()
+account_states = []
+
+# one request budget for the GraphQL API of all accounts
+api_rate_limiter = RateLimiter(API_RATE_LIMIT, API_RATE_BURST)
+
+# last published payload per topic: only changed leaves are sent to the broker
+topic_cache = TopicValueCache(full_refresh_interval=MQTT_FULL_REFRESH)
+
+# mostly static car data is only fetched once per CAR_DATA_TTL (persisted across restarts)
+car_data_cache = CarDataCache(
+    CAR_DATA_CACHE_PATH, CAR_DATA_TTL, account=POLESTAR_EMAIL or "", query=cars_query.query()
+)
+
+# on-demand runs (runonce, query) within RESPONSE_CACHE_MAX_AGE share one API round trip
+response_cache = ResponseCache(
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_MAX_AGE,
+    key = (
+        f"{POLESTAR_EMAIL}|{POLESTAR_VINS.strip() or POLESTAR_VIN}"
+        f"|{CAR_DATA_FIELDS}|{TELEMATICS_FIELDS}"
+    ),
+)
+
+# refresh commands end the wait for the next cycle early (debounced, rate-limited)
+refresh_trigger = RefreshTrigger(REFRESH_DEBOUNCE, REFRESH_MIN_INTERVAL)
+
+# Home Assistant entities for every leaf selected in the GraphQL queries, typed by the schema
+ha_discovery = HomeAssistantDiscovery(
+    HA_DISCOVERY_PREFIX,
+    graphql_schema,
+    MQTT_LWT_TOPIC,
+    discovery_sections(),
+    diagnostic = (CAR_SECTION,),
+)
+
+# every battery/odometer/health sample per VIN, downsampled and expired by age
+history_store = HistoryStore(
+    HISTORY_PATH,
+    retention_days      = HISTORY_RETENTION_DAYS,
+    raw_days            = HISTORY_RAW_DAYS,
+    downsample_interval = HISTORY_DOWNSAMPLE,
+)
+
+# API errors of the current cycle per query and field (a failed section keeps its last values)
+fetch_errors = FetchErrors()
+
+# incremental per-VIN state for the derived metrics
+derived_metrics = DerivedMetrics(BATTERY_CAPACITY_KWH)
+
+# polling interval: POLESTAR_CYCLE, faster while charging, backing off while the car sleeps
+poll_scheduler = AdaptivePollScheduler(POLESTAR_CYCLE, POLESTAR_CYCLE_MIN, POLESTAR_CYCLE_MAX)
+
+# precompiled topic strings for the fields selected in the GraphQL queries
+topic_paths = TopicPathCache()
+
+# QoS/retain per topic subtree (default: qos=1, retained)
+publish_policy = PublishPolicy(MQTT_BASE_TOPIC, parse_policy_rules(MQTT_PUBLISH_POLICY))
+
+# Prometheus metrics: stage latencies and publish/retry counters
+metrics = MetricsRegistry()
+stage_duration = metrics.histogram(
+    "polestar_stage_duration_seconds",
+    "Duration of gateway stages (auth, API requests, flattening, MQTT publish).",
+)
+mqtt_messages = metrics.counter("polestar_mqtt_messages_total", "MQTT messages published.")
+mqtt_bytes = metrics.counter("polestar_mqtt_bytes_total", "MQTT payload bytes published.")
+mqtt_skipped = metrics.counter(
+    "polestar_mqtt_skipped_total", "Unchanged topics that were not published again."
+)
+mqtt_connect_retries = metrics.counter(
+    "polestar_mqtt_connect_retries_total", "Failed MQTT connect and reconnect attempts."
+)
+api_errors = metrics.counter(
+    "polestar_api_errors_total", "Failed GraphQL queries and query fields (by field path)."
+)
+metrics.callback_counter(
+    "polestar_http_retries_total", "HTTP requests retried by the connection pool.",
+    lambda: http_pool.retried,
+)
+metrics.callback_counter(
+    "polestar_token_refreshes_total", "Access token refreshes (including full logins).",
+    lambda: sum(
+        state.token_refresher.refresh_count for state in account_states
+    ) if account_states else token_refresher.refresh_count,
+)
+metrics.callback_counter(
+    "polestar_api_rate_limit_wait_seconds_total",
+    "Seconds API requests waited for the shared rate budget.",
+    lambda: api_rate_limiter.waited,
+)
+metrics.callback_counter(
+    "polestar_refresh_commands_total", "Refresh commands received via MQTT.",
+    lambda: refresh_trigger.requested,
+)
+metrics.callback_counter(
+    "polestar_history_samples_total", "Telemetry samples added to the history store.",
+    lambda: history_store.recorded,
+)
+metrics.callback_counter(
+    "polestar_mqtt_queue_coalesced_total", "Queued MQTT messages replaced by a newer value.",
+    lambda: sum(supervisor.queue.coalesced for supervisor in mqtt_supervisors.values()),
+)
+metrics.callback_counter(
+    "polestar_mqtt_queue_dropped_total", "Queued MQTT messages dropped because the queue was full.",
+    lambda: sum(supervisor.queue.dropped for supervisor in mqtt_supervisors.values()),
+)
+metrics_server = MetricsServer(metrics, METRICS_PORT, METRICS_ADDRESS)
 
-# setup MQTT-Client
-client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+# setup MQTT-Client (reconnects are done by its MqttSupervisor, not by paho's network thread)
+client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, reconnect_on_failure=False)
 # Last Will and Testament (LWT)
+lwt_qos, lwt_retain = publish_policy.lookup(MQTT_LWT_TOPIC)
 client.will_set(
     topic   = MQTT_LWT_TOPIC,
     payload = MQTT_LWT_MESSAGE_DEAD,
-    qos     = 1,
-    retain  = True
+    qos     = lwt_qos,
+    retain  = lwt_retain
 )
 
+# reconnect supervisor and bounded outbound queue per MQTT client
+mqtt_supervisors = {
+    client: MqttSupervisor("MQTT", client, MQTT_QUEUE_SIZE, MQTT_DRAIN_RATE),
+}
+
 # setup MQTT-Client for openWB if needed
 if (OPENWB_PUBLISH):
     OPENWB_TOPIC  = "openWB/set/lp/" + str(OPENWB_LP_NUM) + "/%Soc" # TODO: use ENV string
-    client_openwb = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client_openwb = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, reconnect_on_failure=False)
+    mqtt_supervisors[client_openwb] = MqttSupervisor(
+        "MQTT openWB", client_openwb, MQTT_QUEUE_SIZE, MQTT_DRAIN_RATE
+    )
 
 #####################################
 # MQTT helper functions
 
+# publish with QoS/retain from the publish policy of the topic;
+# queued by the client's supervisor while its broker is unreachable
+def mqtt_publish(mqtt_client, topic, payload, urgent=False):
+    qos, retain = publish_policy.lookup(topic)
+    supervisor = mqtt_supervisors.get(mqtt_client)
+    with stage_duration.time(stage="mqtt_publish"):
+        if supervisor is not None and urgent:
+            result = supervisor.publish_now(topic, payload, qos, retain)
+        elif supervisor is not None:
+            result = supervisor.publish(topic, payload, qos, retain)
+        else:
+            result = mqtt_client.publish(topic, payload, qos=qos, retain=retain)
+    mqtt_messages.inc()
+    mqtt_bytes.inc(payload_size(payload))
+    return result
+
+def payload_size(payload):
+    if payload is None:
+        return 0
+    if isinstance(payload, (bytes, bytearray)):
+        return len(payload)
+    return len(str(payload).encode("utf-8"))
+
 # Backoff strategy to handle connection and reconnection attempts
 def mqtt_backoff_attempt(client, method, max_retries=20, initial_delay=1, delay_max=300):
     """ 
@@ -139,9 +437,9 @@ def mqtt_backoff_attempt(client, method, max_retries=20, initial_delay=1, delay_
     for attempt in range(1, max_retries + 1):
         try:
             action = "connect" if method == client.connect else "reconnect"
-            print(
-                f"    MQTT ({client_address}): attempt {attempt} to "
-                f"{action}... (waiting {delay} seconds)"
+            log.info(
+                "MQTT (%s): attempt %d to %s... (waiting %s seconds)",
+                client_address, attempt, action, delay,
             )
             time.sleep(delay)  # Wait before trying to connect or reconnect
             method()  # Call the connect or reconnect method
@@ -149,13 +447,14 @@ def mqtt_backoff_attempt(client, method, max_retries=20, initial_delay=1, delay_
             connected_text = (
                 "Connected" if method == client.connect else "Reconnected"
             )
-            print(
-                f"    MQTT ({client_address}): {connected_text} successfully "
-                f"after {elapsed_time:.2f} seconds!"
+            log.info(
+                "MQTT (%s): %s successfully after %.2f seconds!",
+                client_address, connected_text, elapsed_time,
             )
             break  # If connection or reconnection is successful, exit the loop
         except Exception as e:
-            print(f"    MQTT ({client_address}): attempt {attempt} failed: {e}")
+            log.warning("MQTT (%s): attempt %d failed: %s", client_address, attempt, e)
+            mqtt_connect_retries.inc()
             delay = min(delay * 2, delay_max)  # Double the delay but do not exceed delay_max
     else:
         elapsed_time = time.time() - start_time  # Calculate elapsed time
@@ -169,18 +468,53 @@ def mqtt_backoff_attempt(client, method, max_retries=20, initial_delay=1, delay_
         )
 
 # callback for MQTT connection handling
-def mqtt_on_connect(client, userdata, flags, rc, properties):
-    print(f"    MQTT connected with result code '{rc}': {MQTT_LWT_TOPIC}={MQTT_LWT_MESSAGE_ALIVE}")
-    # set LWT to alive status
-    client.publish(MQTT_LWT_TOPIC, MQTT_LWT_MESSAGE_ALIVE, qos=1, retain=True)
-    client.publish(MQTT_LAST_ERROR_TOPIC, "", qos=1, retain=True)
-    client.publish(MQTT_LAST_EXCEPTION_TOPIC, "", qos=1, retain=True)
-
-# callback for MQTT disconnection handling
-def mqtt_on_disconnect(client, userdata, rc, properties=None, reason_code=None):
-    if rc != 0:  # rc = 0 indicates a normal disconnection
-        print(f"    MQTT: disconnected unexpectedly with reason code '{reason_code}'.")
-        mqtt_backoff_attempt(client, client.reconnect)
+def mqtt_on_connect(mqtt_client, userdata, flags, rc, properties):
+    if getattr(rc, "is_failure", False):
+        log.warning("MQTT connection refused with result code '%s'", rc)
+        return
+    log.info(
+        "MQTT connected with result code '%s': %s=%s", rc, MQTT_LWT_TOPIC, MQTT_LWT_MESSAGE_ALIVE
+    )
+    # set LWT to alive status, ahead of messages queued during an outage
+    mqtt_publish(mqtt_client, MQTT_LWT_TOPIC, MQTT_LWT_MESSAGE_ALIVE, urgent=True)
+    mqtt_publish(mqtt_client, MQTT_LAST_ERROR_TOPIC, "", urgent=True)
+    mqtt_publish(mqtt_client, MQTT_LAST_EXCEPTION_TOPIC, "", urgent=True)
+    supervisor = mqtt_supervisors.get(mqtt_client)
+    if supervisor is not None:
+        supervisor.on_connect()  # publish directly again and drain the outbound queue
+    if mqtt_client is not client:
+        return  # openWB only gets the SoC: the topic cache and discovery belong to the main broker
+    # broker may have lost its retained store: republish every topic in the next cycle
+    topic_cache.clear()
+    ha_discovery.reset()
+    # (re)subscribe: the session does not survive a reconnect
+    subscribe_commands(mqtt_client)
+
+# refresh commands are only accepted on the main broker; one subscription, because
+# "<topic>/#" also matches "<topic>" (a second one could deliver every command twice)
+def subscribe_commands(mqtt_client):
+    if REFRESH_COMMAND and mqtt_client is client:
+        mqtt_client.subscribe(f"{MQTT_REFRESH_TOPIC}/#", 1)
+        log.info("listening for refresh commands on %s/#", MQTT_REFRESH_TOPIC)
+
+# callback for MQTT commands (paho network thread: only records the request)
+def mqtt_on_message(client, userdata, message):
+    if message.retain:
+        return  # a retained command would trigger again after every reconnect
+    if message.topic != MQTT_REFRESH_TOPIC and not message.topic.startswith(
+        MQTT_REFRESH_TOPIC + "/"
+    ):
+        return
+    target = parse_refresh_target(message.topic[len(MQTT_REFRESH_TOPIC):])
+    log.info("refresh command received: vin=%s, section=%s", *target)
+    refresh_trigger.request(target)
+
+# callback for MQTT disconnection handling (paho network thread: must not block,
+# the supervisor reconnects from its own thread)
+def mqtt_on_disconnect(client, userdata, flags, reason_code=None, properties=None):
+    supervisor = mqtt_supervisors.get(client)
+    if supervisor is not None:
+        supervisor.on_disconnect()
 
 # connect to MQTT broker
 def mqtt_connect():   
@@ -188,11 +522,13 @@ def mqtt_connect():
     client.username_pw_set(MQTT_USER, MQTT_PASSWORD)   
     client.on_connect     = mqtt_on_connect
     client.on_disconnect  = mqtt_on_disconnect
+    client.on_message     = mqtt_on_message
     mqtt_backoff_attempt(
         client,
         lambda: client.connect(MQTT_BROKER, MQTT_PORT, MQTT_KEEPALIVE_INTERVAL),
     )
     client.loop_start()
+    mqtt_supervisors[client].start()
 
 # connect to OpenWB built in MQTT broker
 def mqtt_connect_openwb():   
@@ -205,6 +541,22 @@ def mqtt_connect_openwb():
         ),
     )
     client_openwb.loop_start()
+    mqtt_supervisors[client_openwb].start()
+
+# MQTT clients with their connect call (name, client, connect), used by the asyncio runtime
+def mqtt_brokers():
+    brokers = [(
+        "MQTT",
+        client,
+        lambda: client.connect(MQTT_BROKER, MQTT_PORT, MQTT_KEEPALIVE_INTERVAL),
+    )]
+    if OPENWB_PUBLISH:
+        brokers.append((
+            "MQTT openWB",
+            client_openwb,
+            lambda: client_openwb.connect(OPENWB_HOST, OPENWB_PORT, MQTT_KEEPALIVE_INTERVAL),
+        ))
+    return brokers
 
 #####################################
 # helper functions
@@ -214,11 +566,56 @@ def parse_runtime_args(argv=None):
     parser.add_argument(
         "mode",
         nargs="?",
-        choices=["runonce"],
-        help="Run a single polling cycle and exit cleanly.",
+        choices=["runonce", "query"],
+        help="runonce: run a single polling cycle and exit cleanly; "
+             "query: print car and telemetry data as JSON without MQTT.",
+    )
+    parser.add_argument(
+        "--refresh-car-data",
+        action="store_true",
+        help="Ignore cached car data and fetch getConsumerCarsV2 in the first cycle.",
     )
     return parser.parse_args(argv)
 
+def parse_vin_list(value):
+    # parse POLESTAR_VINS: comma-separated VINs or "all" (None) for every car on the account
+    if value.strip().lower() == FLEET_ALL_CARS:
+        return None
+
+    vins = []
+    for vin in value.split(","):
+        vin = vin.strip()
+        if vin and vin not in vins:
+            vins.append(vin)
+    return vins
+
+def parse_output_modes(default_mode, overrides):
+    # output mode per section from MQTT_OUTPUT_MODE and "section=mode,..." overrides ("*" = default)
+    modes = {"*": default_mode.strip().lower()}
+    for item in overrides.split(","):
+        if not item.strip():
+            continue
+        section, _, mode = item.partition("=")
+        modes[section.strip()] = mode.strip().lower()
+
+    invalid = {section: mode for section, mode in modes.items() if mode not in OUTPUT_MODES}
+    if invalid:
+        raise ValueError(f"invalid MQTT output mode(s) {invalid}, expected one of {OUTPUT_MODES}")
+    return modes
+
+def gateway_output_modes():
+    modes = parse_output_modes(MQTT_OUTPUT_MODE, MQTT_OUTPUT_MODES)
+    if HA_DISCOVERY:
+        # discovery entities read the JSON document of each section: leaves -> both
+        modes = {section: "both" if mode == "leaves" else mode for section, mode in modes.items()}
+    return modes
+
+def vehicle_topic(vin, fleet_mode):
+    # fleet mode publishes every car under its own subtree, single mode keeps the classic layout
+    if fleet_mode:
+        return f"{MQTT_BASE_TOPIC}/{vin}"
+    return MQTT_BASE_TOPIC
+
 def get_local_time(tz, time):
     # convert to local timezone in tz (e.g. Europe/Berlin)
     local_time = time.astimezone(pytz.timezone(tz))
@@ -226,11 +623,14 @@ def get_local_time(tz, time):
     # as formated time stamp
     return local_time.strftime('%Y-%m-%d %H:%M:%S %Z%z')
 
+def publish_error(message, exception, status_payload=MQTT_LWT_MESSAGE_ERROR):
+    log.error("%s", message, extra={"error": str(exception), "status": status_payload})
+    mqtt_publish(client, MQTT_LWT_TOPIC, status_payload)
+    mqtt_publish(client, MQTT_LAST_ERROR_TOPIC, str(message))
+    mqtt_publish(client, MQTT_LAST_EXCEPTION_TOPIC, str(exception))
+
 def publish_error_and_raise(message, exception, status_payload=MQTT_LWT_MESSAGE_ERROR):
-    print(message)
-    client.publish(MQTT_LWT_TOPIC, status_payload, qos=1, retain=True)
-    client.publish(MQTT_LAST_ERROR_TOPIC, str(message), qos=1, retain=True)
-    client.publish(MQTT_LAST_EXCEPTION_TOPIC, str(exception), qos=1, retain=True)
+    publish_error(message, exception, status_payload)
     time.sleep(POLESTAR_CYCLE)  # wait POLESTAR_CYCLE seconds to reduce retry count
     raise Exception(exception)
 
@@ -238,11 +638,17 @@ def publish_error_and_raise(message, exception, status_payload=MQTT_LWT_MESSAGE_
 
 
 def shutdown_clients():
+    token_refresher.stop()
+    metrics_server.stop()
+    for supervisor in mqtt_supervisors.values():
+        supervisor.stop()
     client.disconnect()
     client.loop_stop()
     if OPENWB_PUBLISH:
         client_openwb.disconnect()
         client_openwb.loop_stop()
+    http_pool.close()
+    history_store.close()
 
 #####################################
 # login to Polestar API is encapsulated in src/auth.py
@@ -250,35 +656,72 @@ def shutdown_clients():
 #####################################
 # read data from Polestar API
 
-# get mostly static car data
-def get_car_data(vin, access_token):
-    url = POLESTAR_API_URL_V2
+# POST a GraphQL query: (data of the query field, field errors) or ApiError if it failed
+def post_graphql(query, payload, access_token, stage):
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {access_token}"
     }
-    response = requests.post(url, headers=headers, json=build_getconsumercarsv2_payload())
-
+    api_rate_limiter.acquire()
     try:
-        response_json = response.json()
-    except ValueError:
-        response_json = {"raw_response": response.text}
+        with stage_duration.time(stage=stage):
+            response = http_pool.post(POLESTAR_API_URL_V2, headers=headers, json=payload)
+    except requests.RequestException as exc:
+        raise ApiError(query, str(exc)) from exc
+    return query_result(query, response)
 
-    if response.status_code != 200:
-        publish_error_and_raise(f"  response.status_code = {response.status_code}\n"
-                     + json.dumps(response_json, indent=2),
-                     "get_car_data() no data received")
+# GraphQL payloads of the configured field selection
+def build_getconsumercarsv2_payload():
+    return cars_query.payload("{}")
 
-    car_data = response_json.get('data') or {}
-    consumer_cars = car_data.get('getConsumerCarsV2')
+def build_cartelematicsv2_payload(vin):
+    return telematics_query.payload({"vins": vin})
 
+# POST a built query; fields the server rejects are dropped and the query is sent again
+def post_selected_fields(builder, build_payload, access_token, stage):
+    while True:
+        try:
+            return post_graphql(builder.root_field, build_payload(), access_token, stage)
+        except ApiError as exc:
+            if not builder.drop_rejected(str(exc)):
+                raise
+            ha_discovery.update_sections(discovery_sections())  # no entities for dropped fields
+
+# remember GraphQL field errors of this cycle, e.g. one telematics section the API lacks
+def record_field_errors(errors, field_errors=None):
+    for path, message in errors.items():
+        log.warning("API field error %s: %s", path, message, extra={"field": path})
+        api_errors.inc(field="/".join(part for part in path.split("/") if not part.isdigit()))
+    (fetch_errors if field_errors is None else field_errors).update(errors)
+
+# a failed query ends neither the cycle nor the process: the last good data stays published
+def report_fetch_error(exc, field_errors=None):
+    log.warning(
+        "%s (keeping the last good data)", exc,
+        extra={"query": exc.query, "status_code": exc.status_code},
+    )
+    api_errors.inc(field=exc.query)
+    (fetch_errors if field_errors is None else field_errors).add(exc.query, str(exc))
+    mqtt_publish(client, MQTT_LAST_ERROR_TOPIC, str(exc))
+
+# get mostly static data of all cars on the account
+def get_consumer_cars(access_token, field_errors=None):
+    consumer_cars, errors = post_selected_fields(
+        cars_query, build_getconsumercarsv2_payload, access_token, "get_car_data"
+    )
     if not isinstance(consumer_cars, list):
-        publish_error_and_raise("get_car_data(): unexpected API response\n"
-                     + json.dumps(response_json, indent=2),
-                     "get_car_data(): getConsumerCarsV2 missing or invalid")
+        raise ApiError(CARS_QUERY, f"unexpected API response: {json.dumps(consumer_cars)}")
+    record_field_errors(errors, field_errors)
+
+    return [car for car in consumer_cars if isinstance(car, dict)]
+
+# get mostly static car data (consumer_cars: already fetched getConsumerCarsV2 list)
+def get_car_data(vin, access_token, consumer_cars=None):
+    if consumer_cars is None:
+        consumer_cars = get_consumer_cars(access_token)
 
     filtered_car_data = next(
-        (car for car in consumer_cars if isinstance(car, dict) and car.get('vin') == vin),
+        (car for car in consumer_cars if car.get('vin') == vin),
         None
     )
 
@@ -287,64 +730,554 @@ def get_car_data(vin, access_token):
 
     return filtered_car_data
 
-# get battery & odometer data
-def get_car_telemetry_data(vin, access_token):
-    url = POLESTAR_API_URL_V2
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}"
-    }
-    response = requests.post(url, headers=headers, json=build_cartelematicsv2_payload(vin))
-    if response.status_code != 200:
-        print(response.json())
-        publish_error_and_raise("  response.status_code = {response.status_code}\n"
-                     + json.dumps(response.json(), indent=2),
-                     "get_car_telemetry_data() no data received")
-    return response.json()['data']['carTelematicsV2']
-
-# recursive parsing of the JSON object to build corresponding MQTT topics and send
-def publish_json_as_mqtt(topic, json_obj):
-    if isinstance(json_obj, dict):
-         # dict → rekursiv
-        for key, value in json_obj.items():
-            sub_topic = f"{topic}/{key}"
-            publish_json_as_mqtt(sub_topic, value) # call self to resolve next json level
-
-    elif isinstance(json_obj, list):
-         # list → Index im Topic
-        for idx, item in enumerate(json_obj):
-             sub_topic = f"{topic}/{idx}"
-             publish_json_as_mqtt(sub_topic, item)
+# get mostly static car data for a fleet (vins=None: all cars on the account)
+def get_fleet_car_data(vins, access_token, consumer_cars=None):
+    if consumer_cars is None:
+        consumer_cars = get_consumer_cars(access_token)
 
-    else:
-        if isinstance(json_obj, str):
-            json_payload = json_obj
-        else:
-            json_payload = json.dumps(json_obj) # json.dumps für korrekte String-Repräsentation
+    cars_by_vin = {car['vin']: car for car in consumer_cars if car.get('vin')}
+
+    if vins is None:
+        return cars_by_vin
 
-        print(f"{topic}: {json_payload}")
-        client.publish(topic, json_payload, qos=1, retain=True)
+    missing_vins = [vin for vin in vins if vin not in cars_by_vin]
+    if missing_vins:
+        log.warning("get_fleet_car_data(): no data for cars with VIN %s", ", ".join(missing_vins))
+    if len(missing_vins) == len(vins):
+        raise ValueError("get_fleet_car_data(): none of the configured VINs found on account")
+
+    return {vin: cars_by_vin[vin] for vin in vins if vin in cars_by_vin}
+
+# get battery & odometer data (vin may be a single VIN or a list of VINs);
+# sections the API could not deliver are left out and keep their last good values
+def get_car_telemetry_data(vin, access_token, field_errors=None):
+    telemetry_data, errors = post_selected_fields(
+        telematics_query, lambda: build_cartelematicsv2_payload(vin), access_token,
+        "get_car_telemetry_data",
+    )
+    if not isinstance(telemetry_data, dict):
+        raise ApiError(TELEMATICS_QUERY, f"unexpected API response: {json.dumps(telemetry_data)}")
+    record_field_errors(errors, field_errors)
+
+    return {section: value for section, value in telemetry_data.items() if value is not None}
+
+# split a batched carTelematicsV2 response into one telemetry document per VIN
+def split_telemetry_by_vin(telemetry_data, vins):
+    per_vin = {vin: {} for vin in vins}
+
+    for section, value in (telemetry_data or {}).items():
+        if isinstance(value, list):
+            for vin in vins:
+                per_vin[vin][section] = []
+            for entry in value:
+                vin = entry.get('vin') if isinstance(entry, dict) else None
+                if vin in per_vin:
+                    per_vin[vin][section].append(entry)
+        elif isinstance(value, dict) and value.get('vin') in per_vin:
+            per_vin[value['vin']][section] = value
+
+    return per_vin
+
+# flatten the JSON object to MQTT topics (dict keys and list indices become topic levels)
+# and send only leaves whose payload changed since the last publish; returns number published
+def publish_json_as_mqtt(topic, json_obj):
+    published = 0
+    skipped = 0
+    debug = log.isEnabledFor(logging.DEBUG)
+
+    # the flatten stage times the whole flatten-and-publish loop (leaves are streamed)
+    with stage_duration.time(stage="flatten"):
+        for leaf_topic, payload in iter_mqtt_leaves(topic, json_obj, topic_paths):
+            if not topic_cache.changed(leaf_topic, payload):
+                skipped += 1
+                continue
+
+            if debug:
+                log.debug("%s: %s", leaf_topic, payload.decode("utf-8"))
+            mqtt_publish(client, leaf_topic, payload)
+            published += 1
+
+    if skipped:
+        mqtt_skipped.inc(skipped)
+    return published
+
+# publish a whole section as one compact JSON document (single-entry lists are unwrapped)
+def publish_json_document(topic, json_obj):
+    if isinstance(json_obj, list) and len(json_obj) == 1:
+        json_obj = json_obj[0]
+    with stage_duration.time(stage="flatten"):
+        payload = json.dumps(json_obj, separators=(",", ":")).encode("utf-8")
+
+    if not topic_cache.changed(topic, payload):
+        mqtt_skipped.inc()
+        return 0
+
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("%s: %s", topic, payload.decode("utf-8"))
+    mqtt_publish(client, topic, payload)
+    return 1
+
+# publish a section as leaf topics, JSON document or both, depending on its output mode;
+# returns True if anything changed and was sent
+def publish_section(output_modes, section, leaves_topic, document_topic, json_obj):
+    mode = output_modes.get(section, output_modes["*"])
+    published = False
+    if mode in ("leaves", "both"):
+        published = bool(publish_json_as_mqtt(leaves_topic, json_obj))
+    if mode in ("json", "both"):
+        published = bool(publish_json_document(document_topic, json_obj)) or published
+    return published
+
+# warm the topic path cache for the subtrees of one car; every carTelematicsV2 section is a
+# list with the entry of this car at index 0
+def precompile_topic_paths(base_topic):
+    topic_paths.precompile(
+        base_topic + "/getConsumerCarsV2",
+        cars_query.paths,
+    )
+    topic_paths.precompile(
+        base_topic + "/CarTelematicsV2",
+        [(path[0], 0) + path[1:] for path in telematics_query.paths],
+    )
 
 # extract SoC from battery data JSON and send to openWB via MQTT
 def publish_soc_to_openwb(battery_data):
+    if isinstance(battery_data, list) and battery_data:
+        battery_data = battery_data[0]  # carTelematicsV2 returns one entry per VIN
     if isinstance(battery_data, dict):
-        soc = battery_data['batteryChargeLevelPercentage']
-        print(f' publish SoC {soc} to OpenWB {OPENWB_TOPIC}')
-        client_openwb.publish(OPENWB_TOPIC, soc, qos=1, retain=True)
+        soc = battery_data.get('batteryChargeLevelPercentage')
+        if soc is None:
+            # e.g. TELEMATICS_FIELDS without battery.batteryChargeLevelPercentage
+            log.warning("no batteryChargeLevelPercentage in the battery data, SoC not sent")
+            return
+        log.info("publish SoC %s to OpenWB %s", soc, OPENWB_TOPIC)
+        mqtt_publish(client_openwb, OPENWB_TOPIC, soc)
+
+#####################################
+# polling cycle steps (shared by the blocking loop and the asyncio runtime)
+
+class GatewayState:
+    # state carried from one polling cycle to the next
+    def __init__(
+        self, fleet_mode, fleet_vins, output_modes=None, account="",
+        refresher=None, cars_cache=None, scheduler=None, errors=None,
+    ):
+        self.fleet_mode              = fleet_mode  # several VINs, one subtree per car
+        self.fleet_vins              = fleet_vins  # configured VINs, None = all cars on account
+        self.output_modes            = output_modes or {"*": "leaves"} # per section
+        self.access_token            = None  # current access token
+        self.refresh_token           = None  # current refresh token
+        self.expiry_time             = None  # expiry time of the current access token
+        self.last_car_data           = {}    # cache of the last car data per VIN
+        self.last_car_telemetry_data = {}    # cache of the last battery & odometer data per VIN
+        self.car_data_stale          = False # getConsumerCarsV2 failed, last car data in use
+        self.token_failed            = False # last cycle was skipped because of a token error
+        # per-account components (multi-account mode), by default the global ones
+        self.account                 = account  # account name, "" = single account
+        self.token_refresher         = token_refresher if refresher is None else refresher
+        self.car_data_cache          = car_data_cache if cars_cache is None else cars_cache
+        self.poll_scheduler          = poll_scheduler if scheduler is None else scheduler
+        self.fetch_errors            = fetch_errors if errors is None else errors
+
+def create_gateway_state():
+    # fleet mode: several VINs (or all cars on the account) with one batched API call per cycle
+    fleet_mode = bool(POLESTAR_VINS.strip())
+    fleet_vins = parse_vin_list(POLESTAR_VINS) if fleet_mode else [POLESTAR_VIN]
+    if fleet_mode:
+        log.info("fleet mode: %s", "all cars on account" if fleet_vins is None else fleet_vins)
+    state = GatewayState(fleet_mode, fleet_vins, gateway_output_modes())
+
+    load_stored_tokens(state, token_store)
+    return state
+
+def load_stored_tokens(state, store):
+    # reuse tokens of the last run: restarts go straight to reuse or refresh
+    stored_tokens = store.load()
+    if stored_tokens:
+        state.access_token, state.expiry_time, state.refresh_token = stored_tokens
+        state.token_refresher.set_tokens(*stored_tokens)
+        log.info("token store: loaded tokens (expiry_time = %s)", state.expiry_time.isoformat())
+
+# per-account file next to the configured one, e.g. token_store_<account>.json ("" stays "")
+def account_file_path(path, account):
+    if not path:
+        return path
+    path = Path(path)
+    return path.with_name(f"{path.stem}_{account}{path.suffix}")
+
+def create_account_states(accounts):
+    # multi-account mode: fleet topics per car, own tokens, stores and schedule per account
+    output_modes = gateway_output_modes()
+    states = []
+    for account in accounts:
+        name, email = account["name"], account["email"]
+        store = TokenStore(account_file_path(TOKEN_STORE_PATH, name), TOKEN_STORE_KEY, email)
+        state = GatewayState(
+            True,
+            parse_vin_list(account["vins"]),
+            output_modes,
+            account    = name,
+            refresher  = TokenRefresher(
+                auth_client,
+                email,
+                account["password"],
+                refresh_fraction = TOKEN_REFRESH_FRACTION,
+                on_update        = store.save,
+            ),
+            cars_cache = CarDataCache(
+                account_file_path(CAR_DATA_CACHE_PATH, name),
+                CAR_DATA_TTL,
+                account = email,
+                query   = cars_query.query(),
+            ),
+            scheduler  = AdaptivePollScheduler(
+                POLESTAR_CYCLE, POLESTAR_CYCLE_MIN, POLESTAR_CYCLE_MAX
+            ),
+            errors     = FetchErrors(),
+        )
+        load_stored_tokens(state, store)
+        states.append(state)
+    return states
+
+def ensure_access_token(state):
+    # Ensure we have a valid access token; the background refresher usually renewed it already
+    log.debug("ensure_valid_token()")
+    try:
+        with stage_duration.time(stage="auth"):
+            tokens = state.token_refresher.get_token()
+        state.access_token, state.expiry_time, state.refresh_token = tokens
+    except AuthError as exc:
+        # e.g. login page changed or credentials rejected: skip this cycle, retry with the next
+        publish_error("Authentication flow failed", str(exc), status_payload="auth_error")
+        state.token_failed = True
+        raise ApiError("auth", str(exc)) from exc
+    except TokenError as exc:
+        # e.g. token endpoint unavailable: skip this cycle instead of a restart and full login
+        publish_error("Token flow failed", str(exc), status_payload="token_error")
+        state.token_failed = True
+        raise ApiError("token", str(exc)) from exc
+    except requests.RequestException as exc:
+        # network blip on the way to Polestar ID: keep the tokens, retry with the next cycle
+        publish_error("Token flow failed", str(exc), status_payload="token_error")
+        state.token_failed = True
+        raise ApiError("token", str(exc)) from exc
+
+    if state.token_failed:
+        state.token_failed = False
+        mqtt_publish(client, MQTT_LWT_TOPIC, MQTT_LWT_MESSAGE_ALIVE)
+
+def start_fetch_cycle(state):
+    state.fetch_errors.start_cycle()
+
+def start_publish_cycle(state):
+    if topic_cache.start_cycle(state.account):
+        log.info("full refresh: republishing all topics (every %s seconds)", MQTT_FULL_REFRESH)
+
+def get_cached_consumer_cars(state, required_vins):
+    # getConsumerCarsV2 list from the TTL cache; fetched again when expired or a VIN is unknown
+    car_data_cache = state.car_data_cache
+    consumer_cars = car_data_cache.get()
+    if consumer_cars is not None:
+        cached_vins = {car.get('vin') for car in consumer_cars}
+        if all(vin in cached_vins for vin in required_vins or []):
+            log.debug("get_car_data(): cached car data (%.0f seconds old)", car_data_cache.age())
+            return consumer_cars
+        car_data_cache.invalidate()
+
+    log.info("get_car_data()")
+    consumer_cars = get_consumer_cars(state.access_token, state.fetch_errors)
+    car_data_cache.put(consumer_cars)
+    return consumer_cars
+
+# last getConsumerCarsV2 list regardless of the cache TTL (fallback while the API fails)
+def last_known_consumer_cars(state):
+    return state.car_data_cache.last() or list(state.last_car_data.values())
+
+def fetch_cars_data(state):
+    # static car data per VIN (one getConsumerCarsV2 request unless cached)
+    required_vins = state.fleet_vins if state.fleet_mode else [POLESTAR_VIN]
+    try:
+        consumer_cars = get_cached_consumer_cars(state, required_vins)
+        state.car_data_stale = False
+    except ApiError as exc:
+        consumer_cars = last_known_consumer_cars(state)
+        if not consumer_cars:
+            raise  # no car known yet: nothing to publish this cycle
+        report_fetch_error(exc, state.fetch_errors)
+        state.car_data_stale = True
+    if state.fleet_mode:
+        cars_data = get_fleet_car_data(state.fleet_vins, state.access_token, consumer_cars)
+    else:
+        cars_data = {POLESTAR_VIN: get_car_data(POLESTAR_VIN, state.access_token, consumer_cars)}
+
+    for vin in cars_data:
+        if vin not in state.last_car_data:
+            precompile_topic_paths(vehicle_topic(vin, state.fleet_mode))
+    return cars_data
+
+def fetch_telemetry_data(state, vins):
+    # battery & odometer data per VIN (one carTelematicsV2 request)
+    log.debug("get_car_telemetry_data()")
+    try:
+        if state.fleet_mode:
+            # one batched request for the whole fleet
+            telemetry_data = get_car_telemetry_data(vins, state.access_token, state.fetch_errors)
+            return split_telemetry_by_vin(telemetry_data, vins)
+        return {
+            POLESTAR_VIN: get_car_telemetry_data(
+                POLESTAR_VIN, state.access_token, state.fetch_errors
+            )
+        }
+    except ApiError as exc:
+        report_fetch_error(exc, state.fetch_errors)
+        return {vin: {} for vin in vins}  # every section keeps its last good values
+
+# sections missing in this cycle keep their last good values; returns (document, stale sections)
+def merge_last_good(state, vin, car_telemetry_data):
+    merged = dict(car_telemetry_data)
+    stale_sections = []
+    for section, value in (state.last_car_telemetry_data.get(vin) or {}).items():
+        if value and not merged.get(section):
+            merged[section] = value
+            stale_sections.append(section)
+    return merged, stale_sections
+
+# per section: stale (last good values kept) and the API error of this cycle;
+# stale_sections maps each stale section to the API field path of its error
+def publish_fetch_status(state, base_topic, stale_sections, sections):
+    status = {}
+    for section in sections:
+        path = stale_sections.get(section)
+        status[section] = {
+            "stale": path is not None,
+            "error": state.fetch_errors.lookup(path) if path else "",
+        }
+    publish_json_as_mqtt(f"{base_topic}/{FETCH_STATUS_SECTION}", status)
+
+def publish_car_data(state, vin, car_data):
+    if car_data != state.last_car_data.get(vin):
+        log.debug("car data of %s: %s", vin, lazy_json(car_data, indent=4))
+        state.last_car_data[vin] = car_data
+    # send changed leaves as MQTT tree and/or JSON document
+    base_topic = vehicle_topic(vin, state.fleet_mode)
+    publish_section(
+        state.output_modes,
+        CAR_SECTION,
+        f"{base_topic}/getConsumerCarsV2",
+        f"{base_topic}/json/{CAR_SECTION}",
+        car_data,
+    )
+    stale_sections = {CAR_SECTION: CARS_QUERY} if state.car_data_stale else {}
+    publish_fetch_status(state, base_topic, stale_sections, [CAR_SECTION])
+
+def publish_telemetry_data(state, vin, car_telemetry_data, openwb_vin):
+    car_telemetry_data, stale_sections = merge_last_good(state, vin, car_telemetry_data)
+    if stale_sections:
+        log.info("%s: keeping last good data of %s", vin, ", ".join(stale_sections))
+    if car_telemetry_data != state.last_car_telemetry_data.get(vin):
+        log.debug("telemetry data of %s: %s", vin, lazy_json(car_telemetry_data, indent=4))
+        state.last_car_telemetry_data[vin] = car_telemetry_data
+
+    if history_store.enabled:
+        with stage_duration.time(stage="history"):
+            history_store.record(vin, car_telemetry_data)
+
+    base_topic = vehicle_topic(vin, state.fleet_mode)
+    timestamps = section_timestamps(car_telemetry_data)
+    now = time.time()
+    published_sections = []
+
+    for section, value in car_telemetry_data.items():
+        section_topic = f"{base_topic}/CarTelematicsV2/{section}"
+        timestamp = timestamps.get(section)
+        # skip flattening and diffing if the vehicle did not send a newer snapshot
+        if timestamp is not None and not topic_cache.source_advanced(section_topic, timestamp):
+            continue
+        # send changed leaves as MQTT tree and/or JSON document
+        if publish_section(
+            state.output_modes, section, section_topic, f"{base_topic}/json/{section}", value
+        ):
+            published_sections.append(section)
+
+    # charge rate, consumption and trip deltas computed from the previous sample
+    if DERIVED_METRICS:
+        publish_section(
+            state.output_modes,
+            DERIVED_SECTION,
+            f"{base_topic}/{DERIVED_SECTION}",
+            f"{base_topic}/json/{DERIVED_SECTION}",
+            derived_metrics.update(vin, car_telemetry_data),
+        )
+
+    # seconds since the vehicle produced the data of each section
+    publish_json_as_mqtt(
+        f"{base_topic}/data_age",
+        {section: max(int(now - timestamp), 0) for section, timestamp in timestamps.items()},
+    )
+    publish_fetch_status(
+        state,
+        base_topic,
+        {section: f"{TELEMATICS_QUERY}/{section}" for section in stale_sections},
+        list(car_telemetry_data),
+    )
+
+    # entity configs once per car and section (retained, so Home Assistant keeps them)
+    if HA_DISCOVERY:
+        car_data = state.last_car_data.get(vin)
+        ha_discovery.announce(
+            vin,
+            base_topic,
+            {CAR_SECTION: car_data, **car_telemetry_data},
+            lambda topic, payload: mqtt_publish(client, topic, payload),
+            car_data,
+        )
+
+    # openWB has one charge point: forward POLESTAR_VIN (or the first car in the fleet)
+    if "battery" in published_sections and OPENWB_PUBLISH and vin == openwb_vin:
+        publish_soc_to_openwb(car_telemetry_data.get('battery'))
+
+def openwb_vin_for(vins):
+    return POLESTAR_VIN or (vins[0] if vins else None)
+
+def finish_cycle():
+    stats = http_pool.stats()
+    log.info(
+        "cycle finished: %d topics published, %d unchanged topics skipped, "
+        "%d sections without new vehicle data skipped",
+        topic_cache.published, topic_cache.skipped, topic_cache.skipped_sections,
+        extra={
+            "published": topic_cache.published,
+            "skipped": topic_cache.skipped,
+            "skipped_sections": topic_cache.skipped_sections,
+            "http_requests": stats["requests"],
+            "http_connections": stats["connections"],
+            "http_reused": stats["reused"],
+        },
+    )
+
+    # timestamp for current cycle to MQTT
+    timestamp = datetime.now().astimezone(pytz.timezone(TZ)).strftime('%Y-%m-%d %H:%M:%S %Z%z')
+    mqtt_publish(client, MQTT_TIMESTAMP_TOPIC, timestamp)
+
+def next_cycle_interval(state):
+    # seconds until the next cycle (fixed POLESTAR_CYCLE unless min/max differ)
+    scheduler = state.poll_scheduler
+    interval = scheduler.next_interval(state.last_car_telemetry_data)
+    if scheduler.adaptive:
+        log.info("adaptive polling: %s", scheduler.reason)
+    return interval
+
+def fetch_cycle(state):
+    # API part of a cycle (token, car data, telemetry); safe to run in a worker thread
+    start_fetch_cycle(state)
+    ensure_access_token(state)
+    cars_data = fetch_cars_data(state)
+    return cars_data, fetch_telemetry_data(state, list(cars_data))
+
+# republish the requested subtrees even if unchanged, so the requester sees fresh messages
+def force_republish(state, targets):
+    for vin, section in targets:
+        vins = [vin] if vin else list(state.last_car_data) or [POLESTAR_VIN]
+        for base_topic in {vehicle_topic(car_vin, state.fleet_mode) for car_vin in vins}:
+            if section is None:
+                topic_cache.forget(base_topic)
+                continue
+            topic_cache.forget(f"{base_topic}/CarTelematicsV2/{section}")
+            topic_cache.forget(f"{base_topic}/json/{section}")
+            topic_cache.forget(f"{base_topic}/{section}")
+            if section == CAR_SECTION:
+                topic_cache.forget(f"{base_topic}/getConsumerCarsV2")
+
+def start_refresh(state):
+    # every cycle serves the refresh commands received until now
+    targets = refresh_trigger.start_cycle()
+    if targets:
+        force_republish(state, targets)
+
+def publish_cycle(state, cars_data, telemetry_by_vin):
+    # MQTT part of a cycle; several accounts share the broker connection and topic cache
+    start_publish_cycle(state)
+    for vin, car_data in cars_data.items():
+        publish_car_data(state, vin, car_data)
+
+    # openWB has one charge point: with several accounts only an explicit POLESTAR_VIN
+    openwb_vin = POLESTAR_VIN if state.account else openwb_vin_for(list(cars_data))
+    for vin, car_telemetry_data in telemetry_by_vin.items():
+        publish_telemetry_data(state, vin, car_telemetry_data, openwb_vin)
+
+    finish_cycle()
+
+# only complete responses are shared: a cache hit must not hide an API failure
+def fetch_result_cacheable(state):
+    return not len(state.fetch_errors) and not state.car_data_stale
+
+def store_fetch_result(state, cars_data, telemetry_by_vin):
+    if fetch_result_cacheable(state):
+        response_cache.put(cars_data, telemetry_by_vin)
+
+def cached_fetch_cycle(state):
+    # on-demand runs: recent response of another run, or one fetch for all concurrent callers
+    return response_cache.fetch(
+        lambda: fetch_cycle(state), lambda result: fetch_result_cacheable(state)
+    )
+
+def run_cycle(state, cached=False):
+    if cached:
+        cars_data, telemetry_by_vin = cached_fetch_cycle(state)
+    else:
+        cars_data, telemetry_by_vin = fetch_cycle(state)
+        store_fetch_result(state, cars_data, telemetry_by_vin)
+    publish_cycle(state, cars_data, telemetry_by_vin)
+
+# query subcommand: current data per VIN as JSON on stdout, no MQTT connection
+# (logging already goes to stderr, see default_log_stream)
+def run_query(refresh_car_data=False):
+    if refresh_car_data:
+        car_data_cache.invalidate()
+
+    state = create_gateway_state()
+    try:
+        cars_data, telemetry_by_vin = cached_fetch_cycle(state)
+    finally:
+        http_pool.close()
+    document = {
+        vin: {CAR_SECTION: car_data, "telemetry": telemetry_by_vin.get(vin, {})}
+        for vin, car_data in cars_data.items()
+    }
+    print(json.dumps(document, indent=2))
+    return document
 
 #####################################
 # MAIN
 
 # main program: init and loop forever
-def main(run_once=False):
-    print("Polestar_2_MQTT.py startet")
-    print("==========================")
-
-    access_token              = None  # current access token
-    refresh_token             = None  # current refresh token
-    expiry_time               = None  # expiry time of the current access token
-    last_car_data             = None  # cache of the last car data to detect changes
-    last_car_telemetry_data   = None  # cache of the last battery & odometer data to detect changes
+def main(run_once=False, refresh_car_data=False):
+    log.info("Polestar_2_MQTT.py startet")
+
+    if refresh_car_data:
+        car_data_cache.invalidate()
+
+    # Prometheus endpoint (no-op unless METRICS_PORT is set)
+    metrics_server.start()
+
+    if POLESTAR_ACCOUNTS_FILE:
+        # several accounts: bounded worker pool, one MQTT connection, shared API rate budget
+        states = create_account_states(load_accounts(POLESTAR_ACCOUNTS_FILE))
+        account_states[:] = states
+        if refresh_car_data:
+            for state in states:
+                state.car_data_cache.invalidate()
+        if GATEWAY_RUNTIME == "async":
+            log.warning("GATEWAY_RUNTIME=async is ignored with POLESTAR_ACCOUNTS_FILE")
+        pool = AccountPool(sys.modules[__name__], states, ACCOUNT_WORKERS, ACCOUNT_JITTER)
+        return pool.run(run_once=run_once)
+
+    if GATEWAY_RUNTIME == "async":
+        # API fetches, token refresh, MQTT and scheduler as coroutines on one event loop
+        log.info("asyncio runtime")
+        return asyncio.run(AsyncGatewayRunner(sys.modules[__name__]).run(run_once=run_once))
+
+    state = create_gateway_state()
 
     # catch SIGTERM to ensure graceful shutdown
     signal.signal(signal.SIGTERM, signal_handler)
@@ -354,62 +1287,35 @@ def main(run_once=False):
     if (OPENWB_PUBLISH):
         mqtt_connect_openwb()
 
+    # renew the access token in the background so fetches never wait for auth
+    token_refresher.start()
+
     while True:
-        # Ensure we have a valid access token (handle expiration, refresh, and full login)
-        print("ensure_valid_token()")
+        start_refresh(state)
         try:
-            access_token, expiry_time, refresh_token = auth_client.ensure_valid_token(
-                access_token,
-                expiry_time,
-                refresh_token,
-                POLESTAR_EMAIL,
-                POLESTAR_PASSWORD,
-            )
-        except AuthError as exc:
-            publish_error_and_raise(
-                "Authentication flow failed",
-                str(exc),
-                status_payload="auth_error",
-            )
-        except TokenError as exc:
-            publish_error_and_raise("Token flow failed", str(exc), status_payload="token_error")
-
-        print("get_car_data()")
-        car_data = get_car_data(POLESTAR_VIN, access_token)
-        if car_data != last_car_data:
-            print(json.dumps(car_data, indent=4))
-            last_car_data = car_data
-            # send changed JSON as MQTT tree
-            publish_json_as_mqtt(MQTT_BASE_TOPIC +"/getConsumerCarsV2", car_data)
-
-        print("get_car_telemetry_data()")
-        car_telemetry_data = get_car_telemetry_data(POLESTAR_VIN, access_token)
-        if car_telemetry_data != last_car_telemetry_data:
-            print(json.dumps(car_telemetry_data, indent=4))
-            last_car_telemetry_data = car_telemetry_data
-            # send changed JSON as MQTT tree
-            publish_json_as_mqtt(MQTT_BASE_TOPIC +"/CarTelematicsV2", car_telemetry_data)
-            if OPENWB_PUBLISH:
-                publish_soc_to_openwb(car_telemetry_data['battery'])
-
-        # timestamp for current cycle to MQTT
-        timestamp = datetime.now().astimezone(pytz.timezone(TZ)).strftime('%Y-%m-%d %H:%M:%S %Z%z')
-        client.publish(MQTT_TIMESTAMP_TOPIC, timestamp, qos=1, retain=True)
+            # runonce may be served from a recent response of another run
+            run_cycle(state, cached=run_once)
+        except ApiError as exc:
+            # no data at all yet (e.g. API down at startup): try again next cycle
+            log.error("cycle skipped: %s", exc)
+            if run_once:
+                shutdown_clients()
+                raise
 
         if run_once:
-            print("runonce requested: completed one polling cycle, shutting down")
+            log.info("runonce requested: completed one polling cycle, shutting down")
             shutdown_clients()
             return
 
-        # wait POLESTAR_CYCLE seconds, but don't block
-        print( "********************************************************************************")
-        print(f"wait for {POLESTAR_CYCLE} seconds")
-        for _ in range(int(POLESTAR_CYCLE/SLEEP_INTERVAL)):
-            time.sleep(SLEEP_INTERVAL)
+        # wait for the next cycle, an MQTT refresh command ends the wait early
+        interval = next_cycle_interval(state)
+        log.info("wait for %.0f seconds", interval)
+        if refresh_trigger.wait(interval):
+            log.info("refresh command: starting the next cycle now")
 
 # signal handler for SIGTERM
 def signal_handler(sig, frame):
-    print("SIGTERM received: stop run")
+    log.info("SIGTERM received: stop run")
     #server.shutdown() # server is undefined - reason unclear
     shutdown_clients()
     sys.exit(0)
@@ -418,16 +1324,19 @@ if __name__ == "__main__":
     # catch all exeptions in main to get tracheback output
     try:
         runtime_args = parse_runtime_args(sys.argv[1:])
-        main(run_once=runtime_args.mode == "runonce")
+        if runtime_args.mode == "query":
+            run_query(refresh_car_data=runtime_args.refresh_car_data)
+        else:
+            main(
+                run_once=runtime_args.mode == "runonce",
+                refresh_car_data=runtime_args.refresh_car_data,
+            )
     except Exception as e:
         exc_type, exc_value, exc_traceback = sys.exc_info()
         # extract last line of traceback fpr 
         line_number = traceback.extract_tb(exc_traceback)[-1][1]
-        print(f"Error  : {str(e)}")
-        print(f"in line: {line_number}")
-        print(f"type   : {exc_type.__name__}")
-        print(f"message: {exc_value}")
-        print("************** Traceback ***************")
-        print(traceback.format_exc())
+        log.critical(
+            "Error: %s (line %s, type %s)", e, line_number, exc_type.__name__, exc_info=True
+        )
 
 # ***** EOF *****
@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+
+import heapq
+import json
+import random
+import re
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from fetch_status import ApiError
+from log_setup import get_logger
+
+log = get_logger("accounts")
+
+#####################################
+# several Polestar ID accounts in one gateway
+#
+# Every account has its own GatewayState (token refresher, token store, car data cache,
+# poll schedule). The API part of a cycle runs in a bounded worker pool; the MQTT part
+# runs on the supervisor thread, so all accounts share one broker connection and topic
+# cache. API requests of all accounts draw from one RateLimiter (see post_graphql), and
+# cycles are spread over the interval with random jitter instead of starting together.
+
+ACCOUNT_NAME_PATTERN = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def load_accounts(path):
+    # [{"name", "email", "password", "vins"}, ...] from a JSON file; raises ValueError
+    with open(path, encoding="utf-8") as file:
+        entries = json.load(file)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path}: expected a non-empty JSON list of accounts")
+
+    accounts = []
+    names = set()
+    for position, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict) or not entry.get("email") or not entry.get("password"):
+            raise ValueError(f"{path}: account {position} needs email and password")
+        # the name is used in MQTT topics and file names
+        name = ACCOUNT_NAME_PATTERN.sub("_", str(entry.get("name") or entry["email"]))
+        if name in names:
+            raise ValueError(f"{path}: duplicate account name {name!r}")
+        names.add(name)
+        accounts.append({
+            "name": name,
+            "email": str(entry["email"]),
+            "password": str(entry["password"]),
+            "vins": str(entry.get("vins") or "all"),
+        })
+    return accounts
+
+
+class AccountPool:
+    #####################################
+    # setup
+
+    def __init__(self, app, states, workers=4, jitter=0.1, clock=time.monotonic, rng=None):
+        # app: the gateway module (Polestar_2_MQTT) providing config and cycle steps
+        # states: one GatewayState per account
+        # jitter: random +- fraction applied to every interval
+        self.app = app
+        self.states = states
+        self.workers = max(1, min(workers, len(states)))
+        self.jitter = jitter
+        self.clock = clock
+        self.random = rng or random.Random()
+        self.stop_event = threading.Event()
+        self._due = []  # heap of (due time, account index)
+
+    #####################################
+    # scheduling
+
+    def jittered(self, interval):
+        return max(interval * (1 + self.random.uniform(-self.jitter, self.jitter)), 0)
+
+    def schedule_initial(self, interval):
+        # spread the first cycles over one interval, so accounts do not log in together
+        now = self.clock()
+        count = len(self.states)
+        for index in range(count):
+            heapq.heappush(self._due, (now + self.jittered(interval * index / count), index))
+
+    def schedule_next(self, index):
+        interval = self.app.next_cycle_interval(self.states[index])
+        heapq.heappush(self._due, (self.clock() + self.jittered(interval), index))
+
+    def pull_forward(self):
+        # Refresh command: the accounts of the requested cars start their next cycle now
+        # (all accounts without VIN); accounts already fetching republish with that cycle.
+        targets = self.app.refresh_trigger.start_cycle()
+        requested = set()
+        for index, state in enumerate(self.states):
+            account_targets = [
+                (vin, section) for vin, section in targets
+                if vin is None or vin in state.last_car_data
+            ]
+            if account_targets:
+                self.app.force_republish(state, account_targets)
+                requested.add(index)
+        now = self.clock()
+        self._due = [
+            (min(due_at, now) if index in requested else due_at, index)
+            for due_at, index in self._due
+        ]
+        heapq.heapify(self._due)
+        log.info("refresh command: %d accounts start their cycle now", len(requested))
+
+    #####################################
+    # cycle results (supervisor thread)
+
+    def publish_status(self, state, error):
+        status = {
+            "status": "error" if error else "ok",
+            "error": error,
+            "cars": len(state.last_car_data),
+        }
+        topic = f"{self.app.MQTT_BASE_TOPIC}/accounts/{state.account}"
+        self.app.publish_json_as_mqtt(topic, status)
+
+    def finish(self, index, future):
+        state = self.states[index]
+        try:
+            cars_data, telemetry_by_vin = future.result()
+        except ApiError as exc:
+            log.error("account %s: cycle skipped: %s", state.account, exc)
+            self.publish_status(state, str(exc))
+            return
+        except Exception as exc:  # one broken account must not stop the others
+            log.exception("account %s: cycle failed", state.account)
+            self.publish_status(state, f"{type(exc).__name__}: {exc}")
+            return
+        self.app.publish_cycle(state, cars_data, telemetry_by_vin)
+        self.publish_status(state, "")
+
+    #####################################
+    # MAIN
+
+    def run_loop(self, executor, run_once):
+        pending = {}  # future -> account index
+        while not self.stop_event.is_set():
+            if not run_once and self.app.refresh_trigger.poll():
+                self.pull_forward()
+            now = self.clock()
+            while self._due and self._due[0][0] <= now and len(pending) < self.workers:
+                _, index = heapq.heappop(self._due)
+                pending[executor.submit(self.app.fetch_cycle, self.states[index])] = index
+
+            if not pending and not self._due:
+                return  # run once: every account had its cycle
+            timeout = 1.0  # upper bound, so a stop request is noticed quickly
+            if self._due and len(pending) < self.workers:
+                timeout = min(max(self._due[0][0] - now, 0), timeout)
+            if not pending:
+                self.stop_event.wait(timeout)
+                continue
+
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                self.finish(index, future)
+                if not run_once:
+                    self.schedule_next(index)
+
+    def run(self, run_once=False):
+        app = self.app
+        try:
+            signal.signal(signal.SIGTERM, lambda sig, frame: self.stop_event.set())
+        except ValueError:
+            pass  # not in the main thread
+
+        app.mqtt_connect()
+        if app.OPENWB_PUBLISH:
+            app.mqtt_connect_openwb()
+        for state in self.states:
+            state.token_refresher.start()
+        log.info("%d accounts, %d workers", len(self.states), self.workers)
+
+        self.schedule_initial(app.POLESTAR_CYCLE)
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="account")
+        try:
+            self.run_loop(executor, run_once)
+            if self.stop_event.is_set():
+                log.info("SIGTERM received: stop run")
+            else:
+                log.info("runonce requested: completed one cycle per account, shutting down")
+        finally:
+            self.stop_event.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            for state in self.states:
+                state.token_refresher.stop()
+            app.shutdown_clients()
@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+
+import asyncio
+import signal
+import time
+
+from fetch_status import ApiError
+from log_setup import get_logger
+
+log = get_logger("runtime")
+
+#####################################
+# asyncio runtime for the gateway
+#
+# The polling cycle steps of Polestar_2_MQTT.py are reused unchanged. Blocking HTTP
+# calls (requests) run in worker threads via asyncio.to_thread(), everything else -
+# scheduler, MQTT connects of both brokers and publishing - are coroutines on one
+# event loop, so a slow API call never blocks the other parts. Reconnects after a broker
+# outage are done by the MqttSupervisor of each client, like in the blocking runtime.
+
+
+class AsyncGatewayRunner:
+    #####################################
+    # setup
+
+    def __init__(
+        self, app, max_retries=20, initial_delay=1, delay_max=300, command_poll_interval=0.5
+    ):
+        # app: the gateway module (Polestar_2_MQTT) providing config and cycle steps
+        # command_poll_interval: seconds between checks for MQTT refresh commands while waiting
+        self.app = app
+        self.command_poll_interval = command_poll_interval
+        self.max_retries = max_retries
+        self.initial_delay = initial_delay
+        self.delay_max = delay_max
+        self.loop = None
+        self.stop_event = None
+
+    #####################################
+    # MQTT connection handling
+
+    async def mqtt_backoff_attempt(self, name, method):
+        # Exponential backoff like mqtt_backoff_attempt(), but sleeping on the event loop.
+        delay = self.initial_delay
+        start_time = time.time()
+
+        for attempt in range(1, self.max_retries + 1):
+            log.info("%s: attempt %d (waiting %s seconds)", name, attempt, delay)
+            await asyncio.sleep(delay)
+            try:
+                await asyncio.to_thread(method)
+            except Exception as e:
+                log.warning("%s: attempt %d failed: %s", name, attempt, e)
+                self.app.mqtt_connect_retries.inc()
+                delay = min(delay * 2, self.delay_max)
+                continue
+            log.info("%s: connected after %.2f seconds!", name, time.time() - start_time)
+            return
+
+        await asyncio.to_thread(
+            self.app.publish_error_and_raise,
+            f"    {name}: could not connect after {self.max_retries} attempts. Exiting.",
+            f"    {name}: broker down for {time.time() - start_time:.0f} seconds!",
+        )
+
+    async def connect_brokers(self):
+        # connect main broker and openWB concurrently
+        self.app.client.username_pw_set(self.app.MQTT_USER, self.app.MQTT_PASSWORD)
+        brokers = self.app.mqtt_brokers()
+        for _, mqtt_client, _ in brokers:
+            mqtt_client.on_connect = self.app.mqtt_on_connect
+            mqtt_client.on_disconnect = self.app.mqtt_on_disconnect
+            mqtt_client.on_message = self.app.mqtt_on_message
+
+        await asyncio.gather(
+            *(self.mqtt_backoff_attempt(name, connect) for name, _, connect in brokers)
+        )
+        for _, mqtt_client, _ in brokers:
+            mqtt_client.loop_start()
+            supervisor = self.app.mqtt_supervisors.get(mqtt_client)
+            if supervisor is not None:
+                supervisor.start()
+
+    #####################################
+    # polling cycle
+
+    async def run_cycle(self, state, cached=False):
+        # cached (runonce): share recent responses and concurrent fetches with other runs
+        app = self.app
+        if cached:
+            result = await asyncio.to_thread(app.cached_fetch_cycle, state)
+            app.publish_cycle(state, *result)
+            return
+
+        app.start_fetch_cycle(state)
+        await asyncio.to_thread(app.ensure_access_token, state)
+        app.start_publish_cycle(state)
+
+        cars_data = await asyncio.to_thread(app.fetch_cars_data, state)
+        vins = list(cars_data)
+        # request telemetry while the static car data is being published
+        telemetry_task = asyncio.ensure_future(
+            asyncio.to_thread(app.fetch_telemetry_data, state, vins)
+        )
+        for vin, car_data in cars_data.items():
+            app.publish_car_data(state, vin, car_data)
+            await asyncio.sleep(0)  # let reconnects and other tasks run between cars
+
+        openwb_vin = app.openwb_vin_for(vins)
+        telemetry_by_vin = await telemetry_task
+        app.store_fetch_result(state, cars_data, telemetry_by_vin)
+        for vin, car_telemetry_data in telemetry_by_vin.items():
+            app.publish_telemetry_data(state, vin, car_telemetry_data, openwb_vin)
+            await asyncio.sleep(0)
+
+        app.finish_cycle()
+
+    async def wait_cycle(self, seconds):
+        # sleep until the next cycle or a due MQTT refresh command,
+        # returns True if a shutdown was requested meanwhile
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + seconds
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            if self.app.refresh_trigger.poll():
+                log.info("refresh command: starting the next cycle now")
+                return False
+            try:
+                await asyncio.wait_for(
+                    self.stop_event.wait(), timeout=min(remaining, self.command_poll_interval)
+                )
+            except asyncio.TimeoutError:
+                continue
+            return True
+
+    #####################################
+    # MAIN
+
+    async def run(self, run_once=False):
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        try:
+            self.loop.add_signal_handler(signal.SIGTERM, self.stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # no signal support (e.g. not in main thread)
+
+        state = self.app.create_gateway_state()
+        await self.connect_brokers()
+        self.app.token_refresher.start()
+
+        try:
+            while not self.stop_event.is_set():
+                self.app.start_refresh(state)
+                try:
+                    await self.run_cycle(state, cached=run_once)
+                except ApiError as exc:
+                    # no data at all yet (e.g. API down at startup): try again next cycle
+                    log.error("cycle skipped: %s", exc)
+                    if run_once:
+                        raise
+
+                if run_once:
+                    log.info("runonce requested: completed one polling cycle, shutting down")
+                    break
+
+                interval = self.app.next_cycle_interval(state)
+                log.info("wait for %.0f seconds", interval)
+                if await self.wait_cycle(interval):
+                    log.info("SIGTERM received: stop run")
+        finally:
+            self.app.shutdown_clients()
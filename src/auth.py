@@ -4,11 +4,16 @@ import base64
 import hashlib
 import json
 import os
+import threading
 import urllib.parse
 from datetime import datetime, timedelta
 
 import requests
 
+from log_setup import get_logger
+
+log = get_logger("auth")
+
 #####################################
 # custom exceptions
 
@@ -25,11 +30,13 @@ class PolestarAuthClient:
     #####################################
     # setup
 
-    def __init__(self, id_uri, redirect_uri, client_id, tz):
+    def __init__(self, id_uri, redirect_uri, client_id, tz, http=None):
         self.id_uri = id_uri
         self.redirect_uri = redirect_uri
         self.client_id = client_id
         self.tz = tz
+        # HTTP transport with requests.get/post interface, e.g. a shared HttpSessionPool
+        self.http = http or requests
 
     #####################################
     # internal helper methods
@@ -87,7 +94,7 @@ class PolestarAuthClient:
             }
         )
         url = f"{self.id_uri}/authorization.oauth2?{params}"
-        response = requests.get(url, allow_redirects=False)
+        response = self.http.get(url, allow_redirects=False)
 
         if response.status_code not in (302, 303, 200):
             raise AuthError(
@@ -101,11 +108,11 @@ class PolestarAuthClient:
 
         path_token = self._extract_path_token(response.text)
 
-        print(f"  code_verifier  = {code_verifier}")
-        print(f"  code_challenge = {code_challenge}")
-        print(f"  cookies        = {cookies}")
-        print(f"  cookie         = {cookie}")
-        print(f"  path_token     = {path_token}")
+        log.debug("  code_verifier  = %s", code_verifier)
+        log.debug("  code_challenge = %s", code_challenge)
+        log.debug("  cookies        = %s", cookies)
+        log.debug("  cookie         = %s", cookie)
+        log.debug("  path_token     = %s", path_token)
 
         return path_token, cookie, code_verifier
 
@@ -118,7 +125,7 @@ class PolestarAuthClient:
             f"&pf.pass={urllib.parse.quote(password, safe='')}"
         )
 
-        response = requests.post(url, headers=headers, data=data, allow_redirects=False)
+        response = self.http.post(url, headers=headers, data=data, allow_redirects=False)
         if response.status_code not in (302, 303):
             raise AuthError(
                 f"perform_login(): status={response.status_code}, expected redirect after login"
@@ -127,7 +134,7 @@ class PolestarAuthClient:
         max_age = response.headers.get("Strict-Transport-Security", "")
         if "max-age=" in max_age:
             max_age = max_age.split("max-age=")[1].split(";")[0]
-        print(f"  max_age    = {max_age}")
+        log.debug("  max_age    = %s", max_age)
 
         location = response.headers.get("Location")
         if not location:
@@ -135,14 +142,14 @@ class PolestarAuthClient:
 
         uid = self._extract_query_param_from_location(location, "uid")
         code = self._extract_query_param_from_location(location, "code")
-        print(f"  uid        = {uid if uid else 'NONE'}")
-        print(f"  code       = {code if code else 'NONE'}")
+        log.debug("  uid        = %s", uid if uid else "NONE")
+        log.debug("  code       = %s", code if code else "NONE")
 
         if code is None and uid:
             # Some responses first return uid and require a follow-up submit.
-            print("   handle missing code")
+            log.info("perform_login(): handle missing code")
             follow_up_data = {"pf.submit": True, "subject": uid}
-            follow_up = requests.post(
+            follow_up = self.http.post(
                 url,
                 headers=headers,
                 data=follow_up_data,
@@ -160,7 +167,7 @@ class PolestarAuthClient:
                 raise AuthError("perform_login(): follow-up redirect missing Location header")
 
             code = self._extract_query_param_from_location(follow_up_location, "code")
-            print(f"   code = {code}")
+            log.debug("   code = %s", code)
 
         if code is None:
             raise AuthError(
@@ -180,7 +187,7 @@ class PolestarAuthClient:
             "client_id": self.client_id,
             "redirect_uri": self.redirect_uri,
         }
-        response = requests.post(url, headers=headers, data=payload)
+        response = self.http.post(url, headers=headers, data=payload)
 
         try:
             response_json = response.json()
@@ -199,20 +206,19 @@ class PolestarAuthClient:
         expires_in = response_json["expires_in"]
         expiry_time = datetime.now() + timedelta(seconds=expires_in)
 
-        print("  access_token  = " + str(access_token)[0:39] + "...")
-        print(f"  refresh_token = {refresh_token}")
-        print(f"  expires_in    = {expires_in} (seconds)")
-        print("  expiry_time   = " + expiry_time.isoformat())
+        log.debug("  access_token  = %s...", str(access_token)[0:39])
+        log.debug("  refresh_token = %s", refresh_token)
+        log.info("get_api_token(): token expires in %s seconds (%s)", expires_in, expiry_time)
 
         return access_token, expiry_time, refresh_token
 
     def get_token(self, email, password):
         # Full login flow: path token -> credential login -> token exchange.
-        print(" get_path_token()")
+        log.info("get_path_token()")
         path_token, cookie, code_verifier = self.get_path_token()
-        print(" perform_login()")
+        log.info("perform_login()")
         auth_code = self.perform_login(email, password, path_token, cookie)
-        print(" get_api_token()")
+        log.info("get_api_token()")
         return self.get_api_token(auth_code, code_verifier)
 
     def refresh_access_token(self, refresh_token):
@@ -224,7 +230,7 @@ class PolestarAuthClient:
             "refresh_token": refresh_token,
             "client_id": self.client_id,
         }
-        response = requests.post(url, headers=headers, data=payload)
+        response = self.http.post(url, headers=headers, data=payload)
 
         try:
             response_json = response.json()
@@ -243,10 +249,11 @@ class PolestarAuthClient:
         expires_in = response_json["expires_in"]
         expiry_time = datetime.now() + timedelta(seconds=expires_in)
 
-        print("  access_token  = " + str(access_token)[:39] + "...")
-        print(f"  refresh_token = {new_refresh_token}")
-        print(f"  expires_in    = {expires_in} seconds")
-        print("  expiry_time   = " + expiry_time.isoformat())
+        log.debug("  access_token  = %s...", str(access_token)[:39])
+        log.debug("  refresh_token = %s", new_refresh_token)
+        log.info(
+            "refresh_access_token(): token expires in %s seconds (%s)", expires_in, expiry_time
+        )
 
         return access_token, expiry_time, new_refresh_token
 
@@ -254,13 +261,155 @@ class PolestarAuthClient:
         # Refresh shortly before expiry; otherwise keep current token.
         if expiry_time is None or datetime.now() >= expiry_time - timedelta(seconds=15):
             if refresh_token:
-                print(" refresh_access_token()")
+                log.info("refresh_access_token()")
                 try:
                     return self.refresh_access_token(refresh_token)
                 except TokenError:
-                    print(" get_token(), refresh_access_token() failed")
+                    log.warning("get_token(), refresh_access_token() failed")
                     return self.get_token(email, password)
-            print(" get_token(), no refresh token available")
+            log.info("get_token(), no refresh token available")
             return self.get_token(email, password)
 
         return access_token, expiry_time, refresh_token
+
+
+class TokenRefresher:
+    # Owns the current token set, renews it proactively in a background thread and lets
+    # concurrent callers share one refresh (single flight) instead of refreshing in parallel.
+
+    #####################################
+    # setup
+
+    def __init__(
+        self,
+        auth_client,
+        email,
+        password,
+        refresh_fraction=0.8,
+        on_update=None,
+        retry_delay=30,
+        max_retry_delay=3600,
+        clock=datetime.now,
+    ):
+        # refresh_fraction: renew after this fraction of the token lifetime (0 = only on demand)
+        # on_update: callback(access_token, expiry_time, refresh_token) after every renewal
+        # retry_delay, max_retry_delay: backoff of failed background refreshes (doubles per
+        # failure up to the maximum, reset by the next successful refresh)
+        self.auth_client = auth_client
+        self.email = email
+        self.password = password
+        self.refresh_fraction = refresh_fraction
+        self.on_update = on_update
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.clock = clock
+        self.refresh_count = 0
+        self._tokens = (None, None, None)
+        self._issued_at = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    #####################################
+    # token state
+
+    def set_tokens(self, access_token, expiry_time, refresh_token):
+        # Adopt an existing token set, e.g. loaded from the token store.
+        self._tokens = (access_token, expiry_time, refresh_token)
+        self._issued_at = self.clock()
+
+    def _is_valid(self, margin_seconds=15):
+        access_token, expiry_time, _ = self._tokens
+        if not access_token or not isinstance(expiry_time, datetime):
+            return False
+        return self.clock() < expiry_time - timedelta(seconds=margin_seconds)
+
+    def refresh_due_at(self):
+        # Point in time for the proactive renewal (None without a usable token).
+        _, expiry_time, _ = self._tokens
+        if not isinstance(expiry_time, datetime) or self._issued_at is None:
+            return None
+        lifetime = expiry_time - self._issued_at
+        return self._issued_at + lifetime * self.refresh_fraction
+
+    #####################################
+    # refresh (single flight)
+
+    def _refresh(self, force):
+        # Only one thread refreshes; late arrivals re-check and reuse its result.
+        with self._refresh_lock:
+            if not force and self._is_valid():
+                return self._tokens
+            access_token, _, refresh_token = self._tokens
+            # expiry None makes ensure_valid_token refresh (or log in) right away
+            tokens = self.auth_client.ensure_valid_token(
+                access_token, None, refresh_token, self.email, self.password
+            )
+            self._tokens = tokens
+            self._issued_at = self.clock()
+            self.refresh_count += 1
+            if self.on_update is not None:
+                self.on_update(*tokens)
+            return tokens
+
+    def get_token(self):
+        # Current (access_token, expiry_time, refresh_token); refreshes only if expiring.
+        if self._is_valid():
+            return self._tokens
+        return self._refresh(force=False)
+
+    #####################################
+    # background thread
+
+    def retry_wait(self, failures):
+        # seconds to wait after the given number of consecutive failed background refreshes
+        return min(self.retry_delay * 2 ** (failures - 1), self.max_retry_delay)
+
+    def _run(self):
+        failures = 0
+        failed_tokens = None  # token set of the last failed refresh
+        suspended = False  # full login rejected: leave it to the next get_token()
+        while not self._stop.is_set():
+            if failed_tokens is not None and self._tokens is not failed_tokens:
+                failures, failed_tokens, suspended = 0, None, False  # renewed by a caller
+            due_at = self.refresh_due_at()
+            if suspended or due_at is None:
+                wait_seconds = self.retry_delay
+            else:
+                wait_seconds = max((due_at - self.clock()).total_seconds(), 0)
+            if self._stop.wait(wait_seconds):
+                return
+            if suspended or self.refresh_due_at() is None or self.clock() < self.refresh_due_at():
+                continue  # tokens were replaced meanwhile
+            try:
+                log.info("background token refresh")
+                self._refresh(force=True)
+                failures, failed_tokens = 0, None
+            except AuthError as exc:
+                # no background login retries: rejected credentials could lock the account
+                log.warning(
+                    "background token refresh failed, login left to the next cycle: %s", exc
+                )
+                failed_tokens, suspended = self._tokens, True
+            except (TokenError, requests.RequestException) as exc:
+                failures += 1
+                failed_tokens = self._tokens
+                retry_seconds = self.retry_wait(failures)
+                log.warning(
+                    "background token refresh failed (retry in %.0f s): %s", retry_seconds, exc
+                )
+                if self._stop.wait(retry_seconds):
+                    return
+
+    def start(self):
+        if self.refresh_fraction <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="token-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from log_setup import get_logger
+
+log = get_logger("car_data_cache")
+
+#####################################
+# TTL cache for mostly static car data (getConsumerCarsV2)
+
+
+class CarDataCache:
+    #####################################
+    # setup
+
+    def __init__(self, path, ttl, account="", query="", clock=time.time):
+        # path: JSON file for persistence across restarts (None = memory only)
+        # ttl: seconds a cached response stays valid (0 = caching disabled)
+        # query: the getConsumerCarsV2 query; data cached for another selection is ignored
+        self.path = Path(path) if path else None
+        self.ttl = ttl
+        self.account = hashlib.sha256(account.encode("utf-8")).hexdigest() if account else ""
+        self.query = hashlib.sha256(query.encode("utf-8")).hexdigest() if query else ""
+        self.clock = clock
+        self._fetched_at = None
+        self._consumer_cars = None
+        self._loaded = False
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    #####################################
+    # persistence
+
+    def _load_file(self):
+        # read the persisted cache once; a missing or foreign file (other account or field
+        # selection) is ignored
+        self._loaded = True
+        if self.path is None or not self.path.is_file():
+            return
+
+        try:
+            cached = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as exc:
+            log.warning("could not read %s: %s", self.path, exc)
+            return
+
+        if not isinstance(cached, dict) or cached.get("account") != self.account:
+            return
+        if cached.get("query", "") != self.query:
+            return
+        if not isinstance(cached.get("consumer_cars"), list):
+            return
+        self._fetched_at = cached.get("fetched_at")
+        self._consumer_cars = cached["consumer_cars"]
+
+    def _save_file(self):
+        if self.path is None:
+            return
+
+        payload = {
+            "account": self.account,
+            "query": self.query,
+            "fetched_at": self._fetched_at,
+            "consumer_cars": self._consumer_cars,
+        }
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            tmp_path.write_text(json.dumps(payload), encoding="utf-8")
+            os.replace(tmp_path, self.path)  # atomic: never leave a half-written cache
+        except OSError as exc:
+            log.warning("could not write %s: %s", self.path, exc)
+
+    #####################################
+    # cache API
+
+    def get(self):
+        # Cached getConsumerCarsV2 list, or None if disabled, missing or older than ttl.
+        if not self.enabled:
+            return None
+        if not self._loaded:
+            self._load_file()
+        if self._consumer_cars is None or not isinstance(self._fetched_at, (int, float)):
+            return None
+        if self.clock() - self._fetched_at >= self.ttl:
+            return None
+        return self._consumer_cars
+
+    def last(self):
+        # Cached getConsumerCarsV2 list regardless of its age (fallback while the API fails).
+        if not self._loaded:
+            self._load_file()
+        return self._consumer_cars
+
+    def put(self, consumer_cars):
+        if not self.enabled:
+            return
+        self._loaded = True
+        self._fetched_at = self.clock()
+        self._consumer_cars = consumer_cars
+        self._save_file()
+
+    def invalidate(self):
+        # Force a refresh with the next get(), e.g. on demand or when a VIN is unknown.
+        self._loaded = True
+        self._fetched_at = None
+        self._consumer_cars = None
+        if self.path is not None:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as exc:
+                log.warning("could not remove %s: %s", self.path, exc)
+
+    def age(self):
+        # seconds since the cached data was fetched (None without cached data)
+        if self._fetched_at is None:
+            return None
+        return self.clock() - self._fetched_at
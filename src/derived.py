@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+
+from scheduler import is_charging
+from telemetry import entry_timestamp, section_entries
+
+#####################################
+# derived metrics (charge rate, consumption, trip deltas)
+#
+# Updated incrementally per VIN from the previous battery/odometer sample only, so
+# nothing has to be re-read from the history. Values without a basis yet are None.
+
+MIN_TRIP_KM = 1.0  # shorter trips give meaningless consumption figures
+
+
+def _first_entry(car_telemetry_data, wanted_section):
+    for section, entry in section_entries(car_telemetry_data):
+        if section == wanted_section:
+            return entry
+    return None
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+class _VehicleState:
+    # last samples of one car and the running trip (since charging stopped)
+    def __init__(self):
+        self.battery = None  # (timestamp, soc, range_km)
+        self.odometer = None  # (timestamp, odometer_m)
+        self.trip_distance_m = 0
+        self.trip_soc_used = 0.0
+        self.values = {}
+
+
+class DerivedMetrics:
+    #####################################
+    # setup
+
+    def __init__(self, battery_capacity_kwh=0):
+        # battery_capacity_kwh: usable capacity for the kWh figures (0 = only %-based values)
+        self.battery_capacity_kwh = battery_capacity_kwh
+        self._vehicles = {}
+
+    def _kwh(self, percent):
+        if percent is None or not self.battery_capacity_kwh:
+            return None
+        return round(percent * self.battery_capacity_kwh / 100, 2)
+
+    #####################################
+    # incremental update steps
+
+    def _update_battery(self, vehicle, values, battery, charging):
+        timestamp = entry_timestamp(battery)
+        soc = _number(battery.get("batteryChargeLevelPercentage"))
+        range_km = _number(battery.get("estimatedDistanceToEmptyKm"))
+        if timestamp is None or soc is None:
+            return
+        previous = vehicle.battery
+        if previous is not None and timestamp <= previous[0]:
+            return  # no new vehicle sample: keep the last values
+        vehicle.battery = (timestamp, soc, range_km)
+
+        if previous is not None:
+            hours = (timestamp - previous[0]) / 3600
+            rate = (soc - previous[1]) / hours
+            values["charge_rate_percent_per_hour"] = round(rate, 2)
+            values["charge_power_kw"] = self._kwh(rate)
+            if not charging and soc < previous[1]:
+                vehicle.trip_soc_used += previous[1] - soc
+
+        # what the car's own range estimate implies for the remaining energy
+        if range_km:
+            energy_kwh = self._kwh(soc)
+            values["estimated_consumption_kwh_per_100km"] = (
+                round(energy_kwh / range_km * 100, 1) if energy_kwh is not None else None
+            )
+
+        values["full_charge_at"] = None
+        values["full_charge_in_minutes"] = None
+        if charging:
+            minutes = _number(battery.get("estimatedChargingTimeToFullMinutes"))
+            rate = values.get("charge_rate_percent_per_hour")
+            if not minutes and rate and rate > 0:
+                minutes = (100 - soc) / rate * 60  # projection from the measured rate
+            if minutes:
+                values["full_charge_in_minutes"] = round(minutes)
+                values["full_charge_at"] = int(timestamp + minutes * 60)
+
+    def _update_odometer(self, vehicle, values, odometer):
+        timestamp = entry_timestamp(odometer)
+        odometer_m = _number(odometer.get("odometerMeters"))
+        if timestamp is None or odometer_m is None:
+            return
+        previous = vehicle.odometer
+        if previous is not None and timestamp <= previous[0]:
+            return
+        vehicle.odometer = (timestamp, odometer_m)
+
+        if previous is not None:
+            distance_m = max(odometer_m - previous[1], 0)
+            values["distance_since_last_sample_km"] = round(distance_m / 1000, 3)
+            vehicle.trip_distance_m += distance_m
+
+    #####################################
+    # API
+
+    def update(self, vin, car_telemetry_data):
+        # Derived values of one car after a new telemetry document (dict for MQTT).
+        vehicle = self._vehicles.setdefault(vin, _VehicleState())
+        values = vehicle.values
+        charging = is_charging(car_telemetry_data)
+
+        if charging:
+            # plugged in: the next drive starts a new trip
+            vehicle.trip_distance_m = 0
+            vehicle.trip_soc_used = 0.0
+
+        battery = _first_entry(car_telemetry_data, "battery")
+        if battery is not None:
+            self._update_battery(vehicle, values, battery, charging)
+        odometer = _first_entry(car_telemetry_data, "odometer")
+        if odometer is not None:
+            self._update_odometer(vehicle, values, odometer)
+
+        trip_km = vehicle.trip_distance_m / 1000
+        values["trip_distance_km"] = round(trip_km, 3)
+        values["trip_soc_used_percent"] = round(vehicle.trip_soc_used, 1)
+        values["trip_energy_kwh"] = self._kwh(vehicle.trip_soc_used)
+        values["trip_consumption_kwh_per_100km"] = None
+        if trip_km >= MIN_TRIP_KM and values["trip_energy_kwh"] is not None:
+            values["trip_consumption_kwh_per_100km"] = round(
+                values["trip_energy_kwh"] / trip_km * 100, 1
+            )
+        return dict(values)
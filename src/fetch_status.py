@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+
+import threading
+
+#####################################
+# GraphQL response handling for a partial-failure tolerant fetch pipeline
+#
+# A failed query raises ApiError for that query only; GraphQL field errors (e.g. one
+# telematics section) are collected per field path, so the cycle can keep the last
+# good values of just the affected sections and carry on.
+
+
+class ApiError(Exception):
+    # a whole query failed: HTTP error, network error, invalid JSON or no data at all
+    def __init__(self, query, message, status_code=None):
+        super().__init__(f"{query}: {message}")
+        self.query = query
+        self.status_code = status_code
+
+
+def graphql_errors(response_json, default_path=""):
+    # GraphQL "errors" as {field path: message}, e.g. {"carTelematicsV2/battery/0": "..."};
+    # errors without a path are reported under default_path
+    errors = {}
+    if not isinstance(response_json, dict):
+        return errors
+
+    for error in response_json.get("errors") or []:
+        if isinstance(error, dict):
+            path = "/".join(str(part) for part in error.get("path") or [])
+            message = str(error.get("message") or error)
+        else:
+            path, message = "", str(error)
+        path = path or default_path
+        errors[path] = f"{errors[path]}; {message}" if path in errors else message
+    return errors
+
+
+def query_result(query, response):
+    # (data of the query field, field errors) of a GraphQL response;
+    # raises ApiError if the query did not deliver any data
+    try:
+        response_json = response.json()
+    except ValueError:
+        response_json = None
+    errors = graphql_errors(response_json, query)
+    details = "; ".join(errors.values())
+
+    if response.status_code != 200:
+        raise ApiError(
+            query,
+            f"HTTP {response.status_code}" + (f": {details}" if details else ""),
+            response.status_code,
+        )
+    if not isinstance(response_json, dict):
+        raise ApiError(query, "invalid JSON response", response.status_code)
+
+    data = (response_json.get("data") or {}).get(query)
+    if data is None:
+        raise ApiError(query, details or "no data in response", response.status_code)
+    return data, errors
+
+
+class FetchErrors:
+    # error messages of the current cycle per query and per query field path
+
+    def __init__(self):
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def start_cycle(self):
+        with self._lock:
+            self._errors = {}
+
+    def add(self, path, message):
+        with self._lock:
+            self._errors[path] = message
+
+    def update(self, errors):
+        with self._lock:
+            self._errors.update(errors)
+
+    def lookup(self, path):
+        # Messages for path, its parents (whole query) and its children (e.g. list entries).
+        with self._lock:
+            return "; ".join(
+                message
+                for error_path, message in sorted(self._errors.items())
+                if error_path == path
+                or path.startswith(error_path + "/")
+                or error_path.startswith(path + "/")
+            )
+
+    def __len__(self):
+        return len(self._errors)
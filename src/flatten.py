@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+
+import json
+import math
+import re
+
+#####################################
+# scalar encoding without a json.dumps round trip
+
+
+def _encode_float(value):
+    # json.dumps uses float.__repr__ and spells non-finite values like JavaScript
+    if math.isfinite(value):
+        return repr(value).encode("ascii")
+    if math.isnan(value):
+        return b"NaN"
+    return b"Infinity" if value > 0 else b"-Infinity"
+
+
+_SCALAR_ENCODERS = {
+    str: lambda value: value.encode("utf-8"),  # strings are published unquoted
+    bool: lambda value: b"true" if value else b"false",
+    int: lambda value: str(value).encode("ascii"),
+    float: _encode_float,
+    type(None): lambda value: b"null",
+}
+
+
+def encode_scalar(value):
+    # Encode a JSON leaf as MQTT payload bytes, matching the former json.dumps output.
+    encoder = _SCALAR_ENCODERS.get(type(value))
+    if encoder is None:
+        return json.dumps(value).encode("utf-8")
+    return encoder(value)
+
+#####################################
+# topic paths derived from the GraphQL queries
+
+_QUERY_TOKEN = re.compile(r"[A-Za-z_]\w*|[{}]|\([^)]*\)")
+
+
+def query_field_paths(query):
+    # Return the leaf field paths selected below the root field of a GraphQL query, e.g.
+    # ("battery", "timestamp", "seconds") for carTelematicsV2 { battery { timestamp { seconds } } }
+    if not query or "{" not in query:
+        return []
+
+    paths = []
+    stack = []
+    last_field = None
+    for token in _QUERY_TOKEN.findall(query[query.index("{") + 1:]):
+        if token == "{":
+            stack.append(last_field)
+            last_field = None
+        elif token == "}":
+            if last_field is not None and stack:
+                paths.append(tuple(stack[1:]) + (last_field,))
+            last_field = None
+            if not stack:
+                break
+            stack.pop()
+        elif token.startswith("("):
+            continue
+        else:
+            if last_field is not None and stack:
+                paths.append(tuple(stack[1:]) + (last_field,))
+            last_field = token
+
+    return paths
+
+
+class TopicPathCache:
+    # Memo of "parent/key" topic strings so hot paths reuse one string object per topic.
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self._topics = {}
+
+    def join(self, parent, key):
+        cache_key = (parent, key)
+        topic = self._topics.get(cache_key)
+        if topic is None:
+            topic = f"{parent}/{key}"
+            if len(self._topics) < self.max_entries:
+                self._topics[cache_key] = topic
+        return topic
+
+    def precompile(self, base_topic, paths):
+        # Warm the memo with every prefix of the known schema paths below base_topic.
+        for path in paths:
+            parent = base_topic
+            for key in path:
+                parent = self.join(parent, key)
+
+    def __len__(self):
+        return len(self._topics)
+
+#####################################
+# non-recursive flattening engine
+
+
+def iter_mqtt_leaves(base_topic, json_obj, topic_paths=None):
+    # Yield (topic, payload_bytes) for every leaf of json_obj in document order:
+    # dict keys and list indices become topic levels below base_topic.
+    join = topic_paths.join if topic_paths is not None else "{}/{}".format
+
+    if not isinstance(json_obj, (dict, list)):
+        yield base_topic, encode_scalar(json_obj)
+        return
+
+    stack = [(base_topic, iter(json_obj.items() if isinstance(json_obj, dict)
+                               else enumerate(json_obj)))]
+    while stack:
+        parent, items = stack[-1]
+        for key, value in items:
+            topic = join(parent, key)
+            if isinstance(value, dict):
+                stack.append((topic, iter(value.items())))
+                break
+            if isinstance(value, list):
+                stack.append((topic, enumerate(value)))
+                break
+            yield topic, encode_scalar(value)
+        else:
+            stack.pop()
@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+
+import os
+import re
+
+from log_setup import get_logger
+
+log = get_logger("graphql_schema")
+
+#####################################
+# minimal reader for the GraphQL schema (SDL) of the Polestar API
+#
+# Only what the gateway needs: the fields of every object/input type and the enum values,
+# to look up the type of a field selected in a query. Unknown types or fields resolve to
+# None (graphql_schema.gql predates e.g. carTelematicsV2), callers fall back to the data.
+
+SCALARS = ("String", "Int", "Float", "Boolean", "ID")
+_DEFINITION = re.compile(r"^(type|input|interface|enum)\s+(\w+)[^{]*\{(.*?)\}", re.M | re.S)
+_FIELD = re.compile(r"^\s*(\w+)\s*(?:\([^)]*\))?\s*:\s*([\[\]\w!]+)", re.M)
+_ENUM_VALUE = re.compile(r"^\s*(\w+)\s*$", re.M)
+
+
+def named_type(type_ref):
+    # "[VehicleInformation!]!" -> "VehicleInformation"
+    return type_ref.strip("[]!") if type_ref else None
+
+
+class GraphQLSchema:
+    _parsed = {}  # (path, mtime, size) -> GraphQLSchema, parsed once per process
+
+    #####################################
+    # setup
+
+    def __init__(self, types=None, enums=None):
+        self.types = types or {}  # type name -> {field name: type reference, e.g. "[String!]!"}
+        self.enums = enums or {}  # enum name -> list of values
+
+    @classmethod
+    def parse(cls, text):
+        types, enums = {}, {}
+        for kind, name, body in _DEFINITION.findall(text):
+            if kind == "enum":
+                enums[name] = _ENUM_VALUE.findall(body)
+            else:
+                types[name] = dict(_FIELD.findall(body))
+        return cls(types, enums)
+
+    @classmethod
+    def load(cls, path):
+        # schema from an SDL file, parsed once until the file changes;
+        # an unreadable file gives an empty schema
+        try:
+            stat = os.stat(path)
+            cache_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+            if cache_key in cls._parsed:
+                return cls._parsed[cache_key]
+            with open(path, encoding="utf-8") as file:
+                schema = cls.parse(file.read())
+        except OSError as exc:
+            log.warning("could not read GraphQL schema %s: %s", path, exc)
+            return cls()
+        cls._parsed[cache_key] = schema
+        log.info(
+            "GraphQL schema %s: %d types, %d enums", path, len(schema.types), len(schema.enums)
+        )
+        return schema
+
+    #####################################
+    # lookups
+
+    def field_type(self, root_field, path):
+        # Named type of a field below a root query field, e.g.
+        # ("getConsumerCarsV2", ("vin",)) -> "String"; None if the schema does not know it.
+        type_ref = self.types.get("Query", {}).get(root_field)
+        for field in path:
+            fields = self.types.get(named_type(type_ref))
+            if fields is None:
+                return None
+            type_ref = fields.get(field)
+        return named_type(type_ref)
+
+    def is_enum(self, type_name):
+        return type_name in self.enums
@@ -0,0 +1,232 @@
+#!/usr/bin/python3
+
+import json
+import re
+
+from flatten import query_field_paths
+from graphql_schema import SCALARS
+from log_setup import get_logger
+
+log = get_logger("ha_discovery")
+
+#####################################
+# Home Assistant MQTT discovery
+#
+# One retained config per entity under <prefix>/<component>/polestar_<vin>/<object>/config,
+# generated from the leaves selected in the GraphQL queries. Field types come from the
+# GraphQL schema, or from the received value where the schema does not know the field.
+# Every entity reads the compact JSON document of its section (<base>/json/<section>),
+# so Home Assistant processes one message per section instead of one per leaf.
+
+# (field name suffix, unit, device class), first match wins
+UNIT_RULES = (
+    ("KwhPer100Km", "kWh/100km", None),
+    ("KmPerHour", "km/h", "speed"),
+    ("Percentage", "%", None),
+    ("Km", "km", "distance"),
+    ("Meters", "m", "distance"),
+    ("Minutes", "min", "duration"),
+    ("Watts", "W", "power"),
+    ("Amps", "A", "current"),
+)
+NUMBER_TYPES = ("Int", "Float")
+SKIPPED_FIELDS = ("vin", "nanos")  # device identifier, sub-second part of timestamps
+_CAMEL_CASE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+
+def sample_value(document, path):
+    # value at path in a section document (lists: first entry), None if missing
+    value = document
+    for key in path:
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def value_type(value):
+    # GraphQL scalar name of a received value (fallback for fields unknown to the schema)
+    if isinstance(value, bool):
+        return "Boolean"
+    if isinstance(value, int):
+        return "Int"
+    if isinstance(value, float):
+        return "Float"
+    return "String"
+
+
+def unit_rule(field):
+    # (unit, device class) from the field name, e.g. "distanceToServiceKm" -> ("km", ...)
+    for suffix, unit, device_class in UNIT_RULES:
+        if field.endswith(suffix):
+            return unit, device_class
+    if field.startswith("days"):
+        return "d", "duration"
+    return None
+
+
+def field_name(field):
+    # "batteryChargeLevelPercentage" -> "Battery charge level percentage"
+    return _CAMEL_CASE.sub(" ", field).lower().capitalize()
+
+
+def query_sections(root_field, query, section=None):
+    # {section: (root field, schema path, leaf paths)} of the fields selected in a query;
+    # without section, the first level below the root field names the sections
+    # (carTelematicsV2 { battery { ... } odometer { ... } })
+    paths = query_field_paths(query)
+    if section is not None:
+        return {section: (root_field, (), paths)}
+    sections = {}
+    for path in paths:
+        if len(path) > 1:
+            sections.setdefault(path[0], (root_field, (path[0],), []))[2].append(path[1:])
+    return sections
+
+
+class HomeAssistantDiscovery:
+    #####################################
+    # setup
+
+    def __init__(self, prefix, schema, availability_topic, sections, diagnostic=()):
+        # sections: {section: (GraphQL root field, schema path of the section, leaf paths)},
+        # e.g. {"battery": ("carTelematicsV2", ("battery",), [("chargingStatusV2",), ...])}
+        # diagnostic: sections shown as diagnostic entities (e.g. the static car data)
+        self.prefix = prefix
+        self.schema = schema
+        self.availability_topic = availability_topic
+        self.sections = sections
+        self.diagnostic = diagnostic
+        self._announced = set()  # (vin, section) with published configs
+        self._config_topics = {}  # (vin, section) -> config topics published last
+
+    def reset(self):
+        # publish all configs again, e.g. after the broker lost its retained messages
+        self._announced.clear()
+
+    def update_sections(self, sections):
+        # adopt the sections of changed queries (e.g. fields dropped at runtime): every
+        # section is announced again, configs of entities that are gone get deleted
+        if sections == self.sections:
+            return
+        self.sections = sections
+        self._announced.clear()
+
+    #####################################
+    # config generation
+
+    def field_type(self, root_field, schema_path, value):
+        type_name = self.schema.field_type(root_field, schema_path)
+        if type_name in SCALARS or self.schema.is_enum(type_name):
+            return type_name
+        if value is None and unit_rule(schema_path[-1]) is not None:
+            return "Float"  # not sent yet, but the field name carries a unit
+        return value_type(value)
+
+    def entity(self, vin, section, path, type_name, state_topic, device):
+        # (component, object id, config) of one leaf
+        object_id = "_".join((section,) + path)
+        config = {
+            "name": field_name(path[-1]),
+            "unique_id": f"polestar_{vin}_{object_id}",
+            "state_topic": state_topic,
+            "availability_topic": self.availability_topic,
+            "device": device,
+        }
+        template = "value_json." + ".".join(path)
+
+        if path[-2:] == ("timestamp", "seconds"):
+            config["name"] = f"{field_name(section)} updated"
+            config["device_class"] = "timestamp"
+            config["value_template"] = (
+                "{{ (%s | int) | timestamp_custom('%%Y-%%m-%%dT%%H:%%M:%%S+00:00', false) }}"
+                % template
+            )
+            return "sensor", object_id, config
+        if type_name == "Boolean":
+            config["value_template"] = "{{ 'ON' if %s else 'OFF' }}" % template
+            return "binary_sensor", object_id, config
+
+        config["value_template"] = "{{ %s }}" % template
+        if type_name in NUMBER_TYPES:
+            config["state_class"] = (
+                "total_increasing" if "odometer" in path[-1].lower() else "measurement"
+            )
+            unit, device_class = unit_rule(path[-1]) or (None, None)
+            if unit:
+                config["unit_of_measurement"] = unit
+            if unit == "%" and "battery" in path[-1].lower():
+                device_class = "battery"
+            if device_class:
+                config["device_class"] = device_class
+        return "sensor", object_id, config
+
+    def configs(self, vin, base_topic, documents, car_data=None):
+        # [(config topic, config)] for the sections in documents ({section: data})
+        car_data = car_data or {}
+        device = {
+            "identifiers": [f"polestar_{vin}"],
+            "name": f"{car_data.get('modelName') or 'Polestar'} {vin}",
+            "manufacturer": "Polestar",
+            "serial_number": vin,
+        }
+        if car_data.get("modelName"):
+            device["model"] = car_data["modelName"]
+
+        configs = []
+        for section, document in documents.items():
+            if section not in self.sections or not document:
+                continue
+            root_field, schema_prefix, paths = self.sections[section]
+            for path in paths:
+                if path[-1] in SKIPPED_FIELDS:
+                    continue
+                type_name = self.field_type(
+                    root_field, schema_prefix + path, sample_value(document, path)
+                )
+                component, object_id, config = self.entity(
+                    vin, section, path, type_name, f"{base_topic}/json/{section}", device
+                )
+                # entity id suggested to Home Assistant (replaces the deprecated object_id)
+                config["default_entity_id"] = f"{component}.polestar_{vin}_{object_id}".lower()
+                if section in self.diagnostic:
+                    config["entity_category"] = "diagnostic"
+                topic = f"{self.prefix}/{component}/polestar_{vin}/{object_id}/config"
+                configs.append((topic, config))
+        return configs
+
+    #####################################
+    # publishing
+
+    def announce(self, vin, base_topic, documents, publish, car_data=None):
+        # publish the configs of sections not announced yet and delete the configs of entities
+        # no longer selected (empty retained payload); returns the number of configs
+        count = 0
+        for section, document in documents.items():
+            if (vin, section) in self._announced or section not in self.sections or not document:
+                continue
+            topics = set()
+            for topic, config in self.configs(vin, base_topic, {section: document}, car_data):
+                publish(topic, json.dumps(config, separators=(",", ":")))
+                topics.add(topic)
+            count += len(topics)
+            self._delete(publish, self._config_topics.get((vin, section), set()) - topics)
+            self._config_topics[(vin, section)] = topics
+            self._announced.add((vin, section))
+
+        # sections without any selected field left
+        for key in [key for key in self._config_topics if key[0] == vin]:
+            if key[1] not in self.sections:
+                self._delete(publish, self._config_topics.pop(key))
+
+        if count:
+            log.info("Home Assistant discovery: %d entities for %s", count, vin)
+        return count
+
+    def _delete(self, publish, topics):
+        for topic in sorted(topics):
+            publish(topic, "")
+        if topics:
+            log.info("Home Assistant discovery: removed %d entities", len(topics))
@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+
+import argparse
+import json
+import sqlite3
+import sys
+import threading
+import time
+
+from log_setup import get_logger
+from telemetry import entry_timestamp, section_entries
+
+log = get_logger("history")
+
+#####################################
+# append-only time-series store for telemetry snapshots (SQLite)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    vin     TEXT NOT NULL,
+    section TEXT NOT NULL,
+    ts      REAL NOT NULL,
+    data    TEXT NOT NULL,
+    UNIQUE (vin, section, ts)
+);
+"""
+MAINTENANCE_INTERVAL = 3600  # seconds between downsampling/retention runs
+
+
+class HistoryStore:
+    #####################################
+    # setup
+
+    def __init__(
+        self,
+        path,
+        retention_days=0,
+        raw_days=7,
+        downsample_interval=900,
+        clock=time.time,
+    ):
+        # retention_days: samples older than this are deleted (0 = store disabled)
+        # raw_days: samples younger than this keep full resolution, older ones are reduced
+        #           to the first sample per downsample_interval seconds
+        self.path = path
+        self.retention_days = retention_days
+        self.raw_days = raw_days
+        self.downsample_interval = downsample_interval
+        self.clock = clock
+        self.recorded = 0
+        self._connection = None
+        self._last_maintenance = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.path) and self.retention_days > 0
+
+    #####################################
+    # internal helper methods
+
+    def _connect(self):
+        if self._connection is None:
+            # shared by the cycle thread and queries; WAL lets other processes read meanwhile
+            self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def _maintain(self, connection, now):
+        # downsample old samples and apply the retention period (at most once an hour)
+        if self._last_maintenance is not None:
+            if now - self._last_maintenance < MAINTENANCE_INTERVAL:
+                return
+        self._last_maintenance = now
+
+        expired = connection.execute(
+            "DELETE FROM samples WHERE ts < ?", (now - self.retention_days * 86400,)
+        ).rowcount
+        downsampled = 0
+        if self.downsample_interval > 0:
+            downsampled = connection.execute(
+                """
+                DELETE FROM samples
+                WHERE ts < :cutoff AND EXISTS (
+                    SELECT 1 FROM samples AS earlier
+                    WHERE earlier.vin = samples.vin
+                      AND earlier.section = samples.section
+                      AND earlier.ts >= CAST(samples.ts / :bucket AS INTEGER) * :bucket
+                      AND earlier.ts < samples.ts
+                )
+                """,
+                {"cutoff": now - self.raw_days * 86400, "bucket": self.downsample_interval},
+            ).rowcount
+        if expired or downsampled:
+            log.info(
+                "history: %d expired and %d downsampled samples removed", expired, downsampled
+            )
+
+    #####################################
+    # store API
+
+    def record(self, vin, car_telemetry_data):
+        # Append every section entry of one telemetry document; returns the number of new
+        # samples (a section whose vehicle timestamp did not advance is stored only once).
+        if not self.enabled:
+            return 0
+
+        now = self.clock()
+        rows = []
+        for section, entry in section_entries(car_telemetry_data):
+            timestamp = entry_timestamp(entry)
+            data = {key: value for key, value in entry.items() if key not in ("vin", "timestamp")}
+            rows.append(
+                (
+                    entry.get("vin") or vin,
+                    section,
+                    timestamp if timestamp is not None else now,
+                    json.dumps(data, separators=(",", ":")),
+                )
+            )
+
+        with self._lock:
+            try:
+                connection = self._connect()
+                with connection:
+                    before = connection.total_changes
+                    connection.executemany(
+                        "INSERT OR IGNORE INTO samples (vin, section, ts, data) "
+                        "VALUES (?, ?, ?, ?)",
+                        rows,
+                    )
+                    added = connection.total_changes - before
+                    self._maintain(connection, now)
+            except sqlite3.Error as exc:
+                log.warning("history: could not record samples in %s: %s", self.path, exc)
+                return 0
+
+        self.recorded += added
+        return added
+
+    def query(self, vin, section, start=None, end=None, fields=None, limit=None):
+        # Samples of one VIN/section as [{"timestamp": ts, field: value, ...}] in time order.
+        # start/end: unix seconds (inclusive), fields: subset of the section fields.
+        sql = "SELECT ts, data FROM samples WHERE vin = ? AND section = ?"
+        params = [vin, section]
+        if start is not None:
+            sql += " AND ts >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND ts <= ?"
+            params.append(end)
+        sql += " ORDER BY ts"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+
+        samples = []
+        for timestamp, data in rows:
+            values = json.loads(data)
+            if fields is not None:
+                values = {field: values.get(field) for field in fields}
+            samples.append({"timestamp": timestamp, **values})
+        return samples
+
+    def latest(self, vin, section):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT ts, data FROM samples WHERE vin = ? AND section = ? "
+                "ORDER BY ts DESC LIMIT 1",
+                (vin, section),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"timestamp": row[0], **json.loads(row[1])}
+
+    def vins(self):
+        with self._lock:
+            rows = self._connect().execute("SELECT DISTINCT vin FROM samples ORDER BY vin")
+            return [vin for (vin,) in rows]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+#####################################
+# command line export, e.g. a charging curve of the last day as JSON lines:
+#   python history_store.py /local-files/history.sqlite battery --vin VIN --since 86400
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export telemetry history as JSON lines")
+    parser.add_argument("path", help="history database (HISTORY_PATH)")
+    parser.add_argument("section", help="telemetry section, e.g. battery, odometer, health")
+    parser.add_argument("--vin", help="VIN (default: every VIN in the store)")
+    parser.add_argument("--since", type=float, help="only samples of the last SINCE seconds")
+    parser.add_argument("--fields", help="comma-separated fields (default: all)")
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.path, retention_days=1)
+    start = time.time() - args.since if args.since else None
+    fields = [field.strip() for field in args.fields.split(",")] if args.fields else None
+    try:
+        for vin in [args.vin] if args.vin else store.vins():
+            for sample in store.query(vin, args.section, start=start, fields=fields):
+                sys.stdout.write(json.dumps({"vin": vin, **sample}) + "\n")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
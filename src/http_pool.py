@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+
+import threading
+import urllib.parse
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+#####################################
+# pooled keep-alive HTTP sessions
+
+
+class HttpSessionPool:
+    #####################################
+    # setup
+
+    def __init__(self, pool_size=4, retries=3, backoff_factor=0.5, timeout=30):
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.retried = 0  # retries urllib3 needed for requests that got a response
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    #####################################
+    # internal helper methods
+
+    def _create_session(self):
+        # One keep-alive session per host; connection errors and 429/5xx on idempotent
+        # methods are retried by urllib3, POST requests are only retried before sending.
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        # stay stateless like module-level requests calls: the auth flow sets cookies explicitly
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    def session_for(self, url):
+        # Return the shared session for the host of url, creating it on first use.
+        host = urllib.parse.urlparse(url).netloc
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._create_session()
+                self._sessions[host] = session
+            return session
+
+    #####################################
+    # request API (drop-in for requests.get/post)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session_for(url).request(method, url, **kwargs)
+        retries = getattr(getattr(response, "raw", None), "retries", None)
+        if retries is not None and retries.history:
+            with self._lock:
+                self.retried += len(retries.history)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    #####################################
+    # statistics and shutdown
+
+    def stats(self):
+        # Sum urllib3 pool counters: every request beyond a new connection reused one.
+        connections = 0
+        requests_sent = 0
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    connections += pool.num_connections
+                    requests_sent += pool.num_requests
+
+        return {
+            "hosts": len(sessions),
+            "connections": connections,
+            "requests": requests_sent,
+            "reused": max(requests_sent - connections, 0),
+            "retried": self.retried,
+        }
+
+    def close(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
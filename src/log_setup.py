@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+
+import json
+import logging
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+#####################################
+# structured, level-gated logging (JSON lines or plain text)
+
+LOGGER_NAME = "polestar2mqtt"
+LOG_FORMATS = ("json", "text")
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+# attributes every LogRecord has; everything else was passed via extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "suppressed",
+}
+
+
+def get_logger(name):
+    # per-module logger below the gateway root logger, e.g. "polestar2mqtt.auth"
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+class lazy_json:
+    # Defers json.dumps() until the record is actually formatted, so payload dumps cost
+    # nothing unless their level (usually DEBUG) is enabled.
+    def __init__(self, obj, indent=None):
+        self.obj = obj
+        self.indent = indent
+
+    def __str__(self):
+        return json.dumps(self.obj, indent=self.indent, default=str)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, "suppressed", 0):
+            text += f" (repeated {record.suppressed} times since last report)"
+        return text
+
+
+class RateLimitFilter(logging.Filter):
+    #####################################
+    # setup
+
+    def __init__(self, interval, clock=time.monotonic, max_keys=1000):
+        # interval: seconds an identical message (logger, level, rendered text) stays muted
+        # (0 = off); max_keys: remembered messages before expired ones are forgotten
+        super().__init__()
+        self.interval = interval
+        self.clock = clock
+        self.max_keys = max_keys
+        self._last_emitted = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    #####################################
+    # filter API
+
+    def filter(self, record):
+        # DEBUG output is opt-in and meant to be complete, so it is never rate limited
+        if self.interval <= 0 or record.levelno <= logging.DEBUG:
+            return True
+
+        # rendered text: one template (e.g. "%s: %s") serves many different messages
+        key = (record.name, record.levelno, record.getMessage())
+        now = self.clock()
+        with self._lock:
+            last = self._last_emitted.get(key)
+            if last is not None and now - last < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False
+            if len(self._last_emitted) >= self.max_keys:
+                self._forget_expired(now)
+            self._last_emitted[key] = now
+            record.suppressed = self._suppressed.pop(key, 0)
+        return True
+
+    def _forget_expired(self, now):
+        # messages with values in their text would otherwise accumulate forever
+        for key, last in list(self._last_emitted.items()):
+            if now - last >= self.interval:
+                del self._last_emitted[key]
+                self._suppressed.pop(key, None)
+
+
+def setup_logging(level="INFO", log_format="json", rate_limit=60, stream=None):
+    # Configure the gateway root logger once; later calls replace its handler.
+    log_format = log_format.strip().lower()
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"invalid LOG_FORMAT {log_format!r}, expected one of {LOG_FORMATS}")
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+    handler.addFilter(RateLimitFilter(rate_limit))
+
+    logger = logging.getLogger(LOGGER_NAME)
+    for old_handler in list(logger.handlers):
+        logger.removeHandler(old_handler)
+    logger.addHandler(handler)
+    logger.setLevel(level.strip().upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    return logger
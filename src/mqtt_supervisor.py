@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+
+import threading
+import time
+from collections import OrderedDict
+
+import paho.mqtt.client as mqtt
+
+from log_setup import get_logger
+
+log = get_logger("mqtt")
+
+#####################################
+# bounded outbound queue with coalescing
+
+
+class OutboundQueue:
+    #####################################
+    # setup
+
+    def __init__(self, maxsize=5000):
+        # maxsize: topics kept while the broker is unreachable (oldest topic is dropped first)
+        self.maxsize = maxsize
+        self.coalesced = 0
+        self.dropped = 0
+        self._messages = OrderedDict()  # topic -> (payload, qos, retain)
+        self._lock = threading.Lock()
+
+    #####################################
+    # queue API
+
+    def put(self, topic, payload, qos, retain, first=False):
+        # latest value per topic wins; a newer value moves the topic to the end of the queue
+        # (first: to the front, sent before everything else)
+        with self._lock:
+            if topic in self._messages:
+                del self._messages[topic]
+                self.coalesced += 1
+            elif len(self._messages) >= self.maxsize:
+                self._messages.popitem(last=False)
+                self.dropped += 1
+            self._messages[topic] = (payload, qos, retain)
+            if first:
+                self._messages.move_to_end(topic, last=False)
+
+    def discard(self, topic):
+        # forget a queued value that a newer direct publish replaced
+        with self._lock:
+            self._messages.pop(topic, None)
+
+    def pop(self):
+        # oldest queued (topic, payload, qos, retain) or None
+        with self._lock:
+            if not self._messages:
+                return None
+            topic, (payload, qos, retain) = self._messages.popitem(last=False)
+            return topic, payload, qos, retain
+
+    def __len__(self):
+        return len(self._messages)
+
+#####################################
+# reconnect supervisor
+
+
+class MqttSupervisor:
+    # Reconnects one paho client from its own thread (never from paho's callback thread)
+    # and buffers publishes while the broker is away. The client has to be created with
+    # reconnect_on_failure=False, so paho's network thread ends on a connection loss and
+    # the supervisor is the only one reconnecting.
+
+    #####################################
+    # setup
+
+    def __init__(
+        self,
+        name,
+        mqtt_client,
+        queue_size=5000,
+        drain_rate=100,
+        initial_delay=1,
+        delay_max=300,
+    ):
+        # drain_rate: queued messages sent per second after a reconnect (0 = unlimited)
+        self.name = name
+        self.client = mqtt_client
+        self.queue = OutboundQueue(queue_size)
+        self.drain_rate = drain_rate
+        self.initial_delay = initial_delay
+        self.delay_max = delay_max
+        self.connected = False
+        self.reconnects = 0
+        self._disconnected = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    #####################################
+    # paho callbacks (network thread: only flip state and wake the supervisor)
+
+    def on_connect(self):
+        self.connected = True
+        self._disconnected = False
+        self._wake.set()
+
+    def on_disconnect(self):
+        self.connected = False
+        if self._stop.is_set():
+            return  # shutdown
+        log.warning("%s: connection lost, reconnecting in the background", self.name)
+        self._disconnected = True
+        self._wake.set()
+
+    #####################################
+    # publish API
+
+    def publish(self, topic, payload, qos, retain):
+        # Send directly while connected and nothing is queued, otherwise queue (coalesced).
+        if self.connected and not len(self.queue):
+            result = self.client.publish(topic, payload, qos=qos, retain=retain)
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                return result
+        self.queue.put(topic, payload, qos, retain)
+        self._wake.set()
+        return None
+
+    def publish_now(self, topic, payload, qos, retain):
+        # Send ahead of the queue, e.g. the online status from on_connect; a queued older
+        # value of the topic is dropped. If sending fails, the message goes to the front.
+        self.queue.discard(topic)
+        result = self.client.publish(topic, payload, qos=qos, retain=retain)
+        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            return result
+        self.queue.put(topic, payload, qos, retain, first=True)
+        self._wake.set()
+        return None
+
+    #####################################
+    # supervisor thread
+
+    def reconnect(self):
+        # one reconnect attempt: restart paho's network thread on the new connection
+        self.client.loop_stop()
+        self.client.reconnect()
+        self.client.loop_start()
+
+    def _reconnect_with_backoff(self):
+        delay = self.initial_delay
+        start_time = time.time()
+        attempt = 0
+        while not self._stop.is_set():
+            attempt += 1
+            log.info("%s: reconnect attempt %d (waiting %s seconds)", self.name, attempt, delay)
+            if self._stop.wait(delay):
+                return
+            try:
+                self.reconnect()
+            except Exception as exc:
+                log.warning("%s: reconnect attempt %d failed: %s", self.name, attempt, exc)
+                delay = min(delay * 2, self.delay_max)
+                continue
+            self.reconnects += 1
+            self._disconnected = False
+            log.info(
+                "%s: reconnected after %.2f seconds", self.name, time.time() - start_time
+            )
+            return
+
+    def _drain(self):
+        # send queued messages at drain_rate so a reconnect does not cause a publish storm
+        interval = 1 / self.drain_rate if self.drain_rate > 0 else 0
+        sent = 0
+        while self.connected and not self._stop.is_set():
+            message = self.queue.pop()
+            if message is None:
+                break
+            topic, payload, qos, retain = message
+            result = self.client.publish(topic, payload, qos=qos, retain=retain)
+            if result.rc != mqtt.MQTT_ERR_SUCCESS:
+                self.queue.put(topic, payload, qos, retain)  # connection lost meanwhile
+                break
+            sent += 1
+            if interval and self._stop.wait(interval):
+                break
+        if sent:
+            log.info("%s: sent %d queued messages, %d left", self.name, sent, len(self.queue))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(1)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            if self._disconnected and not self.connected:
+                self._reconnect_with_backoff()
+            elif self.connected and len(self.queue):
+                self._drain()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"mqtt-supervisor-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
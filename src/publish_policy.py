@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+
+from paho.mqtt.client import topic_matches_sub
+
+#####################################
+# QoS/retain policy per topic subtree
+
+_BOOLEAN_VALUES = {
+    "true": True, "yes": True, "1": True, "retain": True,
+    "false": False, "no": False, "0": False, "noretain": False,
+}
+
+
+def parse_policy_rules(spec):
+    # "pattern=qos:retain;..." -> [(pattern, qos, retain)], e.g. "data_age/#=0:false"
+    # patterns use MQTT wildcards (+, #) and are relative to MQTT_BASE_TOPIC
+    rules = []
+    for item in spec.split(";"):
+        if not item.strip():
+            continue
+        pattern, separator, setting = item.partition("=")
+        qos_text, _, retain_text = setting.partition(":")
+        try:
+            qos = int(qos_text)
+            retain = _BOOLEAN_VALUES[(retain_text or "true").strip().lower()]
+        except (ValueError, KeyError):
+            raise ValueError(f"invalid MQTT publish policy rule '{item.strip()}'") from None
+        if not separator or not pattern.strip() or qos not in (0, 1, 2):
+            raise ValueError(f"invalid MQTT publish policy rule '{item.strip()}'")
+        rules.append((pattern.strip(), qos, retain))
+    return rules
+
+
+class PublishPolicy:
+    #####################################
+    # setup
+
+    def __init__(self, base_topic, rules=(), default_qos=1, default_retain=True):
+        self.base_prefix = f"{base_topic}/"
+        self.rules = list(rules)
+        self.default = (default_qos, default_retain)
+        self._cache = {}
+
+    #####################################
+    # lookup
+
+    def lookup(self, topic):
+        # (qos, retain) of the first matching rule; topics outside MQTT_BASE_TOPIC (openWB)
+        # are matched with their full name
+        policy = self._cache.get(topic)
+        if policy is not None:
+            return policy
+
+        relative = topic[len(self.base_prefix):] if topic.startswith(self.base_prefix) else topic
+        policy = next(
+            ((qos, retain) for pattern, qos, retain in self.rules
+             if topic_matches_sub(pattern, relative)),
+            self.default,
+        )
+        self._cache[topic] = policy
+        return policy
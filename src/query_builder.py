@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+
+import ast
+import logging
+import re
+import threading
+
+from flatten import query_field_paths
+from graphql_schema import SCALARS
+from log_setup import get_logger
+
+log = get_logger("query_builder")
+
+#####################################
+# GraphQL queries assembled from a configurable field list
+#
+# A query template (src/graphql_queries.py or a local override) provides the operation
+# header, the root field call and the default fields; a field list narrows the selection
+# to the data actually consumed. The selection is checked once against the GraphQL schema,
+# and fields the server rejects ("Cannot query field ...") are dropped at runtime instead
+# of failing the whole query every cycle.
+
+REJECTED_FIELD = re.compile(r"Cannot query field \W*(\w+)\W* on type \W*(\w+)")
+UNKNOWN_FIELD = "not in the GraphQL schema"  # kept: graphql_schema.gql may be outdated
+_OPERATION = re.compile(r"^\s*(?:query|mutation)\s+(\w+)")
+_INDENT = "    "
+
+
+def read_query_constants(path):
+    # {name: query string} of the module-level string constants of a Python file;
+    # the file is parsed, not executed ("""...""".strip() is supported)
+    with open(path, encoding="utf-8") as file:
+        tree = ast.parse(file.read(), filename=str(path))
+
+    constants = {}
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        value = node.value
+        strip = (
+            isinstance(value, ast.Call) and isinstance(value.func, ast.Attribute)
+            and value.func.attr == "strip" and not value.args and not value.keywords
+        )
+        if strip:
+            value = value.func.value
+        if not isinstance(value, ast.Constant) or not isinstance(value.value, str):
+            continue
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                constants[target.id] = value.value.strip() if strip else value.value
+    return constants
+
+
+def parse_field_list(spec):
+    # "battery, odometer.odometerMeters" -> [("battery",), ("odometer", "odometerMeters")]
+    return [
+        tuple(part.strip() for part in entry.split("."))
+        for entry in (spec or "").split(",")
+        if entry.strip()
+    ]
+
+
+def select_fields(default_paths, selection):
+    # Leaf paths for a field list: an entry selects every default leaf below it (e.g. a whole
+    # section), an entry unknown to the template is requested as given; empty = all defaults.
+    if not selection:
+        return list(default_paths)
+    paths = []
+    for entry in selection:
+        matches = [path for path in default_paths if path[:len(entry)] == entry]
+        for path in matches or [entry]:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def add_required(paths, required):
+    # Add the required paths the selection lacks, each before the first path sharing its parent;
+    # "*" stands for every section (first level) of the selection, e.g. ("*", "vin").
+    paths = list(paths)
+    for pattern in required:
+        if pattern[0] == "*":
+            sections = dict.fromkeys(path[0] for path in paths if len(path) > 1)
+            expanded = [(section,) + pattern[1:] for section in sections]
+        else:
+            expanded = [pattern]
+        for path in expanded:
+            if path in paths:
+                continue
+            parent = path[:-1]
+            position = next(
+                (index for index, other in enumerate(paths) if other[:len(parent)] == parent),
+                len(paths),
+            )
+            paths.insert(position, path)
+    return paths
+
+
+def render_selection(paths, depth):
+    # nested GraphQL selection set of the leaf paths, in their order
+    tree = {}
+    for path in paths:
+        node = tree
+        for field in path:
+            node = node.setdefault(field, {})
+
+    def render(node, depth):
+        lines = []
+        for field, children in node.items():
+            indent = _INDENT * depth
+            if children:
+                lines.append(f"{indent}{field} {{")
+                lines.extend(render(children, depth + 1))
+                lines.append(f"{indent}}}")
+            else:
+                lines.append(f"{indent}{field}")
+        return lines
+
+    return render(tree, depth)
+
+
+class QueryBuilder:
+    #####################################
+    # setup
+
+    def __init__(self, template, fields="", schema=None, required=(), known_gaps=()):
+        # template: complete GraphQL query whose header, root field and fields are reused
+        # fields: comma separated field list (dotted paths below the root field), "" = all
+        # schema: GraphQLSchema for the startup validation (None = no validation)
+        # required: paths selected whatever the field list says, e.g. ("*", "vin")
+        # known_gaps: paths expected to be missing from the schema (e.g. of the built-in
+        # queries), logged at DEBUG instead of WARNING
+        if "{" not in template:
+            raise ValueError("GraphQL query template without selection set")
+        self.header = template[:template.index("{")].strip()
+        operation = _OPERATION.match(self.header)
+        self.operation = operation.group(1) if operation else None
+        root_call = template[template.index("{") + 1:].split("{", 1)[0].strip()
+        self.root_call = root_call
+        self.root_field = re.match(r"\w+", root_call).group(0)
+        self.schema = schema
+        self.paths = add_required(
+            select_fields(query_field_paths(template), parse_field_list(fields)), required
+        )
+        self.known_gaps = set(known_gaps)
+        self.dropped = {}  # path -> reason
+        self.problems = None  # validation result, computed once
+        self._query = None
+        self._lock = threading.Lock()
+
+    #####################################
+    # schema lookups
+
+    def type_at(self, path):
+        # named type of the field at path below the root field, None if unknown
+        if self.schema is None:
+            return None
+        return self.schema.field_type(self.root_field, path)
+
+    def check(self, path):
+        # None if path is a valid leaf selection, else the problem
+        type_name = self.type_at(())
+        for depth, field in enumerate(path):
+            if type_name in SCALARS or self.schema.is_enum(type_name):
+                return f"{'.'.join(path[:depth])} is a {type_name} without sub-fields"
+            fields = self.schema.types.get(type_name)
+            if fields is None:
+                return None  # type unknown to the schema: cannot be checked
+            if field not in fields:
+                return UNKNOWN_FIELD
+            type_name = self.type_at(path[:depth + 1])
+        if type_name in self.schema.types:
+            return f"{type_name} needs a selection of sub-fields"
+        return None
+
+    #####################################
+    # validation and field dropping
+
+    def validate(self):
+        # Check the selection against the schema once; invalid fields are dropped, fields
+        # the schema does not know are kept (the server decides). Returns {path: problem}.
+        if self.problems is not None:
+            return self.problems
+        self.problems = {}
+        if self.type_at(()) is None:
+            log.info(
+                "%s: not in the GraphQL schema, %d fields requested unchecked",
+                self.root_field, len(self.paths),
+            )
+            return self.problems
+
+        for path in self.paths:
+            problem = self.check(path)
+            if problem is not None:
+                self.problems[path] = problem
+        unknown = [path for path, problem in self.problems.items() if problem == UNKNOWN_FIELD]
+        for level, paths in (
+            (logging.DEBUG, [path for path in unknown if path in self.known_gaps]),
+            (logging.WARNING, [path for path in unknown if path not in self.known_gaps]),
+        ):
+            if paths:
+                log.log(
+                    level, "%s: fields not in the GraphQL schema, requested anyway: %s",
+                    self.root_field, ", ".join(".".join(path) for path in paths),
+                )
+        invalid = {
+            path: problem for path, problem in self.problems.items() if problem != UNKNOWN_FIELD
+        }
+        self.drop(invalid)
+        return self.problems
+
+    def drop(self, reasons):
+        # remove the paths in reasons ({path: reason}); never drops the last field
+        with self._lock:
+            remaining = [path for path in self.paths if path not in reasons]
+            dropped = [path for path in self.paths if path in reasons]
+            if not dropped or not remaining:
+                return []
+            self.paths = remaining
+            self._query = None
+            for path in dropped:
+                self.dropped[path] = reasons[path]
+        for path in dropped:
+            log.warning("%s: dropped field %s: %s", self.root_field, ".".join(path), reasons[path])
+        return dropped
+
+    def drop_rejected(self, message):
+        # Drop the fields a server error message rejects ('Cannot query field "x" on type
+        # "Y"'); returns the dropped paths, empty if the message names none of them.
+        reasons = {}
+        for field, type_name in REJECTED_FIELD.findall(message):
+            for path in self.paths:
+                for depth, name in enumerate(path):
+                    parent = self.type_at(path[:depth])
+                    if name == field and parent in (type_name, None):
+                        # a rejected object field takes all leaves below it along
+                        reasons[path] = f"rejected by the server on type {type_name}"
+                        break
+        return self.drop(reasons)
+
+    #####################################
+    # query and payload
+
+    def query(self):
+        with self._lock:
+            if self._query is None:
+                lines = [f"{self.header} {{", f"{_INDENT}{self.root_call} {{"]
+                lines.extend(render_selection(self.paths, 2))
+                lines.extend([f"{_INDENT}}}", "}"])
+                self._query = "\n".join(lines)
+            return self._query
+
+    def payload(self, variables):
+        return {
+            "query": self.query(),
+            "operationName": self.operation,
+            "variables": variables,
+        }
@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+
+import threading
+import time
+
+#####################################
+# shared request budget (token bucket) for all threads and accounts
+
+
+class RateLimiter:
+    #####################################
+    # setup
+
+    def __init__(self, rate_per_minute, burst=1, clock=time.monotonic, sleep=time.sleep):
+        # rate_per_minute: sustained requests per minute of all callers together (0 = no limit)
+        # burst: requests that may be sent back to back after an idle period
+        self.rate = rate_per_minute / 60
+        self.burst = max(burst, 1)
+        self.clock = clock
+        self.sleep = sleep
+        self.waited = 0.0  # seconds callers spent waiting for the budget
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    #####################################
+    # budget API
+
+    def acquire(self):
+        # Take one request from the budget and wait for its slot; returns the seconds waited.
+        # Slots are reserved under the lock, so concurrent callers are served in order.
+        if not self.enabled:
+            return 0
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self._tokens + (now - self._updated) * self.rate, self.burst)
+            self._updated = now
+            self._tokens -= 1
+            wait_seconds = -self._tokens / self.rate if self._tokens < 0 else 0
+            self.waited += wait_seconds
+        if wait_seconds:
+            self.sleep(wait_seconds)
+        return wait_seconds
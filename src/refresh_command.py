@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+import re
+import threading
+import time
+
+#####################################
+# on-demand refresh via MQTT command topic
+#
+# <base>/command/refresh              everything
+# <base>/command/refresh/<VIN>        one car (fleet mode)
+# <base>/command/refresh/<section>    one section of every car, e.g. battery
+# <base>/command/refresh/<VIN>/<section>
+#
+# A request ends the wait for the next polling cycle early. Requests are debounced (a
+# burst of commands becomes one cycle) and rate-limited (at most one cycle per
+# min_interval seconds); the targets are republished even if their values are unchanged.
+
+VIN_PATTERN = re.compile(r"^[A-HJ-NPR-Z0-9]{17}$")  # ISO 3779: no I, O, Q
+ALL_TARGETS = (None, None)
+
+
+def parse_refresh_target(subtopic):
+    # (vin, section) from the topic levels below .../command/refresh; None = all
+    parts = [part for part in subtopic.split("/") if part]
+    if not parts:
+        return ALL_TARGETS
+    if len(parts) == 1:
+        if VIN_PATTERN.match(parts[0]):
+            return parts[0], None
+        return None, parts[0]
+    return parts[0], "/".join(parts[1:])
+
+
+class RefreshTrigger:
+    #####################################
+    # setup
+
+    def __init__(self, debounce=2, min_interval=60, clock=time.monotonic):
+        # debounce: seconds to collect further requests after the first one
+        # min_interval: seconds between two cycles started by requests
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self.clock = clock
+        self.requested = 0  # refresh commands received
+        self.triggered = 0  # cycles started early by commands
+        self._targets = set()
+        self._requested_at = None
+        self._last_cycle = None
+        self._condition = threading.Condition()
+
+    #####################################
+    # requests (MQTT network thread)
+
+    def request(self, target=ALL_TARGETS):
+        with self._condition:
+            self.requested += 1
+            self._targets.add(target)
+            if self._requested_at is None:
+                self._requested_at = self.clock()
+            self._condition.notify_all()
+
+    #####################################
+    # polling loop
+
+    def _due_in(self):
+        # seconds until a requested refresh may start (<= 0: now), None without request
+        if self._requested_at is None:
+            return None
+        due_at = self._requested_at + self.debounce
+        if self._last_cycle is not None:
+            due_at = max(due_at, self._last_cycle + self.min_interval)
+        return due_at - self.clock()
+
+    def poll(self):
+        # True if a requested refresh is due now (non-blocking variant of wait)
+        with self._condition:
+            return self._poll()
+
+    def _poll(self):
+        due_in = self._due_in()
+        if due_in is None or due_in > 0:
+            return False
+        self.triggered += 1
+        return True
+
+    def wait(self, timeout):
+        # Block up to timeout seconds; True if a requested refresh is due earlier.
+        deadline = self.clock() + timeout
+        with self._condition:
+            while True:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    return False
+                if self._poll():
+                    return True
+                due_in = self._due_in()
+                self._condition.wait(remaining if due_in is None else min(remaining, due_in))
+
+    def start_cycle(self):
+        # Targets requested until now (every cycle serves them), empty without request.
+        with self._condition:
+            targets = self._targets
+            self._targets = set()
+            self._requested_at = None
+            self._last_cycle = self.clock()
+            return targets
@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from log_setup import get_logger
+
+log = get_logger("response_cache")
+
+#####################################
+# recent-response cache shared by all gateway processes (runonce, query, loop)
+#
+# The result of a full fetch (car data and telemetry per VIN) is kept in a JSON file.
+# Callers that accept data up to max_age seconds old are served from the file; if it is
+# too old, the first caller fetches while concurrent callers (threads and processes)
+# wait on a lock file and then reuse its result, so a burst costs one API round trip.
+
+
+class ResponseCache:
+    #####################################
+    # setup
+
+    def __init__(self, path, max_age, key="", clock=time.time):
+        # path: shared JSON file, e.g. under /local-files ("" = caching disabled)
+        # max_age: seconds a response may be served to on-demand callers (0 = disabled)
+        # key: account and VIN selection; a file written for another key is ignored
+        self.path = Path(path) if path else None
+        self.max_age = max_age
+        self.key = hashlib.sha256(key.encode("utf-8")).hexdigest() if key else ""
+        self.clock = clock
+        self.hits = 0       # callers served from the cache file
+        self.coalesced = 0  # callers that waited for another caller's fetch
+        self.fetches = 0    # upstream fetches through fetch()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.path is not None and self.max_age > 0
+
+    #####################################
+    # persistence
+
+    def _read(self):
+        if not self.path.is_file():
+            return None
+        try:
+            cached = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as exc:
+            log.warning("could not read %s: %s", self.path, exc)
+            return None
+        if not isinstance(cached, dict) or cached.get("key") != self.key:
+            return None
+        if not isinstance(cached.get("fetched_at"), (int, float)):
+            return None
+        if not all(isinstance(cached.get(part), dict) for part in ("cars", "telemetry")):
+            return None
+        return cached
+
+    @contextmanager
+    def _file_lock(self):
+        # exclusive lock across processes, held while one caller fetches
+        lock_path = self.path.with_name(self.path.name + ".lock")
+        try:
+            lock_file = open(lock_path, "a")
+        except OSError as exc:
+            log.warning("could not open %s, fetching without coalescing: %s", lock_path, exc)
+            yield
+            return
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    #####################################
+    # cache API
+
+    def get(self):
+        # (cars_data, telemetry_by_vin) if younger than max_age seconds, else None
+        if not self.enabled:
+            return None
+        cached = self._read()
+        if cached is None:
+            return None
+        age = self.clock() - cached["fetched_at"]
+        if age < 0 or age >= self.max_age:
+            return None
+        log.debug("response cache: serving data of %.0f seconds ago", age)
+        return cached["cars"], cached["telemetry"]
+
+    def put(self, cars_data, telemetry_by_vin):
+        if not self.enabled:
+            return
+        payload = {
+            "key": self.key,
+            "fetched_at": self.clock(),
+            "cars": cars_data,
+            "telemetry": telemetry_by_vin,
+        }
+        # unique temp file: several processes may write at the same time
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            tmp_path.write_text(json.dumps(payload), encoding="utf-8")
+            os.replace(tmp_path, self.path)  # atomic: readers never see a half-written file
+        except OSError as exc:
+            log.warning("could not write %s: %s", self.path, exc)
+
+    def fetch(self, fetch, cacheable=lambda result: True):
+        # Cached result if fresh enough, otherwise fetch() once for all concurrent callers.
+        # fetch returns (cars_data, telemetry_by_vin); cacheable decides if it is stored.
+        if not self.enabled:
+            return fetch()
+        cached = self.get()
+        if cached is not None:
+            self.hits += 1
+            log.info("response cache: served recent response")
+            return cached
+
+        with self._lock, self._file_lock():
+            # another thread or process may have fetched while we waited for the lock
+            cached = self.get()
+            if cached is not None:
+                self.coalesced += 1
+                log.info("response cache: served response fetched by a concurrent run")
+                return cached
+            self.fetches += 1
+            result = fetch()
+            if cacheable(result):
+                self.put(*result)
+            return result
@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+
+from telemetry import section_entries, section_timestamps
+
+#####################################
+# adaptive polling interval
+
+# chargingStatusV2 values that mean energy is flowing into the battery right now
+CHARGING_STATUSES = frozenset({"CHARGING_STATUS_CHARGING", "CHARGING_STATUS_SMART_CHARGING"})
+
+
+def is_charging(car_telemetry_data):
+    # Charging if chargingStatusV2 says so, or (without status) a time to full is estimated.
+    for section, entry in section_entries(car_telemetry_data):
+        if section != "battery":
+            continue
+        status = entry.get("chargingStatusV2")
+        if status in CHARGING_STATUSES:
+            return True
+        minutes_to_full = entry.get("estimatedChargingTimeToFullMinutes")
+        if status is None and isinstance(minutes_to_full, (int, float)) and minutes_to_full > 0:
+            return True
+    return False
+
+
+class AdaptivePollScheduler:
+    #####################################
+    # setup
+
+    def __init__(self, default_interval, min_interval=None, max_interval=None, backoff=2.0):
+        # min_interval while charging, default_interval while vehicle data keeps changing,
+        # exponential backoff up to max_interval while the car sleeps (stale timestamps)
+        self.default_interval = default_interval
+        self.min_interval = min(min_interval or default_interval, default_interval)
+        self.max_interval = max(max_interval or default_interval, default_interval)
+        self.backoff = backoff
+        self.interval = default_interval
+        self.reason = "default"
+        self._last_timestamps = {}
+
+    @property
+    def adaptive(self):
+        return (
+            self.min_interval != self.default_interval
+            or self.max_interval != self.default_interval
+        )
+
+    #####################################
+    # interval calculation
+
+    def next_interval(self, telemetry_by_vin):
+        # Return the seconds to wait before the next cycle, based on the latest telemetry per VIN.
+        charging = False
+        advanced = False
+        for vin, car_telemetry_data in (telemetry_by_vin or {}).items():
+            charging = charging or is_charging(car_telemetry_data)
+            newest = max(section_timestamps(car_telemetry_data).values(), default=None)
+            if newest is not None and newest > self._last_timestamps.get(vin, 0):
+                # first sample of a VIN counts as fresh, too
+                advanced = True
+                self._last_timestamps[vin] = newest
+
+        if charging:
+            self.interval, self.reason = self.min_interval, "charging"
+        elif advanced:
+            self.interval, self.reason = self.default_interval, "data changed"
+        else:
+            self.interval = min(
+                max(self.interval, self.default_interval) * self.backoff, self.max_interval
+            )
+            self.reason = "idle"
+        return self.interval
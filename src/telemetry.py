@@ -0,0 +1,44 @@
+#!/usr/bin/python3
+
+#####################################
+# helpers for carTelematicsV2 documents
+#
+# A section (health, battery, odometer) is either one dict or a list with one
+# entry per VIN, depending on how the API answered the batched request.
+
+
+def section_entries(car_telemetry_data):
+    # Yield (section, entry) for every dict entry of a telemetry document.
+    for section, value in (car_telemetry_data or {}).items():
+        if isinstance(value, dict):
+            yield section, value
+        elif isinstance(value, list):
+            for entry in value:
+                if isinstance(entry, dict):
+                    yield section, entry
+
+
+def entry_timestamp(entry):
+    # Vehicle-side timestamp { seconds nanos } of a section entry as float seconds (or None).
+    timestamp = entry.get("timestamp") if isinstance(entry, dict) else None
+    if not isinstance(timestamp, dict):
+        return None
+
+    try:
+        seconds = float(timestamp.get("seconds") or 0)
+        nanos = float(timestamp.get("nanos") or 0)
+    except (TypeError, ValueError):
+        return None
+    if not seconds and not nanos:
+        return None
+    return seconds + nanos / 1e9
+
+
+def section_timestamps(car_telemetry_data):
+    # Newest vehicle-side timestamp per section.
+    timestamps = {}
+    for section, entry in section_entries(car_telemetry_data):
+        timestamp = entry_timestamp(entry)
+        if timestamp is not None and timestamp > timestamps.get(section, 0):
+            timestamps[section] = timestamp
+    return timestamps
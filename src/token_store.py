@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+import base64
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from log_setup import get_logger
+
+log = get_logger("token_store")
+
+#####################################
+# encrypted persistent token store
+
+
+class TokenStore:
+    #####################################
+    # setup
+
+    def __init__(self, path, secret, account=""):
+        # path: encrypted token file, e.g. under /local-files
+        # secret: passphrase for the file key (TOKEN_STORE_KEY), the store is off without it
+        self.path = Path(path)
+        self.secret = secret or ""
+        self.account = hashlib.sha256(account.encode("utf-8")).hexdigest() if account else ""
+
+    @property
+    def enabled(self):
+        return bool(self.secret)
+
+    #####################################
+    # internal helper methods
+
+    def _fernet(self, salt):
+        # scrypt stretches the passphrase; a fresh salt is stored with every file
+        key = hashlib.scrypt(
+            self.secret.encode("utf-8"), salt=salt, n=2**14, r=8, p=1, dklen=32
+        )
+        return Fernet(base64.urlsafe_b64encode(key))
+
+    #####################################
+    # store API
+
+    def load(self):
+        # Return (access_token, expiry_time, refresh_token) or None if missing/unusable.
+        if not self.enabled or not self.path.is_file():
+            return None
+
+        try:
+            stored = json.loads(self.path.read_text(encoding="utf-8"))
+            salt = base64.b64decode(stored["salt"])
+            plain = self._fernet(salt).decrypt(stored["token"].encode("ascii"))
+            tokens = json.loads(plain)
+        except (OSError, ValueError, KeyError, TypeError, InvalidToken) as exc:
+            log.warning("ignoring unreadable %s (%s)", self.path, type(exc).__name__)
+            return None
+
+        if tokens.get("account") != self.account:
+            log.warning("stored tokens belong to another account")
+            return None
+
+        try:
+            expiry_time = datetime.fromisoformat(tokens["expiry_time"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        return tokens.get("access_token"), expiry_time, tokens.get("refresh_token")
+
+    def save(self, access_token, expiry_time, refresh_token):
+        # Encrypt and replace the token file atomically (readable by the owner only).
+        if not self.enabled:
+            return
+
+        salt = os.urandom(16)
+        plain = json.dumps(
+            {
+                "account": self.account,
+                "access_token": access_token,
+                "expiry_time": expiry_time.isoformat() if expiry_time else None,
+                "refresh_token": refresh_token,
+            }
+        ).encode("utf-8")
+        stored = {
+            "version": 1,
+            "salt": base64.b64encode(salt).decode("ascii"),
+            "token": self._fernet(salt).encrypt(plain).decode("ascii"),
+        }
+
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+                json.dump(stored, tmp_file)
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            log.warning("could not write %s: %s", self.path, exc)
+
+    def clear(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            log.warning("could not remove %s: %s", self.path, exc)
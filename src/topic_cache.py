@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+
+import threading
+import time
+
+#####################################
+# per-topic last-value cache for delta publishing
+
+
+class TopicValueCache:
+    #####################################
+    # setup
+
+    def __init__(self, full_refresh_interval=0, clock=time.monotonic):
+        # full_refresh_interval: seconds between cycles that republish every topic (0 = never)
+        self.full_refresh_interval = full_refresh_interval
+        self.clock = clock
+        self.full_refresh = False
+        self.published = 0
+        self.skipped = 0
+        self.skipped_sections = 0
+        self._values = {}
+        self._source_timestamps = {}
+        self._last_full_refresh = {}  # cycle key (e.g. account) -> time of its last full refresh
+        self._lock = threading.Lock()
+
+    #####################################
+    # cycle handling
+
+    def start_cycle(self, key=""):
+        # Reset per-cycle counters and decide whether this cycle republishes everything.
+        # key: whose cycle this is; accounts sharing the cache keep their own full refresh
+        # interval, so one account's full refresh does not postpone the others'.
+        now = self.clock()
+        self.published = 0
+        self.skipped = 0
+        self.skipped_sections = 0
+        last = self._last_full_refresh.get(key)
+        self.full_refresh = (
+            self.full_refresh_interval > 0
+            and last is not None
+            and now - last >= self.full_refresh_interval
+        )
+        if self.full_refresh or last is None:
+            self._last_full_refresh[key] = now
+        return self.full_refresh
+
+    def changed(self, topic, payload):
+        # True if payload has to be published; remembers it as the last value of topic.
+        with self._lock:
+            if not self.full_refresh and self._values.get(topic) == payload:
+                self.skipped += 1
+                return False
+            self._values[topic] = payload
+            self.published += 1
+            return True
+
+    def source_advanced(self, key, timestamp):
+        # True if the vehicle-side timestamp of a subtree (e.g. one telematics section)
+        # moved on since it was last published; unchanged subtrees can be skipped entirely.
+        with self._lock:
+            if not self.full_refresh and timestamp <= self._source_timestamps.get(key, 0):
+                self.skipped_sections += 1
+                return False
+            self._source_timestamps[key] = timestamp
+            return True
+
+    def clear(self):
+        # Forget all values, e.g. after a broker reconnect, so the next cycle republishes.
+        with self._lock:
+            self._values.clear()
+            self._source_timestamps.clear()
+
+    def forget(self, prefix):
+        # Forget the values of one subtree, so its topics are republished in the next cycle.
+        subtree = prefix + "/"
+        with self._lock:
+            for values in (self._values, self._source_timestamps):
+                for topic in [topic for topic in values if topic.startswith(subtree)]:
+                    del values[topic]
+                values.pop(prefix, None)
+
+    def __len__(self):
+        return len(self._values)
@@ -0,0 +1,216 @@
+import json
+import random
+import threading
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+import Polestar_2_MQTT as app
+from account_pool import AccountPool, load_accounts
+from fetch_status import ApiError
+from refresh_command import RefreshTrigger
+
+#####################################
+# fixtures
+
+
+def write_accounts(tmp_path, entries):
+    path = tmp_path / "accounts.json"
+    path.write_text(json.dumps(entries), encoding="utf-8")
+    return path
+
+
+def make_state(name):
+    return SimpleNamespace(account=name, last_car_data={}, token_refresher=Mock())
+
+
+def make_fake_app(events, failing=(), broken=()):
+    lock = threading.Lock()
+    active = []
+    peak = []
+
+    def fetch_cycle(state):
+        with lock:
+            active.append(state.account)
+            peak.append(len(active))
+        try:
+            if state.account in failing:
+                raise ApiError("auth", "credentials rejected")
+            if state.account in broken:
+                raise KeyError("vin")
+            return {f"VIN-{state.account}": {}}, {f"VIN-{state.account}": {"battery": {}}}
+        finally:
+            with lock:
+                active.remove(state.account)
+
+    def publish_cycle(state, cars_data, telemetry_by_vin):
+        state.last_car_data = cars_data
+        events.append(("publish", state.account, tuple(telemetry_by_vin)))
+
+    statuses = {}
+
+    def publish_json_as_mqtt(topic, payload):
+        statuses[topic] = payload
+
+    return SimpleNamespace(
+        MQTT_BASE_TOPIC="polestar",
+        POLESTAR_CYCLE=0,
+        OPENWB_PUBLISH=False,
+        fetch_cycle=fetch_cycle,
+        publish_cycle=publish_cycle,
+        publish_json_as_mqtt=publish_json_as_mqtt,
+        next_cycle_interval=lambda state: 60,
+        refresh_trigger=RefreshTrigger(debounce=0, min_interval=0),
+        force_republish=Mock(),
+        mqtt_connect=lambda: events.append("connect"),
+        shutdown_clients=lambda: events.append("shutdown"),
+        statuses=statuses,
+        peak=peak,
+    )
+
+#####################################
+# tests for the accounts file
+
+
+def test_load_accounts_sanitizes_names_and_defaults_vins(tmp_path):
+    path = write_accounts(tmp_path, [
+        {"email": "a@example.com", "password": "pw-a"},
+        {"name": "second car", "email": "b@example.com", "password": "pw-b", "vins": "VIN2"},
+    ])
+
+    assert load_accounts(path) == [
+        {"name": "a_example.com", "email": "a@example.com", "password": "pw-a", "vins": "all"},
+        {"name": "second_car", "email": "b@example.com", "password": "pw-b", "vins": "VIN2"},
+    ]
+
+
+@pytest.mark.parametrize("entries, message", [
+    ([], "non-empty JSON list"),
+    ({"email": "a@example.com"}, "non-empty JSON list"),
+    ([{"email": "a@example.com"}], "needs email and password"),
+    (
+        [
+            {"name": "x", "email": "a@example.com", "password": "a"},
+            {"name": "x", "email": "b@example.com", "password": "b"},
+        ],
+        "duplicate account name",
+    ),
+])
+def test_load_accounts_rejects_invalid_files(tmp_path, entries, message):
+    with pytest.raises(ValueError, match=message):
+        load_accounts(write_accounts(tmp_path, entries))
+
+
+def test_account_file_path_adds_the_account_name():
+    assert str(app.account_file_path("/local-files/token_store.json", "home")) == (
+        "/local-files/token_store_home.json"
+    )
+    assert app.account_file_path("", "home") == ""
+
+#####################################
+# tests for the scheduling
+
+
+def test_initial_cycles_are_spread_over_the_interval():
+    states = [make_state(name) for name in ("a", "b", "c", "d")]
+    pool = AccountPool(Mock(), states, jitter=0, clock=lambda: 100.0)
+
+    pool.schedule_initial(60)
+
+    assert sorted(pool._due) == [(100.0, 0), (115.0, 1), (130.0, 2), (145.0, 3)]
+
+
+def test_jitter_stays_within_the_configured_fraction():
+    pool = AccountPool(Mock(), [make_state("a")], jitter=0.1, rng=random.Random(7))
+
+    intervals = [pool.jittered(100) for _ in range(200)]
+
+    assert all(90 <= interval <= 110 for interval in intervals)
+    assert len(set(intervals)) > 1
+
+
+def test_workers_are_bounded_by_the_number_of_accounts():
+    assert AccountPool(Mock(), [make_state("a"), make_state("b")], workers=8).workers == 2
+    assert AccountPool(Mock(), [make_state("a")], workers=0).workers == 1
+
+#####################################
+# tests for the run loop
+
+
+def test_run_once_publishes_every_account_despite_failures():
+    events = []
+    fake_app = make_fake_app(events, failing={"b"}, broken={"c"})
+    states = [make_state(name) for name in ("a", "b", "c", "d")]
+
+    AccountPool(fake_app, states, workers=2, jitter=0).run(run_once=True)
+
+    assert events[0] == "connect"
+    assert events[-1] == "shutdown"
+    assert sorted(event for event in events if event[0] == "publish") == [
+        ("publish", "a", ("VIN-a",)),
+        ("publish", "d", ("VIN-d",)),
+    ]
+    assert fake_app.statuses["polestar/accounts/a"] == {"status": "ok", "error": "", "cars": 1}
+    assert fake_app.statuses["polestar/accounts/b"]["error"] == "auth: credentials rejected"
+    assert fake_app.statuses["polestar/accounts/c"]["error"] == "KeyError: 'vin'"
+    assert max(fake_app.peak) <= 2
+    for state in states:
+        state.token_refresher.start.assert_called_once_with()
+        state.token_refresher.stop.assert_called_once_with()
+
+
+def test_continuous_run_reschedules_accounts_until_stopped():
+    events = []
+    fake_app = make_fake_app(events)
+    states = [make_state("a")]
+    pool = AccountPool(fake_app, states, jitter=0)
+
+    def publish_cycle(state, cars_data, telemetry_by_vin):
+        events.append(("publish", state.account))
+        pool.stop_event.set()
+
+    fake_app.publish_cycle = publish_cycle
+    pool.run(run_once=False)
+
+    assert events == ["connect", ("publish", "a"), "shutdown"]
+    assert [index for _, index in pool._due] == [0]  # next cycle was scheduled
+
+
+def test_refresh_command_pulls_the_requested_account_forward():
+    now = [100.0]
+    fake_app = make_fake_app([])
+    states = [make_state("a"), make_state("b")]
+    states[1].last_car_data = {"VIN2": {}}
+    pool = AccountPool(fake_app, states, jitter=0, clock=lambda: now[0])
+    pool._due = [(160.0, 0), (170.0, 1)]
+
+    fake_app.refresh_trigger.request(("VIN2", "battery"))
+    pool.pull_forward()
+
+    assert sorted(pool._due) == [(100.0, 1), (160.0, 0)]
+    fake_app.force_republish.assert_called_once_with(states[1], [("VIN2", "battery")])
+
+
+def test_continuous_run_serves_refresh_commands():
+    events = []
+    fake_app = make_fake_app(events)
+    fake_app.next_cycle_interval = lambda state: 3600
+    states = [make_state("a")]
+    pool = AccountPool(fake_app, states, jitter=0)
+
+    def publish_cycle(state, cars_data, telemetry_by_vin):
+        events.append(("publish", state.account))
+        if len(events) == 2:
+            fake_app.refresh_trigger.request()  # while waiting an hour for the next cycle
+        else:
+            pool.stop_event.set()
+
+    fake_app.publish_cycle = publish_cycle
+    thread = threading.Thread(target=pool.run)
+    thread.start()
+    thread.join(timeout=10)
+
+    assert not thread.is_alive()
+    assert events == ["connect", ("publish", "a"), ("publish", "a"), "shutdown"]
+    fake_app.force_republish.assert_called_once_with(states[0], [(None, None)])
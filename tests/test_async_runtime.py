@@ -0,0 +1,145 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import Polestar_2_MQTT as app
+from async_runtime import AsyncGatewayRunner
+from refresh_command import RefreshTrigger
+
+#####################################
+# fixtures
+
+
+def make_fake_app(events):
+    main_client = Mock()
+    openwb_client = Mock()
+    supervisor = Mock()
+
+    def fetch_telemetry_data(state, vins):
+        events.append(("fetch_telemetry", tuple(vins)))
+        return {vin: {"battery": [{"vin": vin}]} for vin in vins}
+
+    return SimpleNamespace(
+        MQTT_USER="user",
+        MQTT_PASSWORD="secret",
+        next_cycle_interval=lambda state: 0,
+        client=main_client,
+        mqtt_on_connect=Mock(),
+        mqtt_on_disconnect=Mock(),
+        mqtt_on_message=Mock(),
+        refresh_trigger=RefreshTrigger(debounce=0, min_interval=0),
+        start_refresh=lambda state: events.append("refresh"),
+        mqtt_supervisors={main_client: supervisor},
+        mqtt_brokers=lambda: [
+            ("MQTT", main_client, lambda: events.append("connect MQTT")),
+            ("MQTT openWB", openwb_client, lambda: events.append("connect openWB")),
+        ],
+        create_gateway_state=lambda: "state",
+        token_refresher=Mock(),
+        mqtt_connect_retries=Mock(),
+        start_fetch_cycle=lambda state: None,
+        ensure_access_token=lambda state: events.append("token"),
+        start_publish_cycle=lambda state: events.append("start"),
+        fetch_cars_data=lambda state: {"VIN1": {"vin": "VIN1"}, "VIN2": {"vin": "VIN2"}},
+        fetch_telemetry_data=fetch_telemetry_data,
+        publish_car_data=lambda state, vin, car: events.append(("car", vin)),
+        publish_telemetry_data=lambda state, vin, data, openwb_vin: events.append(
+            ("telemetry", vin, openwb_vin)
+        ),
+        store_fetch_result=lambda state, cars, telemetry: events.append("store"),
+        openwb_vin_for=lambda vins: vins[0],
+        finish_cycle=lambda: events.append("finish"),
+        shutdown_clients=lambda: events.append("shutdown"),
+        publish_error_and_raise=Mock(side_effect=RuntimeError("giving up")),
+    )
+
+#####################################
+# tests for the polling cycle
+
+
+def test_run_once_connects_both_brokers_and_uses_the_response_cache():
+    events = []
+    fake_app = make_fake_app(events)
+    cars = {"VIN1": {"vin": "VIN1"}}
+    telemetry = {"VIN1": {"battery": [{"vin": "VIN1"}]}}
+    fake_app.cached_fetch_cycle = lambda state: events.append("cached fetch") or (cars, telemetry)
+    fake_app.publish_cycle = lambda state, *result: events.append(("publish", len(result[1])))
+    runner = AsyncGatewayRunner(fake_app, initial_delay=0)
+
+    asyncio.run(runner.run(run_once=True))
+
+    assert {"connect MQTT", "connect openWB"} <= set(events)
+    cycle = [event for event in events if event not in ("connect MQTT", "connect openWB")]
+    assert cycle == ["refresh", "cached fetch", ("publish", 1), "shutdown"]
+    fake_app.client.username_pw_set.assert_called_once_with("user", "secret")
+    fake_app.client.loop_start.assert_called_once_with()
+
+
+def test_run_cycle_publishes_car_data_while_telemetry_is_fetched():
+    events = []
+    runner = AsyncGatewayRunner(make_fake_app(events))
+
+    asyncio.run(runner.run_cycle("state"))
+
+    assert events[:2] == ["token", "start"]
+    assert ("fetch_telemetry", ("VIN1", "VIN2")) in events
+    assert events[-2:] == [("telemetry", "VIN2", "VIN1"), "finish"]
+
+
+def test_wait_cycle_returns_early_on_stop():
+    async def scenario():
+        runner = AsyncGatewayRunner(make_fake_app([]))
+        runner.stop_event = asyncio.Event()
+        assert await runner.wait_cycle(0.01) is False
+        runner.stop_event.set()
+        return await runner.wait_cycle(60)
+
+    assert asyncio.run(scenario()) is True
+
+#####################################
+# tests for MQTT reconnect handling
+
+
+def test_backoff_retries_without_blocking_and_gives_up():
+    fake_app = make_fake_app([])
+    runner = AsyncGatewayRunner(fake_app, max_retries=3, initial_delay=0)
+    attempts = []
+
+    def failing_connect():
+        attempts.append(1)
+        raise OSError("broker down")
+
+    try:
+        asyncio.run(runner.mqtt_backoff_attempt("MQTT", failing_connect))
+    except RuntimeError as exc:
+        assert str(exc) == "giving up"
+
+    assert len(attempts) == 3
+    fake_app.publish_error_and_raise.assert_called_once()
+
+
+def test_connect_brokers_hands_reconnects_to_supervisors():
+    fake_app = make_fake_app([])
+    runner = AsyncGatewayRunner(fake_app, initial_delay=0)
+
+    asyncio.run(runner.connect_brokers())
+
+    assert fake_app.client.on_disconnect is fake_app.mqtt_on_disconnect
+    fake_app.mqtt_supervisors[fake_app.client].start.assert_called_once_with()
+
+
+def test_mqtt_brokers_lists_openwb_only_when_enabled(monkeypatch):
+    monkeypatch.setattr(app, "OPENWB_PUBLISH", False)
+
+    assert [name for name, _, _ in app.mqtt_brokers()] == ["MQTT"]
+
+
+def test_wait_cycle_ends_early_on_refresh_command():
+    async def scenario():
+        fake_app = make_fake_app([])
+        runner = AsyncGatewayRunner(fake_app, command_poll_interval=0.01)
+        runner.stop_event = asyncio.Event()
+        fake_app.refresh_trigger.request()
+        return await runner.wait_cycle(60)
+
+    assert asyncio.run(asyncio.wait_for(scenario(), timeout=5)) is False
@@ -1,11 +1,12 @@
 import base64
 import hashlib
+import threading
 from datetime import datetime, timedelta
 
 import pytest
 
 import auth
-from auth import AuthError, PolestarAuthClient, TokenError
+from auth import AuthError, PolestarAuthClient, TokenError, TokenRefresher
 
 #####################################
 # fixtures
@@ -264,3 +265,161 @@ def test_ensure_valid_token_falls_back_to_full_login_when_refresh_fails(auth_cli
     )
 
     assert result == fresh_login
+
+#####################################
+# tests for background token refresh
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_refresher_reuses_valid_token_without_request(auth_client, monkeypatch):
+    clock = FakeClock(datetime(2026, 1, 1, 12, 0, 0))
+    refresher = TokenRefresher(auth_client, "user@example.com", "secret", clock=clock)
+    refresher.set_tokens("token", clock.now + timedelta(minutes=5), "refresh")
+    monkeypatch.setattr(auth_client, "ensure_valid_token", lambda *args: pytest.fail("refresh"))
+
+    assert refresher.get_token() == ("token", clock.now + timedelta(minutes=5), "refresh")
+
+
+def test_token_refresher_due_at_fraction_of_lifetime(auth_client):
+    clock = FakeClock(datetime(2026, 1, 1, 12, 0, 0))
+    refresher = TokenRefresher(auth_client, None, None, refresh_fraction=0.8, clock=clock)
+
+    assert refresher.refresh_due_at() is None
+
+    refresher.set_tokens("token", clock.now + timedelta(seconds=300), "refresh")
+
+    assert refresher.refresh_due_at() == clock.now + timedelta(seconds=240)
+
+
+def test_token_refresher_single_flight_for_concurrent_callers(auth_client, monkeypatch):
+    refresh_started = threading.Event()
+    release_refresh = threading.Event()
+    calls = []
+    updates = []
+
+    def slow_ensure_valid_token(access_token, expiry_time, refresh_token, email, password):
+        calls.append((access_token, expiry_time, refresh_token))
+        refresh_started.set()
+        release_refresh.wait(timeout=5)
+        return "new-token", datetime.now() + timedelta(minutes=30), "new-refresh"
+
+    monkeypatch.setattr(auth_client, "ensure_valid_token", slow_ensure_valid_token)
+    refresher = TokenRefresher(
+        auth_client,
+        "user@example.com",
+        "secret",
+        on_update=lambda *tokens: updates.append(tokens),
+    )
+    refresher.set_tokens("old-token", datetime.now() - timedelta(seconds=1), "old-refresh")
+    results = []
+
+    threads = [
+        threading.Thread(target=lambda: results.append(refresher.get_token()[0]))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    refresh_started.wait(timeout=5)
+    release_refresh.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert calls == [("old-token", None, "old-refresh")]
+    assert results == ["new-token"] * 5
+    assert len(updates) == 1
+    assert refresher.refresh_count == 1
+
+
+def test_token_refresher_background_thread_renews_before_expiry(auth_client, monkeypatch):
+    renewed = threading.Event()
+
+    def fake_ensure_valid_token(access_token, expiry_time, refresh_token, email, password):
+        renewed.set()
+        return "new-token", datetime.now() + timedelta(minutes=30), "new-refresh"
+
+    monkeypatch.setattr(auth_client, "ensure_valid_token", fake_ensure_valid_token)
+    refresher = TokenRefresher(auth_client, None, None, refresh_fraction=0.1)
+    refresher.set_tokens("token", datetime.now() + timedelta(seconds=1), "refresh")
+
+    refresher.start()
+    try:
+        assert renewed.wait(timeout=5)
+    finally:
+        refresher.stop()
+
+    assert refresher.get_token()[0] == "new-token"
+
+
+class RecordingStop:
+    # stands in for the stop event: records the waits instead of sleeping
+    def __init__(self, limit, on_wait=None):
+        self.limit = limit
+        self.on_wait = on_wait
+        self.waits = []
+
+    def is_set(self):
+        return len(self.waits) >= self.limit
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+        if self.on_wait is not None:
+            self.on_wait(len(self.waits))
+        return self.is_set()
+
+
+def test_token_refresher_backs_off_exponentially_and_resets_on_success(
+    auth_client, monkeypatch
+):
+    clock = FakeClock(datetime(2026, 1, 1, 12, 0, 0))
+    expired = clock.now - timedelta(seconds=1)
+    results = [TokenError("down"), TokenError("down"), TokenError("down"),
+               ("token", expired, "refresh"), TokenError("down")]
+
+    def fake_ensure_valid_token(*args):
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(auth_client, "ensure_valid_token", fake_ensure_valid_token)
+    refresher = TokenRefresher(
+        auth_client, None, None, retry_delay=30, max_retry_delay=100, clock=clock
+    )
+    refresher.set_tokens("old-token", expired, "old-refresh")
+    refresher._stop = RecordingStop(limit=9)
+
+    refresher._run()
+
+    assert refresher._stop.waits == [0, 30, 0, 60, 0, 100, 0, 0, 30]
+    assert refresher.refresh_count == 1
+
+
+def test_token_refresher_leaves_rejected_login_to_the_next_cycle(auth_client, monkeypatch):
+    clock = FakeClock(datetime(2026, 1, 1, 12, 0, 0))
+    expired = clock.now - timedelta(seconds=1)
+    calls = []
+
+    def rejected_login(*args):
+        calls.append(args[0])
+        raise AuthError("login rejected")
+
+    def renew_on_fifth_wait(count):
+        if count == 5:  # e.g. ensure_access_token of the next cycle logged in again
+            refresher.set_tokens("cycle-token", expired, "cycle-refresh")
+
+    monkeypatch.setattr(auth_client, "ensure_valid_token", rejected_login)
+    refresher = TokenRefresher(auth_client, None, None, retry_delay=30, clock=clock)
+    refresher.set_tokens("old-token", expired, "old-refresh")
+    refresher._stop = RecordingStop(limit=8, on_wait=renew_on_fifth_wait)
+
+    refresher._run()
+
+    assert refresher._stop.waits == [0, 30, 30, 30, 30, 0, 30, 30]
+    assert calls == ["old-token", "cycle-token"]
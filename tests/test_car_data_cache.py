@@ -0,0 +1,74 @@
+from car_data_cache import CarDataCache
+
+CARS = [{"vin": "VIN1", "modelName": "Polestar 2"}]
+
+#####################################
+# tests for TTL handling
+
+
+def test_get_returns_cached_cars_until_ttl_expires(tmp_path):
+    now = [1000.0]
+    cache = CarDataCache(tmp_path / "cars.json", 60, clock=lambda: now[0])
+
+    assert cache.get() is None
+    cache.put(CARS)
+    now[0] += 59
+    assert cache.get() == CARS
+    assert cache.age() == 59
+
+    now[0] += 1
+    assert cache.get() is None
+    assert cache.last() == CARS  # expired data stays available as fallback
+
+
+def test_ttl_zero_disables_cache(tmp_path):
+    cache = CarDataCache(tmp_path / "cars.json", 0)
+
+    cache.put(CARS)
+
+    assert cache.get() is None
+    assert not (tmp_path / "cars.json").exists()
+
+#####################################
+# tests for persistence
+
+
+def test_cache_is_restored_from_file_for_same_account(tmp_path):
+    path = tmp_path / "cars.json"
+    CarDataCache(path, 3600, account="user@example.com").put(CARS)
+
+    assert CarDataCache(path, 3600, account="user@example.com").get() == CARS
+    assert CarDataCache(path, 3600, account="other@example.com").get() is None
+    assert "user@example.com" not in path.read_text(encoding="utf-8")
+
+
+def test_cache_is_ignored_after_the_field_selection_changed(tmp_path):
+    path = tmp_path / "cars.json"
+    CarDataCache(path, 3600, query="query { vin modelName }").put(CARS)
+
+    assert CarDataCache(path, 3600, query="query { vin modelName }").get() == CARS
+    assert CarDataCache(path, 3600, query="query { vin }").get() is None
+    assert CarDataCache(path, 3600, query="query { vin }").last() is None
+
+
+def test_invalidate_removes_file(tmp_path):
+    path = tmp_path / "cars.json"
+    cache = CarDataCache(path, 3600)
+    cache.put(CARS)
+
+    cache.invalidate()
+
+    assert cache.get() is None
+    assert not path.exists()
+
+
+def test_unreadable_or_unwritable_file_is_ignored(tmp_path):
+    path = tmp_path / "cars.json"
+    path.write_text("{broken", encoding="utf-8")
+
+    assert CarDataCache(path, 3600).get() is None
+
+    missing_dir_cache = CarDataCache(tmp_path / "missing" / "cars.json", 3600)
+    missing_dir_cache.put(CARS)
+
+    assert missing_dir_cache.get() == CARS
@@ -0,0 +1,95 @@
+import pytest
+
+from derived import DerivedMetrics
+
+#####################################
+# fixtures
+
+
+START = 1_700_000_000
+
+
+def telemetry(seconds, soc, odometer_m, status="CHARGING_STATUS_IDLE", minutes_to_full=0):
+    seconds += START
+    return {
+        "battery": [
+            {
+                "vin": "VIN1",
+                "batteryChargeLevelPercentage": soc,
+                "chargingStatusV2": status,
+                "estimatedChargingTimeToFullMinutes": minutes_to_full,
+                "estimatedDistanceToEmptyKm": soc * 4,
+                "timestamp": {"seconds": seconds, "nanos": 0},
+            }
+        ],
+        "odometer": [
+            {"vin": "VIN1", "odometerMeters": odometer_m, "timestamp": {"seconds": seconds}}
+        ],
+    }
+
+#####################################
+# tests for charging
+
+
+def test_charge_rate_power_and_projected_full_charge():
+    derived = DerivedMetrics(battery_capacity_kwh=80)
+    charging = "CHARGING_STATUS_CHARGING"
+
+    first = derived.update("VIN1", telemetry(0, 50, 1000, charging))
+    second = derived.update("VIN1", telemetry(1800, 60, 1000, charging))
+
+    assert "charge_rate_percent_per_hour" not in first
+    assert second["charge_rate_percent_per_hour"] == 20
+    assert second["charge_power_kw"] == 16
+    # no estimate from the car: projected from the measured rate (40 % at 20 %/h)
+    assert second["full_charge_in_minutes"] == 120
+    assert second["full_charge_at"] == START + 1800 + 120 * 60
+    # 60 % of 80 kWh for 240 km of estimated range
+    assert second["estimated_consumption_kwh_per_100km"] == 20
+
+
+def test_full_charge_prefers_estimate_of_the_car():
+    derived = DerivedMetrics(battery_capacity_kwh=80)
+
+    values = derived.update("VIN1", telemetry(100, 50, 1000, "CHARGING_STATUS_CHARGING", 45))
+
+    assert values["full_charge_in_minutes"] == 45
+    assert values["full_charge_at"] == START + 100 + 45 * 60
+
+#####################################
+# tests for driving
+
+
+def test_distance_and_trip_consumption_accumulate_until_next_charge():
+    derived = DerivedMetrics(battery_capacity_kwh=75)
+
+    derived.update("VIN1", telemetry(0, 80, 10_000))
+    derived.update("VIN1", telemetry(600, 76, 25_000))
+    values = derived.update("VIN1", telemetry(1200, 72, 40_000))
+
+    assert values["distance_since_last_sample_km"] == 15
+    assert values["trip_distance_km"] == 30
+    assert values["trip_soc_used_percent"] == 8
+    assert values["trip_energy_kwh"] == 6
+    assert values["trip_consumption_kwh_per_100km"] == 20
+    assert values["full_charge_at"] is None
+
+    plugged_in = derived.update("VIN1", telemetry(1800, 72, 40_000, "CHARGING_STATUS_CHARGING"))
+
+    assert plugged_in["trip_distance_km"] == 0
+    assert plugged_in["trip_consumption_kwh_per_100km"] is None
+
+
+def test_unchanged_vehicle_timestamp_keeps_values_and_vins_are_independent():
+    derived = DerivedMetrics(battery_capacity_kwh=0)
+
+    derived.update("VIN1", telemetry(0, 80, 10_000))
+    values = derived.update("VIN1", telemetry(600, 78, 12_000))
+    repeated = derived.update("VIN1", telemetry(600, 78, 12_000))
+    other = derived.update("VIN2", telemetry(600, 50, 500))
+
+    assert repeated == values
+    assert values["charge_rate_percent_per_hour"] == pytest.approx(-12)
+    assert values["charge_power_kw"] is None  # no capacity configured
+    assert values["trip_energy_kwh"] is None
+    assert other["trip_distance_km"] == 0
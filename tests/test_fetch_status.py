@@ -0,0 +1,67 @@
+import pytest
+
+from fetch_status import ApiError, FetchErrors, graphql_errors, query_result
+
+#####################################
+# tests for GraphQL response handling
+
+
+def test_graphql_errors_are_keyed_by_field_path(make_response):
+    response_json = {
+        "errors": [
+            {"message": "timeout", "path": ["carTelematicsV2", "battery", 0]},
+            {"message": "again", "path": ["carTelematicsV2", "battery", 0]},
+            {"message": "no path"},
+            "unavailable",
+        ]
+    }
+
+    assert graphql_errors(response_json, "carTelematicsV2") == {
+        "carTelematicsV2/battery/0": "timeout; again",
+        "carTelematicsV2": "no path; unavailable",
+    }
+    assert graphql_errors(None) == {}
+
+
+def test_query_result_returns_partial_data_with_field_errors(make_response):
+    response = make_response(
+        json_data={
+            "data": {"carTelematicsV2": {"battery": None, "odometer": []}},
+            "errors": [{"message": "timeout", "path": ["carTelematicsV2", "battery"]}],
+        }
+    )
+
+    data, errors = query_result("carTelematicsV2", response)
+
+    assert data == {"battery": None, "odometer": []}
+    assert errors == {"carTelematicsV2/battery": "timeout"}
+
+
+def test_query_result_raises_api_error_if_the_query_failed(make_response):
+    with pytest.raises(ApiError, match="HTTP 503: unavailable") as excinfo:
+        query_result("q", make_response(status_code=503, json_data={"errors": ["unavailable"]}))
+    assert excinfo.value.status_code == 503
+
+    with pytest.raises(ApiError, match="invalid JSON response"):
+        query_result("q", make_response(json_error=True))
+
+    with pytest.raises(ApiError, match="q: not authorized"):
+        query_result(
+            "q", make_response(json_data={"data": None, "errors": [{"message": "not authorized"}]})
+        )
+
+#####################################
+# tests for the per-cycle error collection
+
+
+def test_fetch_errors_lookup_includes_parent_and_child_paths():
+    errors = FetchErrors()
+    errors.update({"carTelematicsV2/battery/1": "entry failed"})
+    errors.add("carTelematicsV2", "HTTP 503")
+
+    assert errors.lookup("carTelematicsV2/battery") == "HTTP 503; entry failed"
+    assert errors.lookup("carTelematicsV2/odometer") == "HTTP 503"
+    assert errors.lookup("getConsumerCarsV2") == ""
+
+    errors.start_cycle()
+    assert len(errors) == 0
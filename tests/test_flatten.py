@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from flatten import TopicPathCache, encode_scalar, iter_mqtt_leaves, query_field_paths
+from graphql_queries import CAR_TELEMATICS_V2_QUERY, GET_CONSUMER_CARS_V2_QUERY
+
+#####################################
+# tests for scalar encoding
+
+
+@pytest.mark.parametrize(
+    "value",
+    [0, -17, 12345678901234567890, 1.5, 0.1, 1e-07, 3.0, True, False, None,
+     float("nan"), float("inf"), float("-inf")],
+)
+def test_encode_scalar_matches_json_dumps(value):
+    assert encode_scalar(value) == json.dumps(value).encode("utf-8")
+
+
+def test_encode_scalar_publishes_strings_unquoted():
+    assert encode_scalar("Charging ⚡") == "Charging ⚡".encode("utf-8")
+
+#####################################
+# tests for the flattening engine
+
+
+def test_iter_mqtt_leaves_keeps_document_order_and_list_indices():
+    document = {
+        "battery": [{"vin": "VIN1", "timestamp": {"seconds": 1, "nanos": 0}}],
+        "odometer": {"odometerMeters": 1000},
+        "empty": {},
+    }
+
+    assert list(iter_mqtt_leaves("polestar2/CarTelematicsV2", document)) == [
+        ("polestar2/CarTelematicsV2/battery/0/vin", b"VIN1"),
+        ("polestar2/CarTelematicsV2/battery/0/timestamp/seconds", b"1"),
+        ("polestar2/CarTelematicsV2/battery/0/timestamp/nanos", b"0"),
+        ("polestar2/CarTelematicsV2/odometer/odometerMeters", b"1000"),
+    ]
+
+
+def test_iter_mqtt_leaves_handles_scalar_root_and_deep_nesting():
+    deep = 42
+    for _ in range(2000):
+        deep = {"x": deep}
+
+    assert list(iter_mqtt_leaves("polestar2/root", 5)) == [("polestar2/root", b"5")]
+    topic, payload = next(iter_mqtt_leaves("t", deep))
+    assert topic.count("/") == 2000
+    assert payload == b"42"
+
+#####################################
+# tests for precompiled topic paths
+
+
+def test_query_field_paths_follows_nested_selections():
+    paths = query_field_paths(CAR_TELEMATICS_V2_QUERY)
+
+    assert ("battery", "batteryChargeLevelPercentage") in paths
+    assert ("odometer", "timestamp", "nanos") in paths
+    assert ("vin",) in query_field_paths(GET_CONSUMER_CARS_V2_QUERY)
+    assert query_field_paths("") == []
+
+
+def test_topic_path_cache_reuses_precompiled_topics():
+    cache = TopicPathCache()
+    cache.precompile("polestar2/CarTelematicsV2", [("odometer", "odometerMeters")])
+    entries = len(cache)
+
+    first = cache.join("polestar2/CarTelematicsV2/odometer", "odometerMeters")
+    leaves = list(iter_mqtt_leaves(
+        "polestar2/CarTelematicsV2", {"odometer": {"odometerMeters": 1}}, cache
+    ))
+
+    assert entries == 2
+    assert len(cache) == entries
+    assert leaves[0][0] is first
+
+
+def test_topic_path_cache_stops_growing_at_max_entries():
+    cache = TopicPathCache(max_entries=1)
+
+    assert cache.join("a", "b") == "a/b"
+    assert cache.join("a", "c") == "a/c"
+    assert len(cache) == 1
@@ -0,0 +1,86 @@
+from pathlib import Path
+
+from graphql_schema import GraphQLSchema, named_type
+
+SCHEMA_PATH = Path(__file__).resolve().parents[1] / "graphql_schema.gql"
+
+SDL = """
+type Query {
+  getConsumerCarsV2(locale: String): [VehicleInformation!]!
+  getBatteryData(vin: String!): Battery
+}
+
+type VehicleInformation {
+  vin: String!
+  modelYear: String!
+  belongsToFleet: Boolean!
+  software: VehicleSoftware
+}
+
+type VehicleSoftware {
+  version: String
+}
+
+type Battery {
+  batteryChargeLevelPercentage: Float
+  chargingStatus: ChargingStatus
+}
+
+enum ChargingStatus {
+  CHARGING
+  IDLE
+}
+"""
+
+#####################################
+# tests for parsing and lookups
+
+
+def test_named_type_strips_list_and_non_null_markers():
+    assert named_type("[VehicleInformation!]!") == "VehicleInformation"
+    assert named_type("Int") == "Int"
+    assert named_type(None) is None
+
+
+def test_field_type_follows_the_query_root_field():
+    schema = GraphQLSchema.parse(SDL)
+
+    assert schema.field_type("getConsumerCarsV2", ("vin",)) == "String"
+    assert schema.field_type("getConsumerCarsV2", ("belongsToFleet",)) == "Boolean"
+    assert schema.field_type("getConsumerCarsV2", ("software", "version")) == "String"
+    assert schema.field_type("getBatteryData", ("chargingStatus",)) == "ChargingStatus"
+    assert schema.is_enum("ChargingStatus")
+    assert schema.enums["ChargingStatus"] == ["CHARGING", "IDLE"]
+
+
+def test_unknown_root_fields_and_fields_resolve_to_none():
+    schema = GraphQLSchema.parse(SDL)
+
+    assert schema.field_type("carTelematicsV2", ("battery", "chargingStatusV2")) is None
+    assert schema.field_type("getConsumerCarsV2", ("modelName",)) is None
+    assert schema.field_type("getConsumerCarsV2", ("vin", "length")) is None
+
+
+def test_repository_schema_is_readable():
+    schema = GraphQLSchema.load(SCHEMA_PATH)
+
+    assert schema.field_type("getConsumerCarsV2", ("pno34",)) == "String"
+    assert schema.field_type("getOdometerData", ("odometerMeters",)) == "Int"
+
+
+def test_missing_file_gives_empty_schema(tmp_path):
+    schema = GraphQLSchema.load(tmp_path / "missing.gql")
+
+    assert schema.types == {}
+    assert schema.field_type("getConsumerCarsV2", ("vin",)) is None
+
+
+def test_load_parses_each_file_version_once(tmp_path):
+    path = tmp_path / "schema.gql"
+    path.write_text(SDL, encoding="utf-8")
+
+    first = GraphQLSchema.load(path)
+    assert GraphQLSchema.load(path) is first
+
+    path.write_text(SDL.replace("modelYear: String!", "modelYear: Int"), encoding="utf-8")
+    assert GraphQLSchema.load(path).field_type("getConsumerCarsV2", ("modelYear",)) == "Int"
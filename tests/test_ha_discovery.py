@@ -0,0 +1,168 @@
+import json
+
+from graphql_schema import GraphQLSchema
+from ha_discovery import HomeAssistantDiscovery, field_name, query_sections, sample_value
+
+VIN = "LPSVSEDEEML000001"
+BASE_TOPIC = f"polestar2/{VIN}"
+
+SCHEMA = GraphQLSchema.parse("""
+type Query {
+  getConsumerCarsV2: [VehicleInformation!]!
+}
+type VehicleInformation {
+  vin: String!
+  modelYear: String!
+  belongsToFleet: Boolean!
+}
+""")
+
+CARS_QUERY = "query { getConsumerCarsV2 { vin modelYear belongsToFleet } }"
+TELEMATICS_QUERY = """
+query CarTelematicsV2($vins: [String!]!) {
+    carTelematicsV2(vins: $vins) {
+        battery {
+            vin
+            batteryChargeLevelPercentage
+            chargingStatusV2
+            timestamp { seconds nanos }
+        }
+        odometer { odometerMeters }
+        health { distanceToServiceKm }
+    }
+}
+"""
+
+DOCUMENTS = {
+    "car": {"vin": VIN, "modelYear": "2023", "belongsToFleet": False, "modelName": "Polestar 2"},
+    "battery": [{
+        "vin": VIN,
+        "batteryChargeLevelPercentage": 80,
+        "chargingStatusV2": "CHARGING_STATUS_IDLE",
+        "timestamp": {"seconds": 1700000000, "nanos": 0},
+    }],
+    "odometer": {"odometerMeters": 1234000},
+    "health": {},
+}
+
+
+def make_discovery():
+    sections = {
+        **query_sections("getConsumerCarsV2", CARS_QUERY, "car"),
+        **query_sections("carTelematicsV2", TELEMATICS_QUERY),
+    }
+    return HomeAssistantDiscovery(
+        "homeassistant", SCHEMA, "polestar2/container/connected", sections, diagnostic=("car",)
+    )
+
+
+def configs_by_object(configs):
+    return {topic.split("/")[-2]: (topic, config) for topic, config in configs}
+
+#####################################
+# tests for helpers
+
+
+def test_query_sections_groups_leaves_by_section():
+    sections = query_sections("carTelematicsV2", TELEMATICS_QUERY)
+
+    assert sections["battery"] == (
+        "carTelematicsV2",
+        ("battery",),
+        [
+            ("vin",),
+            ("batteryChargeLevelPercentage",),
+            ("chargingStatusV2",),
+            ("timestamp", "seconds"),
+            ("timestamp", "nanos"),
+        ],
+    )
+    assert query_sections("getConsumerCarsV2", CARS_QUERY, "car")["car"][1] == ()
+
+
+def test_sample_value_and_field_name():
+    assert sample_value(DOCUMENTS["battery"], ("timestamp", "seconds")) == 1700000000
+    assert sample_value(DOCUMENTS["health"], ("distanceToServiceKm",)) is None
+    assert field_name("batteryChargeLevelPercentage") == "Battery charge level percentage"
+
+#####################################
+# tests for the generated configs
+
+
+def test_configs_use_schema_types_and_section_json_state_topics():
+    discovery = make_discovery()
+    configs = configs_by_object(discovery.configs(VIN, BASE_TOPIC, DOCUMENTS, DOCUMENTS["car"]))
+
+    topic, year = configs["car_modelYear"]
+    assert topic == f"homeassistant/sensor/polestar_{VIN}/car_modelYear/config"
+    assert year["state_topic"] == f"{BASE_TOPIC}/json/car"
+    assert year["value_template"] == "{{ value_json.modelYear }}"
+    assert year["entity_category"] == "diagnostic"
+    assert year["default_entity_id"] == f"sensor.polestar_{VIN}_car_modelyear".lower()
+    assert "object_id" not in year  # deprecated by Home Assistant
+    assert "state_class" not in year  # String in the schema, even though it looks numeric
+    assert year["device"]["identifiers"] == [f"polestar_{VIN}"]
+    assert year["device"]["model"] == "Polestar 2"
+
+    topic, fleet = configs["car_belongsToFleet"]
+    assert topic.startswith("homeassistant/binary_sensor/")
+    assert fleet["value_template"] == "{{ 'ON' if value_json.belongsToFleet else 'OFF' }}"
+    assert fleet["default_entity_id"].startswith("binary_sensor.polestar_")
+    assert "car_vin" not in configs and "battery_timestamp_nanos" not in configs
+
+
+def test_configs_fall_back_to_values_and_field_names_for_unknown_fields():
+    configs = configs_by_object(make_discovery().configs(VIN, BASE_TOPIC, DOCUMENTS))
+
+    soc = configs["battery_batteryChargeLevelPercentage"][1]
+    assert soc["state_topic"] == f"{BASE_TOPIC}/json/battery"
+    assert (soc["unit_of_measurement"], soc["device_class"]) == ("%", "battery")
+    assert soc["state_class"] == "measurement"
+    assert "unit_of_measurement" not in configs["battery_chargingStatusV2"][1]
+    odometer = configs["odometer_odometerMeters"][1]
+    assert (odometer["unit_of_measurement"], odometer["state_class"]) == ("m", "total_increasing")
+    updated = configs["battery_timestamp_seconds"][1]
+    assert (updated["name"], updated["device_class"]) == ("Battery updated", "timestamp")
+    assert "health_distanceToServiceKm" not in configs  # empty section: announced later
+
+
+def test_announce_publishes_each_section_once_until_reset():
+    discovery = make_discovery()
+    published = []
+
+    def publish(topic, payload):
+        published.append((topic, json.loads(payload)))
+
+    first = discovery.announce(VIN, BASE_TOPIC, DOCUMENTS, publish, DOCUMENTS["car"])
+    assert first == len(published) > 0
+    assert discovery.announce(VIN, BASE_TOPIC, DOCUMENTS, publish) == 0
+
+    later = dict(DOCUMENTS, health={"distanceToServiceKm": None})
+    assert discovery.announce(VIN, BASE_TOPIC, later, publish) == 1
+    health = published[-1][1]
+    assert (health["unit_of_measurement"], health["device_class"]) == ("km", "distance")
+
+    discovery.reset()
+    assert discovery.announce(VIN, BASE_TOPIC, DOCUMENTS, publish) == first
+
+
+def test_update_sections_removes_the_entities_of_dropped_fields():
+    discovery = make_discovery()
+    published = []
+    discovery.announce(VIN, BASE_TOPIC, DOCUMENTS, lambda *message: published.append(message))
+    soc_topic = f"homeassistant/sensor/polestar_{VIN}/battery_batteryChargeLevelPercentage/config"
+    odometer_topic = f"homeassistant/sensor/polestar_{VIN}/odometer_odometerMeters/config"
+    assert soc_topic in dict(published) and odometer_topic in dict(published)
+
+    discovery.update_sections({
+        **query_sections("getConsumerCarsV2", CARS_QUERY, "car"),
+        **query_sections("carTelematicsV2", TELEMATICS_QUERY.replace(
+            "batteryChargeLevelPercentage", ""
+        ).replace("odometer { odometerMeters }", "")),
+    })
+    published.clear()
+    discovery.announce(VIN, BASE_TOPIC, DOCUMENTS, lambda *message: published.append(message))
+
+    assert (soc_topic, "") in published
+    assert (odometer_topic, "") in published
+    assert f"homeassistant/sensor/polestar_{VIN}/battery_chargingStatusV2/config" in dict(published)
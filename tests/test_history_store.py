@@ -0,0 +1,112 @@
+import json
+
+from history_store import HistoryStore, main
+
+#####################################
+# fixtures
+
+
+def battery(vin, seconds, soc):
+    return {
+        "vin": vin,
+        "batteryChargeLevelPercentage": soc,
+        "chargingStatus": "CHARGING_STATUS_CHARGING",
+        "timestamp": {"seconds": seconds, "nanos": 0},
+    }
+
+
+def make_store(tmp_path, now, **kwargs):
+    kwargs.setdefault("retention_days", 30)
+    return HistoryStore(tmp_path / "history.sqlite", clock=lambda: now[0], **kwargs)
+
+#####################################
+# tests for recording and querying
+
+
+def test_record_appends_each_new_vehicle_sample_once(tmp_path):
+    now = [1_000_000.0]
+    store = make_store(tmp_path, now)
+
+    assert store.record("VIN1", {"battery": battery("VIN1", 999_000, 50)}) == 1
+    assert store.record("VIN1", {"battery": battery("VIN1", 999_000, 50)}) == 0
+    assert store.record("VIN1", {"battery": [battery("VIN1", 999_300, 55)]}) == 1
+
+    samples = store.query("VIN1", "battery", fields=["batteryChargeLevelPercentage"])
+    assert samples == [
+        {"timestamp": 999_000, "batteryChargeLevelPercentage": 50},
+        {"timestamp": 999_300, "batteryChargeLevelPercentage": 55},
+    ]
+    assert store.latest("VIN1", "battery")["chargingStatus"] == "CHARGING_STATUS_CHARGING"
+    assert store.recorded == 2
+    store.close()
+
+
+def test_record_splits_fleet_documents_by_vin_and_filters_by_time(tmp_path):
+    now = [1_000_000.0]
+    store = make_store(tmp_path, now)
+    store.record(
+        "VIN1",
+        {"battery": [battery("VIN1", 100, 10), battery("VIN2", 200, 20)]},
+    )
+    store.record("VIN1", {"battery": [battery("VIN1", 300, 30)]})
+
+    assert store.vins() == ["VIN1", "VIN2"]
+    assert [sample["timestamp"] for sample in store.query("VIN1", "battery", start=200)] == [300]
+    assert store.query("VIN2", "battery", end=150) == []
+    store.close()
+
+
+def test_disabled_store_records_nothing(tmp_path):
+    store = HistoryStore(tmp_path / "history.sqlite", retention_days=0)
+
+    assert store.record("VIN1", {"battery": battery("VIN1", 100, 10)}) == 0
+    assert not (tmp_path / "history.sqlite").exists()
+
+#####################################
+# tests for downsampling and retention
+
+
+def test_maintenance_downsamples_old_samples_and_expires_by_retention(tmp_path):
+    day = 86400
+    now = [100 * day]
+    store = make_store(
+        tmp_path, now, retention_days=30, raw_days=7, downsample_interval=900
+    )
+    old = 80 * day  # older than raw_days: one sample per 900 s bucket survives
+    recent = 99 * day
+    store.record(
+        "VIN1",
+        {
+            "battery": [
+                battery("VIN1", 60 * day, 1),  # older than retention
+                battery("VIN1", old, 2),
+                battery("VIN1", old + 300, 3),
+                battery("VIN1", old + 900, 4),
+                battery("VIN1", recent, 5),
+                battery("VIN1", recent + 300, 6),
+            ]
+        },
+    )
+
+    socs = [
+        sample["batteryChargeLevelPercentage"] for sample in store.query("VIN1", "battery")
+    ]
+    assert socs == [2, 4, 5, 6]
+    store.close()
+
+#####################################
+# tests for the command line export
+
+
+def test_main_exports_json_lines(tmp_path, capsys):
+    now = [1_000_000.0]
+    store = make_store(tmp_path, now)
+    store.record("VIN1", {"battery": battery("VIN1", 999_000, 50)})
+    store.close()
+
+    main([str(tmp_path / "history.sqlite"), "battery", "--fields", "batteryChargeLevelPercentage"])
+
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"vin": "VIN1", "timestamp": 999_000, "batteryChargeLevelPercentage": 50}
+    ]
@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+from urllib3.util.retry import Retry
+
+from http_pool import HttpSessionPool
+
+#####################################
+# tests for session handling
+
+
+def test_session_for_reuses_one_session_per_host():
+    pool = HttpSessionPool()
+
+    api_session = pool.session_for("https://pc-api.polestar.com/eu-north-1/mystar-v2")
+    same_host = pool.session_for("https://pc-api.polestar.com/other")
+    auth_session = pool.session_for("https://polestarid.eu.polestar.com/as/token.oauth2")
+
+    assert api_session is same_host
+    assert api_session is not auth_session
+
+
+def test_session_adapter_uses_configured_pool_size_and_retries():
+    pool = HttpSessionPool(pool_size=7, retries=2)
+
+    adapter = pool.session_for("https://pc-api.polestar.com/").get_adapter("https://pc-api.polestar.com/")
+
+    assert adapter._pool_maxsize == 7
+    assert adapter.max_retries.total == 2
+
+
+def test_post_applies_default_timeout(monkeypatch):
+    pool = HttpSessionPool(timeout=12)
+    session = pool.session_for("https://pc-api.polestar.com/")
+    captured = {}
+
+    def fake_request(method, url, **kwargs):
+        captured.update(kwargs, method=method, url=url)
+        return "response"
+
+    monkeypatch.setattr(session, "request", fake_request)
+
+    result = pool.post("https://pc-api.polestar.com/graphql", json={"query": "q"})
+
+    assert result == "response"
+    assert captured["method"] == "POST"
+    assert captured["timeout"] == 12
+    assert captured["json"] == {"query": "q"}
+
+
+def test_request_counts_urllib3_retries(monkeypatch):
+    pool = HttpSessionPool()
+    session = pool.session_for("https://pc-api.polestar.com/")
+    response = SimpleNamespace(raw=SimpleNamespace(retries=Retry(total=3).new(history=(1, 2))))
+    monkeypatch.setattr(session, "request", lambda method, url, **kwargs: response)
+
+    pool.post("https://pc-api.polestar.com/graphql")
+    pool.post("https://pc-api.polestar.com/graphql")
+
+    assert pool.retried == 4
+    assert pool.stats()["retried"] == 4
+
+
+def test_session_does_not_persist_cookies():
+    pool = HttpSessionPool()
+    session = pool.session_for("https://polestarid.eu.polestar.com/")
+
+    assert session.cookies.get_policy().allowed_domains() == ()
+
+#####################################
+# tests for statistics
+
+
+def test_stats_counts_reused_connections():
+    pool = HttpSessionPool()
+    url = "https://pc-api.polestar.com/"
+    adapter = pool.session_for(url).get_adapter(url)
+    connection_pool = adapter.poolmanager.connection_from_url(url)
+    connection_pool.num_connections = 1
+    connection_pool.num_requests = 5
+
+    assert pool.stats() == {"hosts": 1, "connections": 1, "requests": 5, "reused": 4, "retried": 0}
+
+    pool.close()
+
+    assert pool.stats()["hosts"] == 0
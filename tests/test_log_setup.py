@@ -0,0 +1,116 @@
+import io
+import json
+import logging
+
+import pytest
+
+from log_setup import RateLimitFilter, get_logger, lazy_json, setup_logging
+
+#####################################
+# fixtures
+
+
+@pytest.fixture
+def log_stream():
+    stream = io.StringIO()
+    yield stream
+    setup_logging("INFO", "json", rate_limit=60)
+
+
+def records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+#####################################
+# tests for formatting and levels
+
+
+def test_json_lines_include_level_logger_and_extra_fields(log_stream):
+    setup_logging("INFO", "json", rate_limit=0, stream=log_stream)
+
+    get_logger("auth").info("token expires in %s seconds", 3600, extra={"vin": "VIN1"})
+
+    (entry,) = records(log_stream)
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "polestar2mqtt.auth"
+    assert entry["message"] == "token expires in 3600 seconds"
+    assert entry["vin"] == "VIN1"
+    assert "time" in entry
+
+
+def test_debug_payload_dumps_are_only_formatted_when_enabled(log_stream):
+    setup_logging("INFO", "json", rate_limit=0, stream=log_stream)
+
+    class Payload:
+        dumped = 0
+
+        def __str__(self):
+            Payload.dumped += 1
+            return "payload"
+
+    get_logger("gateway").debug("response: %s", Payload())
+
+    assert Payload.dumped == 0
+    assert log_stream.getvalue() == ""
+
+
+def test_lazy_json_dumps_on_str():
+    assert str(lazy_json({"soc": 80})) == '{"soc": 80}'
+
+
+def test_text_format_and_invalid_format(log_stream):
+    setup_logging("DEBUG", "text", rate_limit=0, stream=log_stream)
+    get_logger("gateway").debug("hello %s", "world")
+
+    assert log_stream.getvalue().rstrip().endswith("DEBUG   polestar2mqtt.gateway: hello world")
+    with pytest.raises(ValueError, match="invalid LOG_FORMAT"):
+        setup_logging("INFO", "xml")
+
+#####################################
+# tests for rate limiting
+
+
+def make_record(msg, level=logging.WARNING, args=()):
+    return logging.LogRecord("polestar2mqtt.gateway", level, __file__, 1, msg, args, None)
+
+
+def test_rate_limit_mutes_repeats_and_reports_suppressed_count():
+    now = [0.0]
+    rate_limit = RateLimitFilter(60, clock=lambda: now[0])
+
+    assert rate_limit.filter(make_record("attempt %d failed", args=(1,)))
+    assert not rate_limit.filter(make_record("attempt %d failed", args=(1,)))
+    assert not rate_limit.filter(make_record("attempt 1 failed"))
+    assert rate_limit.filter(make_record("other message"))
+
+    now[0] = 61.0
+    record = make_record("attempt %d failed", args=(1,))
+    assert rate_limit.filter(record)
+    assert record.suppressed == 2
+
+
+def test_rate_limit_keeps_different_messages_of_one_template():
+    rate_limit = RateLimitFilter(60, clock=lambda: 0.0)
+
+    assert rate_limit.filter(make_record("%s", logging.ERROR, ("Authentication flow failed",)))
+    assert rate_limit.filter(make_record("%s", logging.ERROR, ("Token flow failed",)))
+    assert rate_limit.filter(make_record("API field error %s: %s", args=("a/battery", "x")))
+    assert rate_limit.filter(make_record("API field error %s: %s", args=("a/health", "x")))
+    assert not rate_limit.filter(make_record("API field error %s: %s", args=("a/health", "x")))
+
+
+def test_rate_limit_forgets_expired_messages_beyond_max_keys():
+    now = [0.0]
+    rate_limit = RateLimitFilter(60, clock=lambda: now[0], max_keys=2)
+    rate_limit.filter(make_record("value %d", args=(1,)))
+    rate_limit.filter(make_record("value %d", args=(2,)))
+
+    now[0] = 61.0
+    assert rate_limit.filter(make_record("value %d", args=(3,)))
+    assert len(rate_limit._last_emitted) == 1
+
+
+def test_rate_limit_never_mutes_debug_records():
+    rate_limit = RateLimitFilter(60, clock=lambda: 0.0)
+
+    assert rate_limit.filter(make_record("%s: %s", logging.DEBUG))
+    assert rate_limit.filter(make_record("%s: %s", logging.DEBUG))
@@ -0,0 +1,103 @@
+import socket
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import CONTENT_TYPE, Histogram, MetricsRegistry, MetricsServer
+
+#####################################
+# tests for rendering
+
+
+def test_counter_renders_labelled_and_unlabelled_series():
+    registry = MetricsRegistry()
+    plain = registry.counter("demo_total", "Plain counter.")
+    labelled = registry.counter("demo_labelled_total", "Labelled counter.")
+    labelled.inc(stage='a"b')
+    labelled.inc(2, stage='a"b')
+
+    lines = registry.render().splitlines()
+
+    assert lines[:3] == [
+        "# HELP demo_total Plain counter.",
+        "# TYPE demo_total counter",
+        "demo_total 0",
+    ]
+    assert 'demo_labelled_total{stage="a\\"b"} 3' in lines
+    assert plain.value() == 0
+    assert labelled.value(stage='a"b') == 3
+
+
+def test_histogram_renders_cumulative_buckets_sum_and_count():
+    histogram = Histogram("demo_seconds", "Demo histogram.", buckets=(0.1, 1))
+    histogram.observe(0.05, stage="auth")
+    histogram.observe(0.5, stage="auth")
+    histogram.observe(3, stage="auth")
+
+    lines = histogram.render()
+
+    assert lines[2:] == [
+        'demo_seconds_bucket{stage="auth",le="0.1"} 1',
+        'demo_seconds_bucket{stage="auth",le="1"} 2',
+        'demo_seconds_bucket{stage="auth",le="+Inf"} 3',
+        'demo_seconds_sum{stage="auth"} 3.55',
+        'demo_seconds_count{stage="auth"} 3',
+    ]
+
+
+def test_histogram_time_observes_duration_even_on_error():
+    histogram = Histogram("demo_seconds", "Demo histogram.")
+
+    with pytest.raises(RuntimeError):
+        with histogram.time(stage="flatten"):
+            raise RuntimeError("boom")
+
+    assert histogram.count(stage="flatten") == 1
+
+
+def test_callback_counter_reads_value_at_render_time():
+    registry = MetricsRegistry()
+    state = {"value": 1}
+    registry.callback_counter("refreshes_total", "Refreshes.", lambda: state["value"])
+    state["value"] = 5
+
+    assert registry.render().splitlines()[-1] == "refreshes_total 5"
+
+#####################################
+# tests for the HTTP endpoint
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_metrics_server_serves_registry_and_stops():
+    registry = MetricsRegistry()
+    registry.counter("demo_total", "Demo.").inc()
+    port = free_port()
+    server = MetricsServer(registry, port, address="127.0.0.1")
+    server.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            body = response.read().decode("utf-8")
+            content_type = response.headers["Content-Type"]
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/other", timeout=5)
+    finally:
+        server.stop()
+
+    assert content_type == CONTENT_TYPE
+    assert "demo_total 1" in body
+    assert excinfo.value.code == 404
+
+
+def test_metrics_server_is_disabled_without_port():
+    server = MetricsServer(MetricsRegistry(), 0)
+
+    server.start()
+    server.stop()
+
+    assert server._server is None
@@ -0,0 +1,196 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import Mock, call
+
+import paho.mqtt.client as mqtt
+
+import Polestar_2_MQTT as app
+from mqtt_supervisor import MqttSupervisor, OutboundQueue
+
+#####################################
+# fixtures
+
+
+def make_client(rc=mqtt.MQTT_ERR_SUCCESS):
+    fake_client = Mock()
+    fake_client.publish.return_value = SimpleNamespace(rc=rc)
+    return fake_client
+
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+#####################################
+# tests for the outbound queue
+
+
+def test_queue_coalesces_latest_value_per_topic():
+    queue = OutboundQueue()
+    queue.put("a", b"1", 1, True)
+    queue.put("b", b"2", 1, True)
+    queue.put("a", b"3", 0, False)
+
+    assert len(queue) == 2
+    assert queue.coalesced == 1
+    assert queue.pop() == ("b", b"2", 1, True)
+    assert queue.pop() == ("a", b"3", 0, False)
+    assert queue.pop() is None
+
+
+def test_queue_drops_oldest_topic_when_full():
+    queue = OutboundQueue(maxsize=2)
+    for topic in ("a", "b", "c"):
+        queue.put(topic, b"x", 1, True)
+
+    assert queue.dropped == 1
+    assert [queue.pop()[0], queue.pop()[0]] == ["b", "c"]
+
+#####################################
+# tests for publishing
+
+
+def test_publish_sends_directly_while_connected():
+    fake_client = make_client()
+    supervisor = MqttSupervisor("MQTT", fake_client)
+    supervisor.on_connect()
+
+    supervisor.publish("polestar2/soc", b"80", 1, True)
+
+    fake_client.publish.assert_called_once_with("polestar2/soc", b"80", qos=1, retain=True)
+    assert len(supervisor.queue) == 0
+
+
+def test_publish_queues_while_disconnected_or_on_send_error():
+    fake_client = make_client(rc=mqtt.MQTT_ERR_NO_CONN)
+    supervisor = MqttSupervisor("MQTT", fake_client)
+
+    supervisor.publish("polestar2/soc", b"80", 1, True)
+    assert fake_client.publish.call_count == 0
+
+    supervisor.on_connect()
+    supervisor.publish("polestar2/odometer", b"1000", 1, True)  # queued: publish order is kept
+    assert fake_client.publish.call_count == 0
+
+    supervisor.queue.pop()
+    supervisor.queue.pop()
+    supervisor.publish("polestar2/odometer", b"1000", 1, True)  # send error: queued
+    supervisor.publish("polestar2/soc", b"81", 1, True)
+
+    assert fake_client.publish.call_count == 1
+    assert supervisor.queue.pop() == ("polestar2/odometer", b"1000", 1, True)
+    assert supervisor.queue.pop() == ("polestar2/soc", b"81", 1, True)
+
+def test_publish_now_bypasses_the_queue_or_goes_to_its_front():
+    fake_client = make_client()
+    supervisor = MqttSupervisor("MQTT", fake_client)
+    supervisor.publish("polestar2/soc", b"80", 1, True)
+    supervisor.publish("polestar2/status", b"offline", 1, True)
+
+    supervisor.publish_now("polestar2/status", b"online", 1, True)
+
+    fake_client.publish.assert_called_once_with("polestar2/status", b"online", qos=1, retain=True)
+    assert len(supervisor.queue) == 1  # the stale queued status is gone
+
+    fake_client.publish.return_value = SimpleNamespace(rc=mqtt.MQTT_ERR_NO_CONN)
+    supervisor.publish_now("polestar2/status", b"online", 1, True)
+    assert supervisor.queue.pop() == ("polestar2/status", b"online", 1, True)
+
+
+#####################################
+# tests for the supervisor thread
+
+
+def test_supervisor_reconnects_off_the_callback_thread_and_drains_queue():
+    fake_client = make_client()
+    fake_client.reconnect.side_effect = [OSError("broker down"), None]
+    supervisor = MqttSupervisor("MQTT", fake_client, initial_delay=0, drain_rate=0)
+    supervisor.on_connect()
+    supervisor.start()
+    try:
+        supervisor.on_disconnect()  # returns immediately
+        supervisor.publish("polestar2/soc", b"80", 1, True)
+        supervisor.publish("polestar2/soc", b"81", 1, True)
+
+        wait_until(lambda: supervisor.reconnects == 1)
+        assert fake_client.publish.call_count == 0
+        supervisor.on_connect()  # CONNACK from paho's network thread
+        wait_until(lambda: len(supervisor.queue) == 0)
+    finally:
+        supervisor.stop()
+
+    assert fake_client.reconnect.call_count == 2
+    fake_client.loop_start.assert_called_once_with()
+    fake_client.publish.assert_called_once_with("polestar2/soc", b"81", qos=1, retain=True)
+
+
+def test_disconnect_during_shutdown_does_not_reconnect():
+    fake_client = make_client()
+    supervisor = MqttSupervisor("MQTT", fake_client, initial_delay=0)
+    supervisor.start()
+    supervisor.stop()
+
+    supervisor.on_disconnect()
+
+    assert supervisor._disconnected is False
+    fake_client.reconnect.assert_not_called()
+
+#####################################
+# tests for the gateway wiring
+
+
+def test_gateway_callbacks_and_publish_use_supervisor(monkeypatch):
+    fake_client = make_client()
+    supervisor = Mock()
+    monkeypatch.setattr(app, "mqtt_supervisors", {fake_client: supervisor})
+    monkeypatch.setattr(app, "topic_cache", app.TopicValueCache())
+
+    app.mqtt_on_disconnect(fake_client, None, None, 7)
+    app.mqtt_on_connect(fake_client, None, None, 0, None)
+    app.mqtt_publish(fake_client, "polestar2/soc", b"80")
+
+    supervisor.on_disconnect.assert_called_once_with()
+    supervisor.on_connect.assert_called_once_with()
+    assert supervisor.publish.call_args_list[-1] == call("polestar2/soc", b"80", 1, True)
+    fake_client.publish.assert_not_called()
+
+
+def test_gateway_on_connect_sends_status_before_queued_messages(monkeypatch):
+    fake_client = make_client()
+    supervisor = MqttSupervisor("MQTT", fake_client, drain_rate=0)
+    monkeypatch.setattr(app, "mqtt_supervisors", {fake_client: supervisor})
+    monkeypatch.setattr(app, "topic_cache", app.TopicValueCache())
+    for index in range(100):
+        supervisor.publish(f"polestar2/leaf/{index}", b"1", 1, True)  # queued during outage
+
+    app.mqtt_on_connect(fake_client, None, None, 0, None)
+
+    assert [args[0] for args, _ in fake_client.publish.call_args_list] == [
+        app.MQTT_LWT_TOPIC,
+        app.MQTT_LAST_ERROR_TOPIC,
+        app.MQTT_LAST_EXCEPTION_TOPIC,
+    ]
+    assert len(supervisor.queue) == 100 and supervisor.connected
+
+
+def test_only_a_main_broker_reconnect_forces_a_full_republish(monkeypatch):
+    main_client, openwb_client = make_client(), make_client()
+    cache = app.TopicValueCache()
+    discovery = Mock()
+    monkeypatch.setattr(app, "client", main_client)
+    monkeypatch.setattr(app, "mqtt_supervisors", {})
+    monkeypatch.setattr(app, "topic_cache", cache)
+    monkeypatch.setattr(app, "ha_discovery", discovery)
+    cache.changed("polestar2/soc", b"80")
+
+    app.mqtt_on_connect(openwb_client, None, None, 0, None)
+
+    assert not cache.changed("polestar2/soc", b"80")
+    discovery.reset.assert_not_called()
+
+    app.mqtt_on_connect(main_client, None, None, 0, None)
+
+    assert cache.changed("polestar2/soc", b"80")
+    discovery.reset.assert_called_once_with()
@@ -1,7 +1,18 @@
+import json
 import pytest
+import requests
+from types import SimpleNamespace
 from unittest.mock import Mock
 
 import Polestar_2_MQTT as app
+from auth import TokenError, TokenRefresher
+from car_data_cache import CarDataCache
+from fetch_status import ApiError, FetchErrors
+from query_builder import QueryBuilder
+from refresh_command import RefreshTrigger
+from response_cache import ResponseCache
+from token_store import TokenStore
+from topic_cache import TopicValueCache
 
 #####################################
 # tests for API response handling
@@ -18,7 +29,7 @@ def test_get_car_data_returns_matching_vin(monkeypatch, make_response):
     }
 
     monkeypatch.setattr(
-        app.requests,
+        app.http_pool,
         "post",
         lambda url, headers=None, json=None: make_response(status_code=200, json_data=car_payload),
     )
@@ -30,7 +41,7 @@ def test_get_car_data_returns_matching_vin(monkeypatch, make_response):
 
 def test_get_car_data_raises_value_error_when_vin_is_missing(monkeypatch, make_response):
     monkeypatch.setattr(
-        app.requests,
+        app.http_pool,
         "post",
         lambda url, headers=None, json=None: make_response(
             status_code=200,
@@ -42,12 +53,9 @@ def test_get_car_data_raises_value_error_when_vin_is_missing(monkeypatch, make_r
         app.get_car_data("VIN123", "token-123")
 
 
-def test_get_car_data_calls_publish_error_and_raise_for_unexpected_shape(
-    monkeypatch,
-    make_response,
-):
+def test_get_car_data_raises_api_error_for_unexpected_shape(monkeypatch, make_response):
     monkeypatch.setattr(
-        app.requests,
+        app.http_pool,
         "post",
         lambda url, headers=None, json=None: make_response(
             status_code=200,
@@ -55,13 +63,46 @@ def test_get_car_data_calls_publish_error_and_raise_for_unexpected_shape(
         ),
     )
 
-    def fake_publish_error_and_raise(message, exception):
-        raise RuntimeError(f"{message} | {exception}")
+    with pytest.raises(ApiError, match="unexpected API response"):
+        app.get_car_data("VIN123", "token-123")
 
-    monkeypatch.setattr(app, "publish_error_and_raise", fake_publish_error_and_raise)
 
-    with pytest.raises(RuntimeError, match="unexpected API response"):
-        app.get_car_data("VIN123", "token-123")
+def test_get_fleet_car_data_returns_all_cars_when_vins_is_none(monkeypatch, make_response):
+    car_payload = {
+        "data": {
+            "getConsumerCarsV2": [
+                {"vin": "VIN1", "modelName": "Polestar 2"},
+                {"vin": "VIN2", "modelName": "Polestar 3"},
+            ]
+        }
+    }
+
+    monkeypatch.setattr(
+        app.http_pool,
+        "post",
+        lambda url, headers=None, json=None: make_response(status_code=200, json_data=car_payload),
+    )
+
+    result = app.get_fleet_car_data(None, "token-123")
+
+    assert list(result) == ["VIN1", "VIN2"]
+
+
+def test_get_fleet_car_data_skips_unknown_vins_and_keeps_order(monkeypatch, make_response):
+    car_payload = {"data": {"getConsumerCarsV2": [{"vin": "VIN1"}, {"vin": "VIN2"}]}}
+
+    monkeypatch.setattr(
+        app.http_pool,
+        "post",
+        lambda url, headers=None, json=None: make_response(status_code=200, json_data=car_payload),
+    )
+
+    result = app.get_fleet_car_data(["VIN2", "UNKNOWN", "VIN1"], "token-123")
+
+    assert list(result) == ["VIN2", "VIN1"]
+
+    with pytest.raises(ValueError, match="none of the configured VINs"):
+        app.get_fleet_car_data(["UNKNOWN"], "token-123")
 
 
 def test_get_car_telemetry_data_returns_api_data(monkeypatch, make_response):
@@ -75,7 +116,7 @@ def test_get_car_telemetry_data_returns_api_data(monkeypatch, make_response):
     }
 
     monkeypatch.setattr(
-        app.requests,
+        app.http_pool,
         "post",
         lambda url, headers=None, json=None: make_response(
             status_code=200,
@@ -88,32 +129,344 @@ def test_get_car_telemetry_data_returns_api_data(monkeypatch, make_response):
     assert result == telemetry_payload["data"]["carTelematicsV2"]
 
 
-def test_get_car_telemetry_data_calls_publish_error_and_raise_on_http_error(
-    monkeypatch,
-    make_response,
-):
+def test_get_car_telemetry_data_raises_api_error_on_http_error(monkeypatch, make_response):
     monkeypatch.setattr(
-        app.requests,
+        app.http_pool,
         "post",
         lambda url, headers=None, json=None: make_response(
             status_code=500,
-            json_data={"error": "backend unavailable"},
+            json_data={"errors": [{"message": "backend unavailable"}]},
         ),
     )
 
-    def fake_publish_error_and_raise(message, exception):
-        raise RuntimeError(f"{message} | {exception}")
+    with pytest.raises(ApiError, match="carTelematicsV2: HTTP 500: backend unavailable"):
+        app.get_car_telemetry_data("VIN123", "token-123")
 
-    monkeypatch.setattr(app, "publish_error_and_raise", fake_publish_error_and_raise)
 
-    with pytest.raises(RuntimeError, match="no data received"):
+def test_get_car_telemetry_data_drops_failed_sections_and_records_field_errors(
+    monkeypatch, make_response
+):
+    monkeypatch.setattr(app, "fetch_errors", FetchErrors())
+    monkeypatch.setattr(
+        app.http_pool,
+        "post",
+        lambda url, headers=None, json=None: make_response(
+            status_code=200,
+            json_data={
+                "data": {"carTelematicsV2": {"battery": None, "odometer": [{"vin": "VIN1"}]}},
+                "errors": [{"message": "timeout", "path": ["carTelematicsV2", "battery"]}],
+            },
+        ),
+    )
+
+    result = app.get_car_telemetry_data(["VIN1"], "token-123")
+
+    assert result == {"odometer": [{"vin": "VIN1"}]}
+    assert app.fetch_errors.lookup("carTelematicsV2/battery") == "timeout"
+
+
+def test_get_car_telemetry_data_raises_api_error_on_network_error(monkeypatch):
+    def failing_post(url, headers=None, json=None):
+        raise requests.ConnectionError("connection refused")
+
+    monkeypatch.setattr(app.http_pool, "post", failing_post)
+
+    with pytest.raises(ApiError, match="connection refused"):
         app.get_car_telemetry_data("VIN123", "token-123")
 
 
+def test_get_car_telemetry_data_batches_all_vins_in_one_request(monkeypatch, make_response):
+    captured = []
+
+    def fake_post(url, headers=None, json=None):
+        captured.append(json)
+        return make_response(status_code=200, json_data={"data": {"carTelematicsV2": {}}})
+
+    monkeypatch.setattr(app.http_pool, "post", fake_post)
+
+    app.get_car_telemetry_data(["VIN1", "VIN2"], "token-123")
+
+    assert len(captured) == 1
+    assert captured[0]["variables"] == {"vins": ["VIN1", "VIN2"]}
+
+
+def test_get_car_telemetry_data_drops_fields_the_server_rejects(monkeypatch, make_response):
+    builder = QueryBuilder(app.query_templates["CAR_TELEMATICS_V2_QUERY"], "battery")
+    monkeypatch.setattr(app, "telematics_query", builder)
+    discovery = app.HomeAssistantDiscovery(
+        "homeassistant", app.graphql_schema, app.MQTT_LWT_TOPIC, app.discovery_sections()
+    )
+    monkeypatch.setattr(app, "ha_discovery", discovery)
+    queries = []
+
+    def fake_post(url, headers=None, json=None):
+        queries.append(json["query"])
+        if "chargingStatusV2" in json["query"]:
+            error = {"message": 'Cannot query field "chargingStatusV2" on type "Battery".'}
+            return make_response(status_code=400, json_data={"errors": [error]})
+        data = {"carTelematicsV2": {"battery": [{"vin": "VIN1"}]}}
+        return make_response(status_code=200, json_data={"data": data})
+
+    monkeypatch.setattr(app.http_pool, "post", fake_post)
+
+    assert app.get_car_telemetry_data(["VIN1"], "token-123") == {"battery": [{"vin": "VIN1"}]}
+    app.get_car_telemetry_data(["VIN1"], "token-123")
+
+    assert len(queries) == 3  # rejected once, then only the reduced query
+    assert ("battery", "chargingStatusV2") in builder.dropped
+    assert ("chargingStatusV2",) not in discovery.sections["battery"][2]  # no entity announced
+
+
+def test_get_consumer_cars_raises_api_error_for_errors_without_rejected_fields(
+    monkeypatch, make_response
+):
+    post = Mock(return_value=make_response(status_code=400, json_data={"errors": ["bad"]}))
+    monkeypatch.setattr(app.http_pool, "post", post)
+
+    with pytest.raises(ApiError, match="HTTP 400: bad"):
+        app.get_consumer_cars("token-123")
+    assert post.call_count == 1
+
+
+def test_query_mode_logs_to_stderr_from_the_start():
+    assert app.default_log_stream(["Polestar_2_MQTT.py", "query"]) is app.sys.stderr
+    assert app.default_log_stream(["Polestar_2_MQTT.py", "--refresh-car-data", "query"]) is (
+        app.sys.stderr
+    )
+    assert app.default_log_stream(["Polestar_2_MQTT.py", "runonce"]) is app.sys.stdout
+
+
+def test_builtin_queries_validate_without_warnings():
+    assert not any(
+        path not in builder.known_gaps
+        for builder in (app.cars_query, app.telematics_query)
+        for path in builder.validate()
+    )
+
+
+def test_query_templates_read_local_overrides_without_executing_them(monkeypatch, tmp_path):
+    override = tmp_path / "graphql_queries.py"
+    override.write_text(
+        "import os\n"
+        "os.remove(__file__)\n"
+        'GET_CONSUMER_CARS_V2_QUERY = "query GetConsumerCarsV2 { getConsumerCarsV2 { vin } }"\n',
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(app, "LOCAL_GRAPHQL_QUERIES_PATH", override)
+
+    templates = app.load_query_templates()
+
+    assert override.is_file()
+    assert templates["GET_CONSUMER_CARS_V2_QUERY"].endswith("{ getConsumerCarsV2 { vin } }")
+    assert templates["CAR_TELEMATICS_V2_QUERY"] == app.graphql_queries.CAR_TELEMATICS_V2_QUERY
+
+
+def test_split_telemetry_by_vin_groups_section_entries():
+    telemetry = {
+        "battery": [
+            {"vin": "VIN1", "batteryChargeLevelPercentage": 80},
+            {"vin": "VIN2", "batteryChargeLevelPercentage": 40},
+        ],
+        "odometer": {"vin": "VIN2", "odometerMeters": 1000},
+    }
+
+    result = app.split_telemetry_by_vin(telemetry, ["VIN1", "VIN2"])
+
+    assert result["VIN1"] == {"battery": [{"vin": "VIN1", "batteryChargeLevelPercentage": 80}]}
+    assert result["VIN2"] == {
+        "battery": [{"vin": "VIN2", "batteryChargeLevelPercentage": 40}],
+        "odometer": {"vin": "VIN2", "odometerMeters": 1000},
+    }
+
+
+def test_parse_vin_list_supports_lists_and_all():
+    assert app.parse_vin_list(" VIN1, VIN2 ,,VIN1") == ["VIN1", "VIN2"]
+    assert app.parse_vin_list("ALL") is None
+
+
+def test_fetch_cars_data_uses_cache_and_refetches_for_unknown_vin(monkeypatch, tmp_path):
+    fetched = []
+
+    def fake_get_consumer_cars(access_token, field_errors=None):
+        fetched.append(access_token)
+        return [{"vin": "VIN1"}, {"vin": "VIN2"}]
+
+    monkeypatch.setattr(app, "get_consumer_cars", fake_get_consumer_cars)
+    monkeypatch.setattr(app, "car_data_cache", CarDataCache(tmp_path / "cars.json", 3600))
+    monkeypatch.setattr(app, "POLESTAR_VIN", "VIN1")
+    state = app.GatewayState(False, ["VIN1"])
+    state.access_token = "token-123"
+
+    first = app.fetch_cars_data(state)
+    second = app.fetch_cars_data(state)
+
+    assert first == second == {"VIN1": {"vin": "VIN1"}}
+    assert fetched == ["token-123"]
+
+    fleet_state = app.GatewayState(True, ["VIN2", "VIN3"])
+    fleet_state.access_token = "token-456"
+    app.fetch_cars_data(fleet_state)
+
+    assert fetched == ["token-123", "token-456"]
+
+
+def test_stored_tokens_are_loaded_at_startup_and_saved_after_refresh(monkeypatch, tmp_path):
+    store = TokenStore(tmp_path / "tokens.json", "passphrase")
+    expired = app.datetime(2020, 1, 1)
+    store.save("stored-token", expired, "stored-refresh")
+    monkeypatch.setattr(app, "token_store", store)
+    monkeypatch.setattr(app, "POLESTAR_VINS", "")
+    monkeypatch.setattr(
+        app,
+        "token_refresher",
+        TokenRefresher(app.auth_client, None, None, refresh_fraction=0, on_update=store.save),
+    )
+    refreshed = ("new-token", app.datetime(2030, 1, 2), "new-refresh")
+    calls = []
+
+    def fake_ensure_valid_token(access_token, expiry_time, refresh_token, email, password):
+        calls.append((access_token, refresh_token))
+        return refreshed
+
+    monkeypatch.setattr(app.auth_client, "ensure_valid_token", fake_ensure_valid_token)
+
+    state = app.create_gateway_state()
+    app.ensure_access_token(state)
+    app.ensure_access_token(state)
+
+    assert calls == [("stored-token", "stored-refresh")]
+    assert state.access_token == "new-token"
+    assert store.load() == refreshed
+
+
 def test_parse_runtime_args_supports_runonce():
     args = app.parse_runtime_args(["runonce"])
 
     assert args.mode == "runonce"
+    assert args.refresh_car_data is False
+    assert app.parse_runtime_args(["--refresh-car-data"]).refresh_car_data is True
+
+#####################################
+# tests for partial failures
+
+
+def test_failed_telemetry_request_keeps_last_good_sections_marked_stale(monkeypatch):
+    fake_client = Mock()
+    monkeypatch.setattr(app, "client", fake_client)
+    monkeypatch.setattr(app, "mqtt_supervisors", {})
+    monkeypatch.setattr(app, "topic_cache", TopicValueCache())
+    monkeypatch.setattr(app, "fetch_errors", FetchErrors())
+    monkeypatch.setattr(app, "OPENWB_PUBLISH", False)
+    monkeypatch.setattr(app, "POLESTAR_VIN", "VIN1")
+    state = app.GatewayState(False, ["VIN1"])
+    good = {
+        "battery": {"batteryChargeLevelPercentage": 80, "timestamp": {"seconds": 1000}},
+        "odometer": {"odometerMeters": 5, "timestamp": {"seconds": 1000}},
+    }
+    responses = [good, ApiError("carTelematicsV2", "HTTP 503", 503)]
+
+    def fake_telemetry(vin, access_token, field_errors=None):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(app, "get_car_telemetry_data", fake_telemetry)
+
+    for _ in range(2):
+        app.start_publish_cycle(state)
+        for vin, telemetry in app.fetch_telemetry_data(state, ["VIN1"]).items():
+            app.publish_telemetry_data(state, vin, telemetry, None)
+
+    assert state.last_car_telemetry_data["VIN1"] == good
+    fake_client.publish.assert_any_call(
+        app.MQTT_LAST_ERROR_TOPIC, "carTelematicsV2: HTTP 503", qos=1, retain=True
+    )
+    fake_client.publish.assert_any_call(
+        f"{app.MQTT_BASE_TOPIC}/fetch_status/battery/stale", b"true", qos=1, retain=True
+    )
+    fake_client.publish.assert_any_call(
+        f"{app.MQTT_BASE_TOPIC}/fetch_status/odometer/error",
+        b"carTelematicsV2: HTTP 503",
+        qos=1,
+        retain=True,
+    )
+
+
+def test_partial_telemetry_marks_only_the_missing_section_stale():
+    state = app.GatewayState(True, None)
+    state.last_car_telemetry_data["VIN1"] = {"battery": [{"vin": "VIN1", "soc": 80}]}
+
+    merged, stale_sections = app.merge_last_good(
+        state, "VIN1", {"battery": [], "odometer": [{"vin": "VIN1", "odometerMeters": 5}]}
+    )
+
+    assert merged == {
+        "battery": [{"vin": "VIN1", "soc": 80}],
+        "odometer": [{"vin": "VIN1", "odometerMeters": 5}],
+    }
+    assert stale_sections == ["battery"]
+
+
+def test_fetch_cars_data_falls_back_to_last_known_cars_on_api_error(monkeypatch):
+    def failing_get_consumer_cars(access_token, field_errors=None):
+        raise ApiError("getConsumerCarsV2", "HTTP 502", 502)
+
+    monkeypatch.setattr(app, "client", Mock())
+    monkeypatch.setattr(app, "get_consumer_cars", failing_get_consumer_cars)
+    monkeypatch.setattr(app, "car_data_cache", CarDataCache(None, 0))
+    state = app.GatewayState(True, None)
+
+    with pytest.raises(ApiError, match="HTTP 502"):
+        app.fetch_cars_data(state)
+
+    state.last_car_data["VIN1"] = {"vin": "VIN1", "modelName": "P2"}
+    assert app.fetch_cars_data(state) == {"VIN1": {"vin": "VIN1", "modelName": "P2"}}
+    assert state.car_data_stale is True
+
+
+def test_token_error_skips_the_cycle_and_recovers_without_restart(monkeypatch):
+    fake_client = Mock()
+    refresher = Mock()
+    refresher.get_token.side_effect = [TokenError("token exchange failed"), ("t", None, "r")]
+    monkeypatch.setattr(app, "client", fake_client)
+    monkeypatch.setattr(app, "mqtt_supervisors", {})
+    monkeypatch.setattr(app, "token_refresher", refresher)
+    state = app.GatewayState(False, ["VIN1"])
+
+    with pytest.raises(ApiError, match="token exchange failed"):
+        app.ensure_access_token(state)
+    app.ensure_access_token(state)
+
+    statuses = [
+        call.args[1] for call in fake_client.publish.call_args_list
+        if call.args[0] == app.MQTT_LWT_TOPIC
+    ]
+    assert statuses == ["token_error", app.MQTT_LWT_MESSAGE_ALIVE]
+    assert state.access_token == "t"
+
+
+def test_auth_network_error_skips_the_cycle_instead_of_ending_the_process(monkeypatch):
+    fake_client = Mock()
+    monkeypatch.setattr(app, "client", fake_client)
+    monkeypatch.setattr(app, "mqtt_supervisors", {})
+    monkeypatch.setattr(app, "token_store", TokenStore("", ""))
+    refresher = TokenRefresher(app.auth_client, "user", "secret", refresh_fraction=0)
+    monkeypatch.setattr(app, "token_refresher", refresher)
+
+    def unreachable(*args, **kwargs):
+        raise requests.ConnectionError("Polestar ID unreachable")
+
+    monkeypatch.setattr(app.http_pool, "get", unreachable)
+    monkeypatch.setattr(app.http_pool, "post", unreachable)
+    state = app.GatewayState(False, ["VIN1"])
+
+    with pytest.raises(ApiError, match="Polestar ID unreachable"):
+        app.fetch_cycle(state)
+
+    assert state.token_failed is True
+    fake_client.publish.assert_any_call(app.MQTT_LWT_TOPIC, "token_error", qos=1, retain=True)
+
 
 #####################################
 # tests for run-once main flow
@@ -135,15 +488,22 @@ def test_main_runonce_completes_single_cycle_and_shuts_down(monkeypatch):
             "refresh-123",
         ),
     )
+    monkeypatch.setattr(app, "car_data_cache", CarDataCache(None, 0))
+    monkeypatch.setattr(
+        app, "token_refresher", TokenRefresher(app.auth_client, None, None, refresh_fraction=0)
+    )
+    monkeypatch.setattr(app, "get_consumer_cars", lambda access_token, field_errors=None: [])
     monkeypatch.setattr(
         app,
         "get_car_data",
-        lambda vin, access_token: {"vin": vin, "modelName": "P2"},
+        lambda vin, access_token, consumer_cars=None: {"vin": vin, "modelName": "P2"},
     )
     monkeypatch.setattr(
         app,
         "get_car_telemetry_data",
-        lambda vin, access_token: {"battery": {"batteryChargeLevelPercentage": 80}},
+        lambda vin, access_token, field_errors=None: {
+            "battery": {"batteryChargeLevelPercentage": 80}
+        },
     )
     monkeypatch.setattr(app, "publish_json_as_mqtt", lambda topic, payload: None)
     monkeypatch.setattr(app, "shutdown_clients", lambda: fake_client.publish("shutdown", "done"))
@@ -153,3 +513,285 @@ def test_main_runonce_completes_single_cycle_and_shuts_down(monkeypatch):
     published_topics = [call.args[0] for call in fake_client.publish.call_args_list]
     assert app.MQTT_TIMESTAMP_TOPIC in published_topics
     assert "shutdown" in published_topics
+
+
+def test_main_runonce_fleet_mode_publishes_each_car_under_own_subtree(monkeypatch):
+    fake_client = Mock()
+    telemetry_calls = []
+    published = []
+
+    monkeypatch.setattr(app, "client", fake_client)
+    monkeypatch.setattr(app, "OPENWB_PUBLISH", False)
+    monkeypatch.setattr(app, "POLESTAR_VINS", "all")
+    monkeypatch.setattr(app.signal, "signal", lambda *args, **kwargs: None)
+    monkeypatch.setattr(app, "mqtt_connect", lambda: None)
+    monkeypatch.setattr(
+        app.auth_client,
+        "ensure_valid_token",
+        lambda access_token, expiry_time, refresh_token, email, password: (
+            "token-123",
+            "expiry-marker",
+            "refresh-123",
+        ),
+    )
+    monkeypatch.setattr(app, "car_data_cache", CarDataCache(None, 0))
+    monkeypatch.setattr(
+        app, "token_refresher", TokenRefresher(app.auth_client, None, None, refresh_fraction=0)
+    )
+    monkeypatch.setattr(app, "get_consumer_cars", lambda access_token, field_errors=None: [])
+    monkeypatch.setattr(
+        app,
+        "get_fleet_car_data",
+        lambda vins, access_token, consumer_cars=None: {
+            "VIN1": {"vin": "VIN1"},
+            "VIN2": {"vin": "VIN2"},
+        },
+    )
+
+    def fake_telemetry(vins, access_token, field_errors=None):
+        telemetry_calls.append(vins)
+        return {"battery": [{"vin": "VIN1"}, {"vin": "VIN2"}]}
+
+    monkeypatch.setattr(app, "get_car_telemetry_data", fake_telemetry)
+    monkeypatch.setattr(
+        app, "publish_json_as_mqtt", lambda topic, payload: published.append(topic)
+    )
+    monkeypatch.setattr(app, "shutdown_clients", lambda: None)
+
+    app.main(run_once=True)
+
+    assert telemetry_calls == [["VIN1", "VIN2"]]
+    assert published == [
+        f"{app.MQTT_BASE_TOPIC}/VIN1/getConsumerCarsV2",
+        f"{app.MQTT_BASE_TOPIC}/VIN1/fetch_status",
+        f"{app.MQTT_BASE_TOPIC}/VIN2/getConsumerCarsV2",
+        f"{app.MQTT_BASE_TOPIC}/VIN2/fetch_status",
+        f"{app.MQTT_BASE_TOPIC}/VIN1/CarTelematicsV2/battery",
+        f"{app.MQTT_BASE_TOPIC}/VIN1/derived",
+        f"{app.MQTT_BASE_TOPIC}/VIN1/data_age",
+        f"{app.MQTT_BASE_TOPIC}/VIN1/fetch_status",
+        f"{app.MQTT_BASE_TOPIC}/VIN2/CarTelematicsV2/battery",
+        f"{app.MQTT_BASE_TOPIC}/VIN2/derived",
+        f"{app.MQTT_BASE_TOPIC}/VIN2/data_age",
+        f"{app.MQTT_BASE_TOPIC}/VIN2/fetch_status",
+    ]
+
+
+def test_main_runonce_without_any_car_data_raises_after_shutdown(monkeypatch):
+    shutdowns = []
+
+    def failing_fetch_cars_data(state):
+        raise ApiError("getConsumerCarsV2", "HTTP 503", 503)
+
+    monkeypatch.setattr(app, "client", Mock())
+    monkeypatch.setattr(app, "signal", Mock())
+    monkeypatch.setattr(app, "mqtt_connect", lambda: None)
+    monkeypatch.setattr(app, "ensure_access_token", lambda state: None)
+    monkeypatch.setattr(app, "token_refresher", Mock())
+    monkeypatch.setattr(app, "fetch_cars_data", failing_fetch_cars_data)
+    monkeypatch.setattr(app, "shutdown_clients", lambda: shutdowns.append(True))
+
+    with pytest.raises(ApiError, match="HTTP 503"):
+        app.main(run_once=True)
+
+    assert shutdowns == [True]
+
+
+def test_main_uses_asyncio_runtime_when_configured(monkeypatch):
+    runs = []
+
+    class FakeRunner:
+        def __init__(self, gateway):
+            runs.append(gateway)
+
+        async def run(self, run_once=False):
+            runs.append(run_once)
+
+    monkeypatch.setattr(app, "GATEWAY_RUNTIME", "async")
+    monkeypatch.setattr(app, "AsyncGatewayRunner", FakeRunner)
+
+    app.main(run_once=True)
+
+    assert runs == [app, True]
+
+
+def test_post_graphql_waits_for_the_shared_rate_limit(monkeypatch, make_response):
+    events = []
+    limiter = Mock(acquire=lambda: events.append("acquire"))
+    monkeypatch.setattr(app, "api_rate_limiter", limiter)
+    monkeypatch.setattr(
+        app.http_pool,
+        "post",
+        lambda *args, **kwargs: events.append("post")
+        or make_response(json_data={"data": {"getConsumerCarsV2": []}}),
+    )
+
+    assert app.post_graphql("getConsumerCarsV2", {}, "token", "get_car_data") == ([], {})
+    assert events == ["acquire", "post"]
+
+
+def test_create_account_states_gives_each_account_own_components(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "TOKEN_STORE_PATH", str(tmp_path / "token_store.json"))
+    monkeypatch.setattr(app, "CAR_DATA_CACHE_PATH", str(tmp_path / "car_data_cache.json"))
+    accounts = [
+        {"name": "home", "email": "a@example.com", "password": "a", "vins": "all"},
+        {"name": "work", "email": "b@example.com", "password": "b", "vins": "VIN2,VIN3"},
+    ]
+
+    home, work = app.create_account_states(accounts)
+
+    assert (home.account, home.fleet_mode, home.fleet_vins) == ("home", True, None)
+    assert work.fleet_vins == ["VIN2", "VIN3"]
+    assert work.car_data_cache.path == tmp_path / "car_data_cache_work.json"
+    assert home.token_refresher is not work.token_refresher
+    assert home.token_refresher is not app.token_refresher
+    assert home.poll_scheduler is not work.poll_scheduler
+    assert home.fetch_errors is not app.fetch_errors
+
+
+def test_main_runs_the_account_pool_when_an_accounts_file_is_set(monkeypatch, tmp_path):
+    runs = []
+    path = tmp_path / "accounts.json"
+    path.write_text(json.dumps([{"email": "a@example.com", "password": "a"}]), encoding="utf-8")
+
+    class FakePool:
+        def __init__(self, gateway, states, workers, jitter):
+            runs.append((gateway, [state.account for state in states], workers))
+
+        def run(self, run_once=False):
+            runs.append(run_once)
+
+    monkeypatch.setattr(app, "POLESTAR_ACCOUNTS_FILE", str(path))
+    monkeypatch.setattr(app, "TOKEN_STORE_PATH", str(tmp_path / "token_store.json"))
+    monkeypatch.setattr(app, "CAR_DATA_CACHE_PATH", "")
+    monkeypatch.setattr(app, "AccountPool", FakePool)
+    monkeypatch.setattr(app, "account_states", [])
+
+    app.main(run_once=True)
+
+    assert runs == [(app, ["a_example.com"], app.ACCOUNT_WORKERS), True]
+    assert [state.account for state in app.account_states] == ["a_example.com"]
+
+
+def test_token_refresh_metric_sums_the_refreshers_of_all_accounts(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "TOKEN_STORE_PATH", str(tmp_path / "token_store.json"))
+    monkeypatch.setattr(app, "CAR_DATA_CACHE_PATH", "")
+    home, work = app.create_account_states([
+        {"name": "home", "email": "a@example.com", "password": "a", "vins": "all"},
+        {"name": "work", "email": "b@example.com", "password": "b", "vins": "all"},
+    ])
+    home.token_refresher.refresh_count = 2
+    work.token_refresher.refresh_count = 3
+    monkeypatch.setattr(app, "account_states", [home, work])
+
+    assert "polestar_token_refreshes_total 5\n" in app.metrics.render()
+
+
+def test_main_runonce_is_served_from_a_recent_response(monkeypatch, tmp_path):
+    published = []
+    cache = ResponseCache(tmp_path / "responses.json", 60)
+    battery = {"batteryChargeLevelPercentage": 55}
+    cache.put({"VIN1": {"vin": "VIN1"}}, {"VIN1": {"battery": battery}})
+
+    monkeypatch.setattr(app, "response_cache", cache)
+    monkeypatch.setattr(app, "client", Mock())
+    monkeypatch.setattr(app, "OPENWB_PUBLISH", False)
+    monkeypatch.setattr(app.signal, "signal", lambda *args, **kwargs: None)
+    monkeypatch.setattr(app, "mqtt_connect", lambda: None)
+    monkeypatch.setattr(app, "shutdown_clients", lambda: None)
+    monkeypatch.setattr(app, "ensure_access_token", Mock(side_effect=AssertionError("login")))
+    monkeypatch.setattr(app, "post_graphql", Mock(side_effect=AssertionError("API request")))
+    monkeypatch.setattr(app, "publish_json_as_mqtt", lambda topic, payload: published.append(topic))
+
+    app.main(run_once=True)
+
+    assert cache.hits == 1
+    assert any(topic.endswith("/CarTelematicsV2/battery") for topic in published)
+
+
+def test_run_cycle_stores_only_complete_responses(monkeypatch, tmp_path):
+    cache = ResponseCache(tmp_path / "responses.json", 60)
+    state = app.GatewayState(False, ["VIN1"], errors=FetchErrors())
+    monkeypatch.setattr(app, "response_cache", cache)
+    monkeypatch.setattr(app, "publish_cycle", lambda state, cars, telemetry: None)
+
+    def fetch_cycle(state):
+        state.fetch_errors.start_cycle()
+        if failing:
+            state.fetch_errors.add("carTelematicsV2", "HTTP 503")
+        return {"VIN1": {"vin": "VIN1"}}, {"VIN1": {}}
+
+    monkeypatch.setattr(app, "fetch_cycle", fetch_cycle)
+
+    failing = True
+    app.run_cycle(state)
+    assert cache.get() is None
+
+    failing = False
+    app.run_cycle(state)
+    assert cache.get() == ({"VIN1": {"vin": "VIN1"}}, {"VIN1": {}})
+
+
+def test_run_query_prints_data_per_vin_as_json(monkeypatch, capsys):
+    monkeypatch.setattr(app, "create_gateway_state", lambda: "state")
+    monkeypatch.setattr(
+        app,
+        "cached_fetch_cycle",
+        lambda state: ({"VIN1": {"vin": "VIN1"}}, {"VIN1": {"odometer": {"odometerMeters": 5}}}),
+    )
+    monkeypatch.setattr(app.http_pool, "close", lambda: None)
+
+    document = app.run_query()
+
+    assert json.loads(capsys.readouterr().out) == document == {
+        "VIN1": {"car": {"vin": "VIN1"}, "telemetry": {"odometer": {"odometerMeters": 5}}}
+    }
+    assert app.parse_runtime_args(["query"]).mode == "query"
+
+
+def test_refresh_commands_are_subscribed_on_the_main_broker_only(monkeypatch):
+    main_client, openwb_client = Mock(), Mock()
+    monkeypatch.setattr(app, "client", main_client)
+    monkeypatch.setattr(app, "REFRESH_COMMAND", True)
+
+    app.subscribe_commands(main_client)
+    app.subscribe_commands(openwb_client)
+
+    main_client.subscribe.assert_called_once_with(f"{app.MQTT_REFRESH_TOPIC}/#", 1)
+    openwb_client.subscribe.assert_not_called()
+
+
+def test_refresh_command_messages_are_recorded_as_targets(monkeypatch):
+    trigger = RefreshTrigger(debounce=0, min_interval=0)
+    monkeypatch.setattr(app, "refresh_trigger", trigger)
+
+    def message(topic, retain=False):
+        return SimpleNamespace(topic=topic, payload=b"", retain=retain)
+
+    app.mqtt_on_message(None, None, message(f"{app.MQTT_REFRESH_TOPIC}/battery"))
+    app.mqtt_on_message(None, None, message(f"{app.MQTT_REFRESH_TOPIC}", retain=True))
+    app.mqtt_on_message(None, None, message(f"{app.MQTT_REFRESH_TOPIC}x"))
+
+    assert trigger.start_cycle() == {(None, "battery")}
+
+
+def test_start_refresh_republishes_requested_sections_even_if_unchanged(monkeypatch):
+    cache = TopicValueCache()
+    trigger = RefreshTrigger(debounce=0, min_interval=0)
+    state = app.GatewayState(True, ["VIN1", "VIN2"])
+    state.last_car_data = {"VIN1": {}, "VIN2": {}}
+    monkeypatch.setattr(app, "topic_cache", cache)
+    monkeypatch.setattr(app, "refresh_trigger", trigger)
+    cache.start_cycle()
+    for vin in ("VIN1", "VIN2"):
+        for section in ("battery", "odometer"):
+            cache.changed(f"{app.MQTT_BASE_TOPIC}/{vin}/CarTelematicsV2/{section}/value", "1")
+
+    trigger.request((None, "battery"))
+    app.start_refresh(state)
+
+    def changed(vin, section):
+        return cache.changed(f"{app.MQTT_BASE_TOPIC}/{vin}/CarTelematicsV2/{section}/value", "1")
+
+    assert changed("VIN1", "battery") and changed("VIN2", "battery")
+    assert not changed("VIN1", "odometer")
@@ -0,0 +1,46 @@
+import pytest
+
+from publish_policy import PublishPolicy, parse_policy_rules
+
+#####################################
+# tests for rule parsing
+
+
+def test_parse_policy_rules_reads_qos_and_retain():
+    rules = parse_policy_rules(" data_age/#=0:false ; +/CarTelematicsV2/battery/#=1 ;")
+
+    assert rules == [
+        ("data_age/#", 0, False),
+        ("+/CarTelematicsV2/battery/#", 1, True),
+    ]
+
+
+@pytest.mark.parametrize("spec", ["data_age/#", "data_age/#=3", "=0:false", "x/#=0:maybe"])
+def test_parse_policy_rules_rejects_invalid_rules(spec):
+    with pytest.raises(ValueError, match="invalid MQTT publish policy rule"):
+        parse_policy_rules(spec)
+
+#####################################
+# tests for topic lookup
+
+
+def test_lookup_uses_first_matching_rule_relative_to_base_topic():
+    policy = PublishPolicy(
+        "polestar2",
+        [
+            ("CarTelematicsV2/+/timestamp/#", 0, False),
+            ("CarTelematicsV2/#", 2, True),
+        ],
+    )
+
+    assert policy.lookup("polestar2/CarTelematicsV2/battery/timestamp/seconds") == (0, False)
+    assert policy.lookup("polestar2/CarTelematicsV2/battery/chargingStatusV2") == (2, True)
+    assert policy.lookup("polestar2/container/connected") == (1, True)
+
+
+def test_lookup_matches_topics_outside_base_topic_by_full_name():
+    policy = PublishPolicy("polestar2", [("openWB/#", 0, False)])
+
+    assert policy.lookup("openWB/set/lp/1/%Soc") == (0, False)
+    assert policy.lookup("polestar2/openWB/x") == (0, False)
+    assert policy.lookup("other/topic") == (1, True)
@@ -1,6 +1,12 @@
 from unittest.mock import Mock, call
 
+import pytest
+
 import Polestar_2_MQTT as app
+from flatten import TopicPathCache
+from metrics import MetricsRegistry
+from publish_policy import PublishPolicy
+from topic_cache import TopicValueCache
 
 #####################################
 # tests for MQTT publishers and shutdown
@@ -24,19 +30,19 @@ def test_publish_json_as_mqtt_flattens_nested_structures(monkeypatch):
         [
             call(
                 "polestar2/root/battery/batteryChargeLevelPercentage",
-                "78",
+                b"78",
                 qos=1,
                 retain=True,
             ),
             call(
                 "polestar2/root/battery/chargingStatus",
-                "Charging",
+                b"Charging",
                 qos=1,
                 retain=True,
             ),
             call(
                 "polestar2/root/health/0/daysToService",
-                "42",
+                b"42",
                 qos=1,
                 retain=True,
             ),
@@ -45,6 +51,208 @@ def test_publish_json_as_mqtt_flattens_nested_structures(monkeypatch):
     )
 
 
+def test_publish_json_as_mqtt_only_publishes_changed_leaves(monkeypatch):
+    fake_client = Mock()
+    monkeypatch.setattr(app, "client", fake_client)
+    monkeypatch.setattr(app, "topic_cache", TopicValueCache())
+
+    first = app.publish_json_as_mqtt(
+        "polestar2/root", {"battery": {"soc": 78, "timestamp": {"seconds": 1}}}
+    )
+    fake_client.publish.reset_mock()
+    second = app.publish_json_as_mqtt(
+        "polestar2/root", {"battery": {"soc": 78, "timestamp": {"seconds": 2}}}
+    )
+
+    assert (first, second) == (2, 1)
+    fake_client.publish.assert_called_once_with(
+        "polestar2/root/battery/timestamp/seconds", b"2", qos=1, retain=True
+    )
+
+
+def test_precompiled_topic_paths_match_the_published_telemetry_topics(monkeypatch):
+    monkeypatch.setattr(app, "client", Mock())
+    monkeypatch.setattr(app, "topic_cache", TopicValueCache())
+    monkeypatch.setattr(app, "topic_paths", TopicPathCache())
+    app.precompile_topic_paths("polestar2")
+    precompiled = len(app.topic_paths)
+    telemetry = {
+        "battery": [{"vin": "VIN1", "batteryChargeLevelPercentage": 80,
+                     "timestamp": {"seconds": 1, "nanos": 0}}],
+        "odometer": [{"vin": "VIN1", "odometerMeters": 5}],
+    }
+
+    assert app.publish_json_as_mqtt("polestar2/CarTelematicsV2", telemetry) == 6
+    assert len(app.topic_paths) == precompiled  # every topic was already memoized
+
+
+def test_publish_json_as_mqtt_times_the_flatten_stage(monkeypatch):
+    monkeypatch.setattr(app, "client", Mock())
+    monkeypatch.setattr(app, "topic_cache", TopicValueCache())
+    before = app.stage_duration.count(stage="flatten")
+
+    app.publish_json_as_mqtt("polestar2/root", {"battery": {"soc": 78}})
+
+    assert app.stage_duration.count(stage="flatten") == before + 1
+
+
+def test_publish_telemetry_data_skips_sections_without_newer_vehicle_timestamp(monkeypatch):
+    fake_client = Mock()
+    monkeypatch.setattr(app, "client", fake_client)
+    monkeypatch.setattr(app, "topic_cache", TopicValueCache())
+    monkeypatch.setattr(app, "OPENWB_PUBLISH", False)
+    monkeypatch.setattr(app.time, "time", lambda: 1100.0)
+    state = app.GatewayState(False, ["VIN1"])
+    published = []
+    real_publish = app.publish_json_as_mqtt
+
+    def recording_publish(topic, payload):
+        published.append(topic)
+        return real_publish(topic, payload)
+
+    monkeypatch.setattr(app, "publish_json_as_mqtt", recording_publish)
+
+    def telemetry(battery_seconds, odometer_seconds, soc):
+        return {
+            "battery": [{"soc": soc, "timestamp": {"seconds": battery_seconds, "nanos": 0}}],
+            "odometer": [{"odometerMeters": 5, "timestamp": {"seconds": odometer_seconds}}],
+        }
+
+    app.topic_cache.start_cycle()
+    app.publish_telemetry_data(state, "VIN1", telemetry(1000, 900, 80), "VIN1")
+    published.clear()
+    app.topic_cache.start_cycle()
+    app.publish_telemetry_data(state, "VIN1", telemetry(1000, 950, 81), "VIN1")
+
+    assert published == [
+        f"{app.MQTT_BASE_TOPIC}/CarTelematicsV2/odometer",
+        f"{app.MQTT_BASE_TOPIC}/derived",
+        f"{app.MQTT_BASE_TOPIC}/data_age",
+        f"{app.MQTT_BASE_TOPIC}/fetch_status",
+    ]
+    assert app.topic_cache.skipped_sections == 1
+    fake_client.publish.assert_any_call(
+        f"{app.MQTT_BASE_TOPIC}/data_age/odometer", b"150", qos=1, retain=True
+    )
+
+
+def test_parse_output_modes_supports_default_and_section_overrides():
+    modes = app.parse_output_modes("leaves", " battery=JSON, car=both ,")
+
+    assert modes == {"*": "leaves", "battery": "json", "car": "both"}
+
+    with pytest.raises(ValueError, match="invalid MQTT output mode"):
+        app.parse_output_modes("leaves", "battery=xml")
+
+
+def test_gateway_output_modes_add_json_documents_for_home_assistant_discovery(monkeypatch):
+    monkeypatch.setattr(app, "MQTT_OUTPUT_MODE", "leaves")
+    monkeypatch.setattr(app, "MQTT_OUTPUT_MODES", "battery=json")
+    monkeypatch.setattr(app, "HA_DISCOVERY", True)
+
+    assert app.gateway_output_modes() == {"*": "both", "battery": "json"}
+
+
+def test_publish_telemetry_data_announces_home_assistant_entities_once(monkeypatch):
+    fake_client = Mock()
+    monkeypatch.setattr(app, "client", fake_client)
+    monkeypatch.setattr(app, "topic_cache", TopicValueCache())
+    monkeypatch.setattr(app, "OPENWB_PUBLISH", False)
+    monkeypatch.setattr(app, "HA_DISCOVERY", True)
+    app.ha_discovery.reset()
+    state = app.GatewayState(False, ["VIN1"], {"*": "both"})
+    state.last_car_data["VIN1"] = {"vin": "VIN1", "modelName": "Polestar 2"}
+    telemetry = {"battery": [{"vin": "VIN1", "batteryChargeLevelPercentage": 80}]}
+
+    app.publish_telemetry_data(state, "VIN1", telemetry, None)
+    app.publish_telemetry_data(state, "VIN1", telemetry, None)
+    app.ha_discovery.reset()
+
+    config_topics = [
+        args[0] for args, _ in fake_client.publish.call_args_list
+        if args[0].startswith(f"{app.HA_DISCOVERY_PREFIX}/")
+    ]
+    soc_topic = (
+        f"{app.HA_DISCOVERY_PREFIX}/sensor/polestar_VIN1/battery_batteryChargeLevelPercentage/config"
+    )
+    assert config_topics.count(soc_topic) == 1
+    assert any("/polestar_VIN1/car_" in topic for topic in config_topics)
+
+
+def test_publish_section_json_mode_sends_one_compact_document(monkeypatch):
+    fake_client = Mock()
+    monkeypatch.setattr(app, "client", fake_client)
+    monkeypatch.setattr(app, "topic_cache", TopicValueCache())
+    modes = {"*": "leaves", "battery": "json"}
+    battery = [{"vin": "VIN1", "batteryChargeLevelPercentage": 80}]
+
+    first = app.publish_section(
+        modes, "battery", "polestar2/CarTelematicsV2/battery", "polestar2/json/battery", battery
+    )
+    second = app.publish_section(
+        modes, "battery", "polestar2/CarTelematicsV2/battery", "polestar2/json/battery", battery
+    )
+
+    assert (first, second) == (True, False)
+    fake_client.publish.assert_called_once_with(
+        "polestar2/json/battery",
+        b'{"vin":"VIN1","batteryChargeLevelPercentage":80}',
+        qos=1,
+        retain=True,
+    )
+
+
+def test_publish_section_both_mode_sends_leaves_and_document(monkeypatch):
+    fake_client = Mock()
+    monkeypatch.setattr(app, "client", fake_client)
+    monkeypatch.setattr(app, "topic_cache", TopicValueCache())
+
+    app.publish_section(
+        {"*": "both"}, "odometer", "p/CarTelematicsV2/odometer", "p/json/odometer",
+        {"odometerMeters": 5},
+    )
+
+    topics = [call.args[0] for call in fake_client.publish.call_args_list]
+    assert topics == ["p/CarTelematicsV2/odometer/odometerMeters", "p/json/odometer"]
+
+
+def test_publish_json_as_mqtt_applies_publish_policy(monkeypatch):
+    fake_client = Mock()
+    monkeypatch.setattr(app, "client", fake_client)
+    monkeypatch.setattr(app, "topic_cache", TopicValueCache())
+    monkeypatch.setattr(
+        app, "publish_policy", PublishPolicy("polestar2", [("root/fast/#", 0, False)])
+    )
+
+    app.publish_json_as_mqtt("polestar2/root", {"fast": {"soc": 80}, "slow": "x"})
+
+    fake_client.publish.assert_has_calls(
+        [
+            call("polestar2/root/fast/soc", b"80", qos=0, retain=False),
+            call("polestar2/root/slow", b"x", qos=1, retain=True),
+        ]
+    )
+
+
+def test_publishers_record_metrics(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(app, "client", Mock())
+    monkeypatch.setattr(app, "topic_cache", TopicValueCache())
+    monkeypatch.setattr(app, "stage_duration", registry.histogram("stage", "Stages."))
+    monkeypatch.setattr(app, "mqtt_messages", registry.counter("messages", "Messages."))
+    monkeypatch.setattr(app, "mqtt_bytes", registry.counter("bytes", "Bytes."))
+    monkeypatch.setattr(app, "mqtt_skipped", registry.counter("skipped", "Skipped."))
+
+    app.publish_json_as_mqtt("polestar2/root", {"soc": 80, "status": "Idle"})
+    app.publish_json_as_mqtt("polestar2/root", {"soc": 81, "status": "Idle"})
+
+    assert app.mqtt_messages.value() == 3
+    assert app.mqtt_bytes.value() == len(b"80") + len(b"Idle") + len(b"81")
+    assert app.mqtt_skipped.value() == 1
+    assert app.stage_duration.count(stage="flatten") == 2
+    assert app.stage_duration.count(stage="mqtt_publish") == 3
+
+
 def test_publish_soc_to_openwb_uses_configured_topic(monkeypatch):
     fake_client = Mock()
     monkeypatch.setattr(app, "client_openwb", fake_client, raising=False)
@@ -55,6 +263,27 @@ def test_publish_soc_to_openwb_uses_configured_topic(monkeypatch):
     fake_client.publish.assert_called_once_with("openWB/set/lp/1/%Soc", 64, qos=1, retain=True)
 
 
+def test_publish_soc_to_openwb_accepts_per_vin_list(monkeypatch):
+    fake_client = Mock()
+    monkeypatch.setattr(app, "client_openwb", fake_client, raising=False)
+    monkeypatch.setattr(app, "OPENWB_TOPIC", "openWB/set/lp/1/%Soc", raising=False)
+
+    app.publish_soc_to_openwb([{"vin": "VIN1", "batteryChargeLevelPercentage": 55}])
+
+    fake_client.publish.assert_called_once_with("openWB/set/lp/1/%Soc", 55, qos=1, retain=True)
+
+
+def test_publish_soc_to_openwb_skips_battery_data_without_soc(monkeypatch):
+    fake_client = Mock()
+    monkeypatch.setattr(app, "client_openwb", fake_client, raising=False)
+    monkeypatch.setattr(app, "OPENWB_TOPIC", "openWB/set/lp/1/%Soc", raising=False)
+
+    # TELEMATICS_FIELDS="battery.chargingStatusV2" leaves out the SoC
+    app.publish_soc_to_openwb([{"vin": "VIN1", "chargingStatusV2": "CHARGING_STATUS_IDLE"}])
+
+    fake_client.publish.assert_not_called()
+
+
 def test_shutdown_clients_disconnects_main_client(monkeypatch):
     fake_client = Mock()
     monkeypatch.setattr(app, "client", fake_client)
@@ -0,0 +1,153 @@
+import logging
+
+import pytest
+
+from flatten import query_field_paths
+from graphql_queries import CAR_TELEMATICS_V2_QUERY, GET_CONSUMER_CARS_V2_QUERY
+from graphql_schema import GraphQLSchema
+from query_builder import QueryBuilder, parse_field_list, read_query_constants
+
+SCHEMA = GraphQLSchema.parse("""
+type Query {
+  getConsumerCarsV2(locale: String): [VehicleInformation!]!
+}
+type VehicleInformation {
+  vin: String!
+  modelYear: String!
+  software: VehicleSoftware
+}
+type VehicleSoftware {
+  version: String
+}
+""")
+
+#####################################
+# tests for field lists and query rendering
+
+
+def test_parse_field_list_splits_dotted_paths():
+    assert parse_field_list(" battery, odometer.odometerMeters ,") == [
+        ("battery",),
+        ("odometer", "odometerMeters"),
+    ]
+    assert parse_field_list("") == []
+
+
+def test_default_selection_renders_all_template_fields():
+    builder = QueryBuilder(CAR_TELEMATICS_V2_QUERY)
+    payload = builder.payload({"vins": ["VIN1"]})
+
+    assert builder.root_field == "carTelematicsV2"
+    assert payload["operationName"] == "CarTelematicsV2"
+    assert payload["variables"] == {"vins": ["VIN1"]}
+    assert payload["query"].startswith(
+        "query CarTelematicsV2($vins: [String!]!) {\n    carTelematicsV2(vins: $vins) {\n"
+    )
+    assert QueryBuilder(payload["query"]).paths == builder.paths
+    assert builder.paths == query_field_paths(CAR_TELEMATICS_V2_QUERY)
+
+
+def test_field_list_selects_sections_and_adds_required_fields():
+    builder = QueryBuilder(
+        CAR_TELEMATICS_V2_QUERY,
+        "odometer.odometerMeters, battery.timestamp",
+        required=[("*", "vin")],
+    )
+
+    assert builder.paths == [
+        ("odometer", "vin"),
+        ("odometer", "odometerMeters"),
+        ("battery", "vin"),
+        ("battery", "timestamp", "seconds"),
+        ("battery", "timestamp", "nanos"),
+    ]
+    assert "health" not in builder.query()
+
+#####################################
+# tests for validation and dropped fields
+
+
+def test_validate_drops_invalid_selections_and_keeps_fields_unknown_to_the_schema():
+    builder = QueryBuilder(
+        GET_CONSUMER_CARS_V2_QUERY, "vin,modelName,software,modelYear.length", SCHEMA
+    )
+
+    problems = builder.validate()
+
+    assert problems[("modelName",)] == "not in the GraphQL schema"
+    assert builder.paths == [("vin",), ("modelName",)]
+    assert set(builder.dropped) == {("software",), ("modelYear", "length")}
+    assert builder.validate() is problems  # validated once
+
+
+def test_known_schema_gaps_are_logged_at_debug_only(caplog):
+    caplog.set_level(logging.DEBUG, logger="polestar2mqtt")
+    builder = QueryBuilder(
+        GET_CONSUMER_CARS_V2_QUERY, "vin,modelName,edition", SCHEMA, known_gaps=[("modelName",)]
+    )
+
+    builder.validate()
+
+    levels = {
+        record.getMessage().rsplit(": ", 1)[-1]: record.levelname
+        for record in caplog.records if "requested anyway" in record.getMessage()
+    }
+    assert levels == {"modelName": "DEBUG", "edition": "WARNING"}
+
+
+def test_validate_skips_root_fields_unknown_to_the_schema():
+    builder = QueryBuilder(CAR_TELEMATICS_V2_QUERY, "", SCHEMA)
+
+    assert builder.validate() == {}
+    assert builder.paths == query_field_paths(CAR_TELEMATICS_V2_QUERY)
+
+
+def test_drop_rejected_removes_fields_named_by_the_server():
+    builder = QueryBuilder(CAR_TELEMATICS_V2_QUERY, "battery,odometer")
+    query = builder.query()
+
+    dropped = builder.drop_rejected(
+        'carTelematicsV2: HTTP 400: Cannot query field "chargingStatusV2" on type "Battery".'
+    )
+
+    assert dropped == [("battery", "chargingStatusV2")]
+    assert builder.query() != query and "chargingStatusV2" not in builder.query()
+    assert builder.drop_rejected("carTelematicsV2: HTTP 500") == []
+
+
+def test_drop_rejected_never_drops_the_last_field():
+    builder = QueryBuilder(GET_CONSUMER_CARS_V2_QUERY, "vin", SCHEMA)
+
+    assert builder.drop_rejected('Cannot query field "vin" on type "VehicleInformation"') == []
+    assert builder.paths == [("vin",)]
+
+#####################################
+# tests for query overrides
+
+
+def test_read_query_constants_does_not_execute_the_file(tmp_path):
+    override = tmp_path / "graphql_queries.py"
+    override.write_text(
+        'raise SystemExit("executed")\n'
+        'CAR_TELEMATICS_V2_QUERY = """\n'
+        "query CarTelematicsV2($vins: [String!]!) { carTelematicsV2(vins: $vins) {"
+        " odometer { vin odometerMeters } } }\n"
+        '""".strip()\n'
+        'NAME = "plain"\n'
+        "COUNT = 3\n",
+        encoding="utf-8",
+    )
+
+    constants = read_query_constants(override)
+
+    assert set(constants) == {"CAR_TELEMATICS_V2_QUERY", "NAME"}
+    assert constants["CAR_TELEMATICS_V2_QUERY"].startswith("query CarTelematicsV2")
+    assert QueryBuilder(constants["CAR_TELEMATICS_V2_QUERY"]).paths == [
+        ("odometer", "vin"),
+        ("odometer", "odometerMeters"),
+    ]
+
+
+def test_template_without_selection_set_is_rejected():
+    with pytest.raises(ValueError, match="without selection set"):
+        QueryBuilder("query Broken")
@@ -0,0 +1,61 @@
+import threading
+
+from rate_limiter import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+#####################################
+# tests for the token bucket
+
+
+def test_disabled_limiter_never_waits():
+    sleeps = []
+    limiter = RateLimiter(0, sleep=sleeps.append)
+
+    assert limiter.enabled is False
+    assert [limiter.acquire() for _ in range(100)] == [0] * 100
+    assert sleeps == []
+
+
+def test_burst_is_free_then_requests_are_spaced():
+    clock = FakeClock()
+    limiter = RateLimiter(60, burst=3, clock=clock, sleep=clock.sleep)
+
+    assert [limiter.acquire() for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire() == 1.0
+    assert limiter.acquire() == 1.0
+    assert limiter.waited == 2.0
+
+
+def test_budget_refills_while_idle_up_to_burst():
+    clock = FakeClock()
+    limiter = RateLimiter(30, burst=2, clock=clock, sleep=clock.sleep)
+    limiter.acquire()
+    limiter.acquire()
+
+    clock.now += 600  # long idle period: only burst requests are free again
+    assert [limiter.acquire() for _ in range(3)] == [0, 0, 2.0]
+
+
+def test_concurrent_callers_reserve_consecutive_slots():
+    clock = FakeClock()
+    waits = []
+    limiter = RateLimiter(120, burst=1, clock=clock, sleep=lambda seconds: None)
+
+    threads = [threading.Thread(target=lambda: waits.append(limiter.acquire())) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # clock does not advance: every caller gets the next half-second slot
+    assert sorted(waits) == [0, 0.5, 1.0, 1.5, 2.0]
@@ -0,0 +1,86 @@
+import threading
+import time
+
+from refresh_command import ALL_TARGETS, RefreshTrigger, parse_refresh_target
+
+VIN = "LPSVSEDEEML000001"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+#####################################
+# tests for the command topics
+
+
+def test_parse_refresh_target_distinguishes_vins_and_sections():
+    assert parse_refresh_target("") == ALL_TARGETS
+    assert parse_refresh_target("/") == ALL_TARGETS
+    assert parse_refresh_target(f"/{VIN}") == (VIN, None)
+    assert parse_refresh_target("/battery") == (None, "battery")
+    assert parse_refresh_target(f"/{VIN}/battery") == (VIN, "battery")
+
+#####################################
+# tests for debounce and rate limit
+
+
+def test_requests_are_debounced_into_one_cycle():
+    clock = FakeClock()
+    trigger = RefreshTrigger(debounce=2, min_interval=0, clock=clock)
+
+    assert trigger.poll() is False
+    trigger.request((None, "battery"))
+    clock.now += 1
+    trigger.request((VIN, None))
+    assert trigger.poll() is False
+
+    clock.now += 1
+    assert trigger.poll() is True
+    assert trigger.start_cycle() == {(None, "battery"), (VIN, None)}
+    assert trigger.poll() is False
+    assert (trigger.requested, trigger.triggered) == (2, 1)
+
+
+def test_requests_wait_for_the_minimum_interval_since_the_last_cycle():
+    clock = FakeClock()
+    trigger = RefreshTrigger(debounce=0, min_interval=60, clock=clock)
+    trigger.start_cycle()  # regular cycle
+
+    clock.now += 10
+    trigger.request()
+    assert trigger.poll() is False
+
+    clock.now += 50
+    assert trigger.poll() is True
+
+
+def test_regular_cycle_serves_pending_requests():
+    clock = FakeClock()
+    trigger = RefreshTrigger(debounce=5, min_interval=0, clock=clock)
+    trigger.request()
+
+    assert trigger.start_cycle() == {ALL_TARGETS}
+    clock.now += 10
+    assert trigger.poll() is False
+
+#####################################
+# tests for the blocking wait
+
+
+def test_wait_times_out_without_request():
+    trigger = RefreshTrigger(debounce=0, min_interval=0)
+
+    assert trigger.wait(0.01) is False
+
+
+def test_wait_returns_early_on_request_from_other_thread():
+    trigger = RefreshTrigger(debounce=0.05, min_interval=0)
+    threading.Timer(0.05, trigger.request).start()
+
+    started = time.monotonic()
+    assert trigger.wait(10) is True
+    assert time.monotonic() - started < 5
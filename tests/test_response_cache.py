@@ -0,0 +1,103 @@
+import threading
+
+from response_cache import ResponseCache
+
+CARS = {"VIN1": {"vin": "VIN1", "modelName": "Polestar 2"}}
+TELEMETRY = {"VIN1": {"battery": {"batteryChargeLevelPercentage": 80}}}
+
+#####################################
+# tests for max age and key
+
+
+def test_get_serves_response_until_max_age(tmp_path):
+    now = [1000.0]
+    cache = ResponseCache(tmp_path / "responses.json", 60, clock=lambda: now[0])
+
+    assert cache.get() is None
+    cache.put(CARS, TELEMETRY)
+    now[0] += 59
+    assert cache.get() == (CARS, TELEMETRY)
+
+    now[0] += 1
+    assert cache.get() is None
+
+
+def test_max_age_zero_or_empty_path_disables_cache(tmp_path):
+    for cache in (ResponseCache(tmp_path / "responses.json", 0), ResponseCache("", 60)):
+        cache.put(CARS, TELEMETRY)
+
+        assert cache.enabled is False
+        assert cache.get() is None
+    assert not (tmp_path / "responses.json").exists()
+
+
+def test_response_of_other_account_or_vins_is_ignored(tmp_path):
+    path = tmp_path / "responses.json"
+    ResponseCache(path, 60, key="a@example.com|all").put(CARS, TELEMETRY)
+
+    assert ResponseCache(path, 60, key="a@example.com|all").get() == (CARS, TELEMETRY)
+    assert ResponseCache(path, 60, key="a@example.com|VIN2").get() is None
+
+
+def test_broken_file_is_a_miss(tmp_path):
+    path = tmp_path / "responses.json"
+    path.write_text("{not json", encoding="utf-8")
+
+    assert ResponseCache(path, 60).get() is None
+
+#####################################
+# tests for fetch and coalescing
+
+
+def test_fetch_uses_fresh_response_and_stores_new_results(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.json", 60)
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return CARS, TELEMETRY
+
+    assert cache.fetch(fetch) == (CARS, TELEMETRY)
+    assert cache.fetch(fetch) == (CARS, TELEMETRY)
+    assert len(fetches) == 1
+    assert (cache.fetches, cache.hits) == (1, 1)
+
+
+def test_incomplete_results_are_not_stored(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.json", 60)
+
+    cache.fetch(lambda: (CARS, {"VIN1": {}}), cacheable=lambda result: False)
+
+    assert cache.get() is None
+
+
+def test_concurrent_callers_share_one_fetch(tmp_path):
+    path = tmp_path / "responses.json"
+    started = threading.Event()
+    release = threading.Event()
+    fetches = []
+    results = []
+
+    def slow_fetch():
+        fetches.append(1)
+        started.set()
+        release.wait(5)
+        return CARS, TELEMETRY
+
+    # one cache object per caller, like separate runonce processes
+    callers = [ResponseCache(path, 60) for _ in range(4)]
+    threads = [
+        threading.Thread(target=lambda cache=cache: results.append(cache.fetch(slow_fetch)))
+        for cache in callers
+    ]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(fetches) == 1
+    assert results == [(CARS, TELEMETRY)] * 4
+    assert sum(cache.coalesced + cache.hits for cache in callers) == 3
@@ -0,0 +1,65 @@
+from scheduler import AdaptivePollScheduler, is_charging
+from telemetry import section_timestamps
+
+
+def battery(status=None, minutes=0, seconds=1000):
+    return {
+        "battery": [
+            {
+                "vin": "VIN1",
+                "chargingStatusV2": status,
+                "estimatedChargingTimeToFullMinutes": minutes,
+                "timestamp": {"seconds": seconds, "nanos": 0},
+            }
+        ]
+    }
+
+#####################################
+# tests for telemetry helpers
+
+
+def test_section_timestamps_returns_newest_timestamp_per_section():
+    telemetry = {
+        "battery": [{"timestamp": {"seconds": 10, "nanos": 500000000}}],
+        "odometer": {"timestamp": {"seconds": 20, "nanos": 0}},
+        "health": [{"timestamp": None}],
+    }
+
+    assert section_timestamps(telemetry) == {"battery": 10.5, "odometer": 20.0}
+
+
+def test_is_charging_uses_status_and_time_to_full():
+    assert is_charging(battery("CHARGING_STATUS_CHARGING")) is True
+    assert is_charging(battery("CHARGING_STATUS_IDLE", minutes=30)) is False
+    assert is_charging(battery(None, minutes=30)) is True
+    assert is_charging({}) is False
+
+#####################################
+# tests for the interval calculation
+
+
+def test_fixed_cycle_when_min_and_max_are_unset():
+    scheduler = AdaptivePollScheduler(270)
+
+    assert scheduler.adaptive is False
+    assert scheduler.next_interval({"VIN1": battery()}) == 270
+    assert scheduler.next_interval({"VIN1": battery()}) == 270
+
+
+def test_polls_fast_while_charging():
+    scheduler = AdaptivePollScheduler(270, min_interval=60, max_interval=3600)
+
+    assert scheduler.next_interval({"VIN1": battery("CHARGING_STATUS_CHARGING")}) == 60
+    assert scheduler.reason == "charging"
+
+
+def test_backs_off_exponentially_while_timestamps_are_stale():
+    scheduler = AdaptivePollScheduler(270, min_interval=60, max_interval=1000)
+
+    assert scheduler.next_interval({"VIN1": battery(seconds=1000)}) == 270
+    assert scheduler.next_interval({"VIN1": battery(seconds=1000)}) == 540
+    assert scheduler.next_interval({"VIN1": battery(seconds=1000)}) == 1000
+    assert scheduler.reason == "idle"
+
+    assert scheduler.next_interval({"VIN1": battery(seconds=2000)}) == 270
+    assert scheduler.reason == "data changed"
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+from token_store import TokenStore
+
+EXPIRY = datetime(2026, 10, 18, 12, 30, 0)
+
+#####################################
+# tests for round trip and encryption
+
+
+def test_save_and_load_round_trip(tmp_path):
+    store = TokenStore(tmp_path / "tokens.json", "passphrase", account="user@example.com")
+
+    store.save("access-token", EXPIRY, "refresh-token")
+
+    assert store.load() == ("access-token", EXPIRY, "refresh-token")
+
+
+def test_file_is_encrypted_and_private(tmp_path):
+    path = tmp_path / "tokens.json"
+    TokenStore(path, "passphrase").save("access-token", EXPIRY, "refresh-token")
+
+    content = path.read_text(encoding="utf-8")
+
+    assert "access-token" not in content
+    assert "refresh-token" not in content
+    assert path.stat().st_mode & 0o777 == 0o600
+    assert not (tmp_path / "tokens.json.tmp").exists()
+
+
+def test_wrong_passphrase_or_account_is_ignored(tmp_path):
+    path = tmp_path / "tokens.json"
+    TokenStore(path, "passphrase", account="user@example.com").save("a", EXPIRY, "r")
+
+    assert TokenStore(path, "other-passphrase", account="user@example.com").load() is None
+    assert TokenStore(path, "passphrase", account="other@example.com").load() is None
+
+#####################################
+# tests for disabled and broken stores
+
+
+def test_store_is_disabled_without_secret(tmp_path):
+    store = TokenStore(tmp_path / "tokens.json", "")
+
+    store.save("access-token", EXPIRY, "refresh-token")
+
+    assert store.enabled is False
+    assert store.load() is None
+    assert not (tmp_path / "tokens.json").exists()
+
+
+def test_corrupt_file_is_ignored_and_clear_removes_it(tmp_path):
+    path = tmp_path / "tokens.json"
+    path.write_text("not json", encoding="utf-8")
+    store = TokenStore(path, "passphrase")
+
+    assert store.load() is None
+
+    store.clear()
+    store.clear()
+
+    assert not path.exists()
+
+
+def test_expiry_time_survives_with_timedelta_precision(tmp_path):
+    store = TokenStore(tmp_path / "tokens.json", "passphrase")
+    expiry = datetime.now() + timedelta(seconds=299, microseconds=123)
+
+    store.save("access-token", expiry, "refresh-token")
+
+    assert store.load()[1] == expiry
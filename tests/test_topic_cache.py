@@ -0,0 +1,112 @@
+from topic_cache import TopicValueCache
+
+#####################################
+# tests for delta detection
+
+
+def test_changed_skips_unchanged_payloads():
+    cache = TopicValueCache()
+    cache.start_cycle()
+
+    assert cache.changed("polestar2/battery/soc", "80") is True
+    assert cache.changed("polestar2/battery/soc", "80") is False
+    assert cache.changed("polestar2/battery/soc", "81") is True
+    assert (cache.published, cache.skipped) == (2, 1)
+
+
+def test_start_cycle_resets_counters():
+    cache = TopicValueCache()
+    cache.start_cycle()
+    cache.changed("polestar2/battery/soc", "80")
+
+    cache.start_cycle()
+
+    assert (cache.published, cache.skipped) == (0, 0)
+    assert len(cache) == 1
+
+
+def test_clear_forces_republish():
+    cache = TopicValueCache()
+    cache.start_cycle()
+    cache.changed("polestar2/battery/soc", "80")
+
+    cache.clear()
+
+    assert cache.changed("polestar2/battery/soc", "80") is True
+
+def test_source_advanced_skips_subtrees_with_old_vehicle_timestamp():
+    cache = TopicValueCache()
+    cache.start_cycle()
+
+    assert cache.source_advanced("polestar2/CarTelematicsV2/battery", 100.0) is True
+    assert cache.source_advanced("polestar2/CarTelematicsV2/battery", 100.0) is False
+    assert cache.source_advanced("polestar2/CarTelematicsV2/battery", 101.0) is True
+    assert cache.skipped_sections == 1
+
+    cache.clear()
+
+    assert cache.source_advanced("polestar2/CarTelematicsV2/battery", 101.0) is True
+
+#####################################
+# tests for periodic full refresh
+
+
+def test_full_refresh_republishes_after_interval():
+    now = [1000.0]
+    cache = TopicValueCache(full_refresh_interval=60, clock=lambda: now[0])
+
+    assert cache.start_cycle() is False
+    cache.changed("polestar2/battery/soc", "80")
+
+    now[0] += 30
+    assert cache.start_cycle() is False
+    assert cache.changed("polestar2/battery/soc", "80") is False
+
+    now[0] += 30
+    assert cache.start_cycle() is True
+    assert cache.changed("polestar2/battery/soc", "80") is True
+
+    now[0] += 1
+    assert cache.start_cycle() is False
+
+
+def test_full_refresh_interval_is_kept_per_account():
+    now = [1000.0]
+    cache = TopicValueCache(full_refresh_interval=60, clock=lambda: now[0])
+    assert cache.start_cycle("a") is False
+    now[0] += 10
+    assert cache.start_cycle("b") is False
+
+    now[0] += 50
+    assert cache.start_cycle("a") is True
+    assert cache.start_cycle("b") is False  # 50 seconds since b's last full refresh
+    now[0] += 10
+    assert cache.start_cycle("b") is True
+    assert cache.start_cycle("a") is False
+
+
+def test_full_refresh_disabled_by_default():
+    now = [0.0]
+    cache = TopicValueCache(clock=lambda: now[0])
+    cache.start_cycle()
+    cache.changed("polestar2/battery/soc", "80")
+
+    now[0] += 86400
+
+    assert cache.start_cycle() is False
+    assert cache.changed("polestar2/battery/soc", "80") is False
+
+
+def test_forget_republishes_only_the_given_subtree():
+    cache = TopicValueCache()
+    cache.start_cycle()
+    for topic in ("polestar2/VIN1/battery/soc", "polestar2/VIN10/battery/soc", "polestar2/VIN1"):
+        cache.changed(topic, "80")
+    cache.source_advanced("polestar2/VIN1/CarTelematicsV2/battery", 100)
+
+    cache.forget("polestar2/VIN1")
+
+    assert cache.changed("polestar2/VIN1/battery/soc", "80") is True
+    assert cache.changed("polestar2/VIN1", "80") is True
+    assert cache.changed("polestar2/VIN10/battery/soc", "80") is False
+    assert cache.source_advanced("polestar2/VIN1/CarTelematicsV2/battery", 100) is True